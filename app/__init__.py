@@ -13,13 +13,14 @@ from flask import Flask, current_app, jsonify
 from flask_apscheduler import APScheduler
 from sqlalchemy.orm import scoped_session
 
+from app.utils.capture_plan import replan_templates
 from app.utils.retention_policy import retention_cleanup
 from app.utils.scheduling import schedule_crawlers, schedule_summarization, scheduler, start_log_caching
 from app.utils.video_archiver import archive_screenshots, compile_to_teaser
 from app.utils.video_compressor import compress_and_cleanup
 from app.config import backup_config, restore_config
 from app.utils.email_alerts import email_alert
-from app.utils.db import SessionLocal
+from app.utils.db import SessionLocal, init_db
 #from app.models.log import Log
 
 # needed for the llava compare
@@ -81,14 +82,18 @@ def create_app(watchdog=True, schedule=True):
     os.makedirs(VIDEO_DIRECTORY, exist_ok=True)
     os.makedirs(SUMMARIES_DIRECTORY, exist_ok=True)
 
+    # create and migrate the tables once, before anything reads them
+    init_db()
+
     from app.routes import init_routes
 
     init_routes(app)
 
-    # Configure the scheduler executor
+    # Configure the scheduler executor: captures have their own worker processes
+    # (see capture_scheduler), so archiving, retention and summaries run on threads
     if schedule is True:
         app.config["SCHEDULER_EXECUTORS"] = {
-            "default": {"type": "processpool", "max_workers": MAX_WORKERS}
+            "default": {"type": "threadpool", "max_workers": MAX_WORKERS},
         }
         logging.info("Starting with %s workers" % str(MAX_WORKERS))
         scheduler.init_app(app)
@@ -120,6 +125,9 @@ def create_app(watchdog=True, schedule=True):
             scheduler.add_job(
                 id="retention_cleanup", func=retention_cleanup, trigger="cron", day="*"
             )
+            scheduler.add_job(
+                id="replan_templates", func=replan_templates, trigger="cron", hour=4
+            )
             schedule_summarization()
 
         # Perform initial cleanup
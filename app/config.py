@@ -2,39 +2,162 @@
 
 import os
 import json
+import sys
+import threading
 
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
+
+# settings live in the same database as the templates, through the same engine
+from app.utils.db import DATABASE_PATH, SessionLocal, engine  # noqa: F401
 
 # TODO: also consider argparse...
-DATABASE_PATH = os.getenv("GLIMPSER_DATABASE_PATH", "data/glimpser.db")
 LOGGING_PATH = os.getenv("GLIMPSER_LOGGING_PATH", "logs/glimpser.log")
 BACKUP_PATH = os.getenv("GLIMPSER_BACKUP_PATH", "data/config_backup.json")
 
-# todo.. make sure this is not duplicate loading...
-engine = create_engine(f"sqlite:///{DATABASE_PATH}")
-SessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=engine
-)  # settings only thread
+# Every stored setting, read with one query the first time one is asked for.
+# reload_settings() re-reads it and applies what changed without a restart.
+settings = {}
+settings_loaded = False
+setting_defaults = {}  # the default each setting below was read with
+settings_lock = threading.RLock()
+subscribers = []
 
-def get_setting(name, default=None):
+# appended to whenever a process changes settings, so the others (capture workers) reload too
+SETTINGS_VERSION_PATH = f"{DATABASE_PATH}.settings"
+settings_seen = None
+
+# settings only read once at startup (Flask, the executors, the CLIP model); changing one still restarts
+RESTART_SETTINGS = {
+    "HOST", "PORT", "DEBUG", "NAME", "SECRET_KEY", "LOG_LEVEL", "MAX_WORKERS",
+    "CLIP_MODEL", "CLIP_QUANTIZE", "CLIP_IMAGE_SIZE", "CLIP_BATCH_SIZE", "CLIP_BATCH_WAIT",
+    "CLIP_TEXT_CACHE_SIZE",
+}
+
+
+def load_settings():
+    """All stored settings as {name: value}, or None if they could not be read."""
     session = SessionLocal()
     try:
-        result = session.execute(
-            text("SELECT value FROM settings WHERE name = '%s'" % name)
-        ).fetchone()
-        return result[0] if result else default
+        return dict(session.execute(text("SELECT name, value FROM settings")).fetchall())
     except Exception as e:
         if 'no such table' in str(e):
             # this is ok if its the first time only... 
             print("warning! table does not exist")
-            pass
         else:
             print("warning! initialization error", e)
+        return None
     finally:
         session.close()
 
-    return default
+
+def get_setting(name, default=None):
+    global settings_loaded, settings_seen
+    if not settings_loaded:
+        with settings_lock:
+            if not settings_loaded:
+                settings_seen = settings_version()
+                settings.update(load_settings() or {})
+                settings_loaded = True
+    setting_defaults.setdefault(name, default)
+    return settings.get(name, default)
+
+
+def settings_version():
+    try:
+        stat = os.stat(SETTINGS_VERSION_PATH)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def setting_value(raw, current):
+    """raw (as stored) converted the way the setting was read above, judged by its current value."""
+    if isinstance(current, bool):
+        return str(raw) == "True"
+    if isinstance(current, int):
+        return int(raw)
+    if isinstance(current, float):
+        return float(raw)
+    return raw
+
+
+def subscribe(callback):
+    """Call callback({name: new value}) after each reload that changed settings."""
+    subscribers.append(callback)
+    return callback
+
+
+def reload_settings():
+    """
+    Re-read the settings table and apply the changes in this process.
+
+    The constants below are rebound and the subscribers are told.  Code that
+    should follow a setting reads it as config.NAME when it is used; a copy
+    taken with "from app.config import NAME" keeps its startup value, which is
+    only right for RESTART_SETTINGS and the like.  Returns {name: new value} of
+    the settings that changed.
+    """
+    global settings_loaded, settings_seen
+    with settings_lock:
+        seen = settings_version()
+        stored = load_settings()
+        if stored is None:
+            return {}
+        previous = dict(settings)
+        settings.clear()
+        settings.update(stored)
+        settings_loaded = True
+        settings_seen = seen
+
+        changes = {}
+        module = sys.modules[__name__]
+        for name, default in setting_defaults.items():
+            raw = stored.get(name, default)
+            if raw == previous.get(name, default) or not hasattr(module, name):
+                continue
+            old = getattr(module, name)
+            try:
+                value = setting_value(raw, old)
+            except (TypeError, ValueError):
+                print(f"warning! ignoring invalid value for {name}: {raw!r}")
+                continue
+            if value == old:
+                continue
+            setattr(module, name, value)
+            changes[name] = value
+        if not changes:
+            return changes
+
+    for callback in list(subscribers):
+        try:
+            callback(dict(changes))
+        except Exception as e:
+            print(f"warning! settings subscriber {callback} failed: {e}")
+    return changes
+
+
+def refresh_settings():
+    """reload_settings() if another process changed them since; a stat() otherwise."""
+    if settings_version() != settings_seen:
+        return reload_settings()
+    return {}
+
+
+def settings_changed():
+    """After writing to the settings table: apply the change here and have other processes pick it up."""
+    try:
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        fd = os.open(SETTINGS_VERSION_PATH, flags, 0o644)
+        try:
+            if os.fstat(fd).st_size > 1024 * 1024:
+                os.ftruncate(fd, 0)
+            os.write(fd, b".")
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print("warning! could not signal the settings change", e)
+    return reload_settings()
+
 
 def backup_config() -> bool:
     session = SessionLocal()
@@ -65,6 +188,7 @@ def restore_config():
             session.commit()
         finally:
             session.close()
+        settings_changed()
 
 SCHEDULER_API_ENABLED = True
 
@@ -105,6 +229,7 @@ API_KEY = get_setting("API_KEY", "")
 CHATGPT_KEY = get_setting("CHATGPT_KEY", "")  # maybe generalize as LLM_KEY ?
 
 LLM_MODEL_VERSION = get_setting("LLM_MODEL_VERSION", "gpt-4o-mini") # todo setup allowed models
+LLM_COMPARE_CAPTION_FRAME = get_setting("LLM_COMPARE_CAPTION_FRAME", "False") == "True"  # also send the last captioned frame, one more image per call
 
 # note that $datetime is a special keyword that will be replaced with the datetime in iso Z format
 LLM_SUMMARY_PROMPT = get_setting(
@@ -128,6 +253,60 @@ PROBE_SIZE_DEFAULT = get_setting("PROBE_SIZE_DEFAULT", "5M")
 PROBE_SIZE_RTSP = get_setting("PROBE_SIZE_RTSP", "10M")
 PROBE_SIZE_OTHER = get_setting("PROBE_SIZE_OTHER", "20M")
 
+# How often a template downgraded to a cheaper capture method is checked against the original
+CAPTURE_PLAN_MAX_AGE = int(get_setting("CAPTURE_PLAN_MAX_AGE", 24 * 60 * 60))  # seconds
+# Largest SSIM dissimilarity at which a cheaper capture method counts as equivalent
+CAPTURE_PLAN_MAX_DIFFERENCE = float(get_setting("CAPTURE_PLAN_MAX_DIFFERENCE", 0.1))
+
+# How long a media url resolved by yt-dlp is reused, unless the url itself expires sooner
+YTDLP_URL_TTL = int(get_setting("YTDLP_URL_TTL", 60 * 60))  # seconds
+
+# Persistent stream readers (templates with persistent_stream enabled)
+STREAM_READER_FPS = float(get_setting("STREAM_READER_FPS", 1))  # max decoded frames per second
+STREAM_READER_IDLE_TIMEOUT = int(get_setting("STREAM_READER_IDLE_TIMEOUT", 10 * 60))  # seconds
+STREAM_READER_MAX_BACKOFF = int(get_setting("STREAM_READER_MAX_BACKOFF", 5 * 60))  # seconds
+STREAM_READER_MAX_FRAME_AGE = int(get_setting("STREAM_READER_MAX_FRAME_AGE", 30))  # seconds
+
+# Concurrent captures per capture method; MAX_WORKERS caps the total
+CAPTURE_SLOTS_BROWSER = int(get_setting("CAPTURE_SLOTS_BROWSER", 2))  # chrome and wkhtmltoimage
+CAPTURE_SLOTS_STREAM = int(get_setting("CAPTURE_SLOTS_STREAM", 4))  # ffmpeg and yt-dlp
+CAPTURE_SLOTS_IMAGE = int(get_setting("CAPTURE_SLOTS_IMAGE", 8))  # direct image downloads
+CAPTURE_SLOTS_PDF = int(get_setting("CAPTURE_SLOTS_PDF", 2))
+
+# Adaptive templates: each capture without motion stretches the interval by this factor
+ADAPTIVE_STRETCH = float(get_setting("ADAPTIVE_STRETCH", 1.5))
+
+# Block-grid motion detector (templates with motion_detector "grid")
+MOTION_GRID = int(get_setting("MOTION_GRID", 10))  # tiles per side of the 100x100 motion thumbnail
+MOTION_TILE_THRESHOLD = float(get_setting("MOTION_TILE_THRESHOLD", 12))  # mean grey-level change that marks a tile as moving
+
+# How captured frames are stored: png, webp (lossless) or jpg; templates can override the format
+FRAME_FORMAT = get_setting("FRAME_FORMAT", "png")
+FRAME_QUALITY = int(get_setting("FRAME_QUALITY", 90))  # jpg quality, 1-95
+PNG_COMPRESS_LEVEL = int(get_setting("PNG_COMPRESS_LEVEL", 6))  # 0 (fastest) - 9 (smallest)
+FRAME_INDEX_MAX_AGE = int(get_setting("FRAME_INDEX_MAX_AGE", 10 * 60))  # seconds between full rescans
+SKIP_UNCHANGED_FRAMES = get_setting("SKIP_UNCHANGED_FRAMES", "True") == "True"  # hard link repeats of the previous source image instead of encoding them
+FRAME_HASH_DISTANCE = int(get_setting("FRAME_HASH_DISTANCE", 6))  # differing dHash bits (of 64) for frames to count as near-duplicates
+
+# Shared CLIP service for object_filter (one model per host, see utils/clip_service.py)
+CLIP_MODEL = get_setting("CLIP_MODEL", "openai/clip-vit-base-patch32")
+CLIP_BATCH_SIZE = int(get_setting("CLIP_BATCH_SIZE", 16))  # frames scored per forward pass
+CLIP_BATCH_WAIT = float(get_setting("CLIP_BATCH_WAIT", 0.05))  # seconds to wait for a batch to fill
+CLIP_TIMEOUT = float(get_setting("CLIP_TIMEOUT", 10))  # seconds before a frame skips the filter
+CLIP_TEXT_CACHE_SIZE = int(get_setting("CLIP_TEXT_CACHE_SIZE", 256))  # cached filter embeddings
+CLIP_QUANTIZE = get_setting("CLIP_QUANTIZE", "False") == "True"  # dynamic int8 on CPU
+CLIP_IMAGE_SIZE = int(get_setting("CLIP_IMAGE_SIZE", 0))  # input resolution; 0 keeps the model's own (224); needs transformers 4.45+
+OBJECT_FILTER_BACKGROUND = get_setting("OBJECT_FILTER_BACKGROUND", "an empty scene with nothing in it")  # prompt the filter objects compete with
+
+# Template status fields (last caption/motion times) are queued and written in one transaction this often
+STATUS_FLUSH_INTERVAL = int(get_setting("STATUS_FLUSH_INTERVAL", 250))  # milliseconds
+
+# Warm browser pool for capture_screenshot_and_har (per worker process)
+BROWSER_POOL_SIZE = int(get_setting("BROWSER_POOL_SIZE", 1))
+BROWSER_POOL_MAX_PAGES = int(get_setting("BROWSER_POOL_MAX_PAGES", 50))  # recycle after this many captures
+BROWSER_POOL_MAX_AGE = int(get_setting("BROWSER_POOL_MAX_AGE", 30 * 60))  # seconds
+BROWSER_POOL_IDLE_TIMEOUT = int(get_setting("BROWSER_POOL_IDLE_TIMEOUT", 5 * 60))  # seconds
+
 # Email settings
 EMAIL_ENABLED = get_setting("EMAIL_ENABLED", "False")
 EMAIL_SENDER = get_setting("EMAIL_SENDER", "your-email@example.com")
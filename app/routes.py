@@ -1,4 +1,3 @@
-import glob
 from flask import jsonify, Response
 from datetime import datetime, timedelta
 import hashlib
@@ -38,15 +37,11 @@ from werkzeug.utils import secure_filename
 
 import app.config as config
 from app.config import (
-    API_KEY,
     SCREENSHOT_DIRECTORY,
-    USER_NAME,
-    USER_PASSWORD_HASH,
     VIDEO_DIRECTORY,
-    VERSION,
     BACKUP_PATH,
     backup_config,
-    restore_config
+    restore_config,
 )
 from app.utils import (
     scheduling,
@@ -54,7 +49,10 @@ from app.utils import (
     video_archiver,
     screenshots
 )
+from app.utils.capture_scheduler import base_interval
 from app.utils.db import SessionLocal
+from app.utils.frame_hashes import get_frame_hashes, similar_frames
+from app.utils.frames import FRAME_FORMATS, frame_extension, frame_mimetype, get_frame_index, write_frame
 #from app.models.log import Log
 from app.utils.scheduling import log_cache, log_cache_lock
 
@@ -127,7 +125,7 @@ class TemplateName:
 
 def generate_timed_hash():
     expiration_time = int(time.time()) + 15 * 60
-    to_hash = f"{API_KEY}{expiration_time}"
+    to_hash = f"{config.API_KEY}{expiration_time}"
     hash_digest = hashlib.sha256(to_hash.encode()).hexdigest()
     return f"{hash_digest}.{expiration_time}"
 
@@ -135,7 +133,7 @@ def generate_timed_hash():
 def is_hash_valid(timed_hash: str) -> bool:
     try:
         hash_digest, expiration_time = timed_hash.split(".")
-        to_hash = f"{API_KEY}{expiration_time}"
+        to_hash = f"{config.API_KEY}{expiration_time}"
         valid_hash = hashlib.sha256(to_hash.encode()).hexdigest()
         if int(expiration_time) < int(time.time()):
             return False
@@ -165,7 +163,7 @@ def login_required(f):
             return f(*args, **kwargs)
 
         # Check for valid static API key
-        elif api_key == API_KEY:
+        elif api_key == config.API_KEY:
             return f(*args, **kwargs)
 
         # Check for valid session
@@ -289,9 +287,10 @@ def update_setting(name: str, value: str) -> bool:
         session.close()
 
     if delta is True:
-        # Trigger server restart
-        # is there a way to do this on a delay?
-        restart_server()
+        # most settings apply live; the ones only read at startup still need a restart
+        config.settings_changed()
+        if name in config.RESTART_SETTINGS:
+            restart_server()
 
     return True
 
@@ -507,7 +506,7 @@ def init_routes(app):
     @app.context_processor
     def inject_footer_data():
         return dict(
-            VERSION=VERSION
+            VERSION=config.VERSION
         )
 
     # Add a new route for the extended health check
@@ -662,8 +661,8 @@ def init_routes(app):
             username = request.form["username"]
             password = request.form["password"]
 
-            if username == USER_NAME and check_password_hash(
-                USER_PASSWORD_HASH, password
+            if username == config.USER_NAME and check_password_hash(
+                config.USER_PASSWORD_HASH, password
             ):
                 session["logged_in"] = True
                 login_attempts.pop(
@@ -756,19 +755,20 @@ def init_routes(app):
 
         if file and allowed_filename(file.filename):
             # Generate a unique timestamped filename
-            timestamp = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
-            filename = f"{template_name}_{timestamp}.png.tmp"
-            output_path = os.path.join(SCREENSHOT_DIRECTORY, template_name, filename)
+            timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+            filename = f"{template_name}_{timestamp}.{frame_extension(ltemplate)}"
+            final_path = os.path.join(SCREENSHOT_DIRECTORY, template_name, filename)
+            output_path = final_path + ".tmp"
             #if not os.path.normpath(output_path).startswith(SCREENSHOT_DIRECTORY):
             #    abort(400)
 
             # Save the file to a temporary location
             file.save(output_path)
 
-            # Add a timestamp to the image and remove the ".tmp" extension
-            screenshots.add_timestamp(output_path, name=template_name)
-            final_path = output_path.rstrip(".tmp")
-            os.rename(output_path, final_path)
+            # Add a timestamp to the image and store it in the template's frame format
+            with Image.open(output_path) as image:
+                write_frame(screenshots.draw_timestamp(image, template_name), final_path)
+            os.unlink(output_path)
 
             # Update the template's last screenshot time
             template_manager.update_last_screenshot_time(template_name)
@@ -795,14 +795,13 @@ def init_routes(app):
             )
         ):
             # TODO: check for file integrity
-            return send_file(
-                os.path.join(
-                    os.path.dirname(os.path.abspath(__file__)),
-                    "..",
-                    SCREENSHOT_DIRECTORY,
-                    "latest_camera.png",
-                )
+            latest_path = os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "..",
+                SCREENSHOT_DIRECTORY,
+                "latest_camera.png",
             )
+            return send_file(latest_path, mimetype=frame_mimetype(latest_path))
 
         global last_time, last_shot
         # implement some simple caching so the server doesn't get crushed
@@ -832,9 +831,10 @@ def init_routes(app):
                 SCREENSHOT_DIRECTORY,
                 name,
             )
-            lfiles = [f for f in glob.glob(path + "/*.png") if os.path.isfile(f)]
-            lfiles.sort(key=os.path.getmtime)
-            last_file = lfiles[-1]
+            latest = get_frame_index(path).latest()
+            if latest is None:
+                continue
+            last_file = os.path.join(path, latest["filename"])
             if (
                 os.path.exists(last_file)
                 and os.path.getmtime(last_file) > most_recent_time
@@ -848,8 +848,8 @@ def init_routes(app):
         last_shot = most_recent_file
 
         if os.path.exists(most_recent_file):
-            return send_file(most_recent_file)
-        return send_file(last_file)  # better than nothing
+            return send_file(most_recent_file, mimetype=frame_mimetype(most_recent_file))
+        return send_file(last_file, mimetype=frame_mimetype(last_file))  # better than nothing
 
     @app.route("/test.rtsp", methods=["OPTIONS", "DESCRIBE", "SETUP", "PLAY", "TEARDOWN"])
     def handle_rtsp():
@@ -1125,16 +1125,60 @@ def init_routes(app):
         if not os.path.exists(path):
             abort(404)
 
-        latest_file = max(
-            (f for f in os.listdir(path) if f.endswith('.png')),
-            key=lambda f: os.path.getmtime(os.path.join(path, f))
-        )
+        latest = get_frame_index(path).latest()
 
-        if latest_file:
-            return send_file(os.path.join(path, latest_file), mimetype='image/png')
+        if latest:
+            latest_path = os.path.join(path, latest["filename"])
+            return send_file(latest_path, mimetype=frame_mimetype(latest_path))
 
         abort(404)
 
+    @app.route("/similar_frames/<string:template_name>")
+    @login_required
+    def similar_frames_route(template_name: TemplateName):
+        """
+        Frames that look like one of this camera's frames (?frame=, default the latest),
+        from the perceptual hash index: this camera's, or every camera's with ?all=1.
+        """
+        template_name = validate_template_name(template_name)
+        if template_name is None:
+            abort(404)
+
+        path = os.path.join(
+            os.path.dirname(os.path.join(__file__)),
+            "..",
+            SCREENSHOT_DIRECTORY,
+            template_name,
+        )
+        if not os.path.exists(path):
+            abort(404)
+
+        frame = request.args.get("frame")
+        if frame is None:
+            latest = get_frame_index(path).latest()
+            if latest is None:
+                abort(404)
+            frame = latest["filename"]
+        value = get_frame_hashes(path).hash_of(os.path.basename(frame))
+        if value is None:
+            abort(404)
+
+        try:
+            distance = int(request.args.get("distance", config.FRAME_HASH_DISTANCE))
+            limit = min(int(request.args.get("limit", 20)), 500)
+        except ValueError:
+            abort(400)
+        cameras = None if request.args.get("all") else [template_name]
+        matches = similar_frames(value, cameras, distance, limit)
+        return jsonify({
+            "frame": os.path.basename(frame),
+            "hash": f"{value:016x}",
+            "similar": [
+                {"camera": camera, "filename": filename, "distance": d}
+                for camera, filename, d in matches
+            ],
+        })
+
     # TODO: extend this for groups
     @app.route("/last_teaser")
     @login_required
@@ -1199,10 +1243,10 @@ def init_routes(app):
         if not os.path.exists(path):
             abort(404)
 
-        lfiles = [f for f in glob.glob(path + "/*.png") if os.path.isfile(f)]
-        lfiles.sort(key=os.path.getmtime)
-        if len(lfiles) > 0:
-            return send_file(lfiles[-1])
+        latest = get_frame_index(path).latest()
+        if latest:
+            latest_path = os.path.join(path, latest["filename"])
+            return send_file(latest_path, mimetype=frame_mimetype(latest_path))
 
         abort(404)
 
@@ -1349,6 +1393,7 @@ def init_routes(app):
             if template_name is None:
                 abort(404)
             if template_manager.delete_template(template_name):
+                scheduling.capture_scheduler.unschedule(template_name)
                 return jsonify({"status": "success", "message": "Template deleted"})
             else:
                 return (
@@ -1405,6 +1450,7 @@ def init_routes(app):
             session.commit()
         finally:
             session.close()
+        config.settings_changed()
 
         return True
 
@@ -1524,6 +1570,15 @@ def init_routes(app):
                 in ["true", "1", "t", "y", "yes", "on"],
                 "danger": request.form.get("danger", "false").lower()
                 in ["true", "1", "t", "y", "yes", "on"],
+                "persistent_stream": request.form.get("persistent_stream", "false").lower()
+                in ["true", "1", "t", "y", "yes", "on"],
+                "frame_format": request.form.get("frame_format"),
+                "adaptive": request.form.get("adaptive", "false").lower()
+                in ["true", "1", "t", "y", "yes", "on"],
+                "min_frequency": request.form.get("min_frequency"),
+                "max_frequency": request.form.get("max_frequency"),
+                "motion_detector": request.form.get("motion_detector"),
+                "motion_mask": request.form.get("motion_mask"),
             }
 
             lremoves = []
@@ -1541,24 +1596,19 @@ def init_routes(app):
                 updated_data["timeout"] = 30
             if updated_data.get("frequency") == "":
                 updated_data["frequency"] = 30
+            if updated_data.get("frame_format") not in [None, ""] + list(FRAME_FORMATS):
+                updated_data["frame_format"] = ""
 
             # Update the template in your storage (e.g., JSON file, database)
             # This assumes you have a function to update templates
             template_manager.save_template(template_name, updated_data)
 
-            # TODO: stop the old job.  reschedule the camera
             # TODO: generate a blank template and insert it (like a movie reel type of thing)
-            template_manager.get_template(template_name)
+            template = template_manager.get_template(template_name)
             try:
-                seconds = int(updated_data.get("frequency", 30 * 60))
-                scheduling.scheduler.add_job(
-                    func=scheduling.update_camera,
-                    trigger="interval",
-                    seconds=seconds,
-                    args=[template_name, updated_data],
-                    id=template_name,
-                    replace_existing=True,
-                )
+                # reschedule the camera
+                seconds = base_interval(template)
+                scheduling.capture_scheduler.schedule(template_name, template, seconds, delay=seconds)
             except Exception as e:
                 print("job schedule error:", e)
                 # logging.error(f"Error scheduling job for {name}: {e}")
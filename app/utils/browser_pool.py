@@ -0,0 +1,247 @@
+# app/utils/browser_pool.py
+
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class BrowserSession:
+    """
+    A long-lived browser driver leased out of a BrowserPool.
+
+    The pool only needs the driver to answer execute_script(); creating and
+    configuring it is left to the factory the pool was built with.
+    """
+
+    def __init__(self, kind, driver, display=None):
+        self.kind = kind
+        self.driver = driver
+        self.display = display
+        self.pages = 0
+        self.created = time.time()
+        self.last_used = self.created
+        self.broken = False
+
+    def is_alive(self):
+        """Health check: a crashed Chrome or chromedriver fails this round trip."""
+        if self.broken:
+            return False
+        try:
+            self.driver.execute_script("return 1;")
+            return True
+        except Exception:
+            return False
+
+    def reset(self):
+        """Put the browser back in a neutral state so the next page starts clean."""
+        driver = self.driver
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.switch_to.default_content()
+        driver.delete_all_cookies()
+        driver.execute_cdp_cmd("Emulation.setAutoDarkModeOverride", {})
+        driver.get("about:blank")
+        # drain the performance log so network_idle_condition only sees the next page
+        driver.get_log("performance")
+
+    def close(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logging.debug(f"Error closing {self.kind} browser session: {e}")
+        if self.display is not None:
+            try:
+                self.display.stop()
+            except Exception as e:
+                logging.debug(f"Error stopping virtual display: {e}")
+
+
+class BrowserPool:
+    """
+    A bounded pool of warm browser sessions, keyed by kind.
+
+    Sessions are leased one at a time.  On release each one is health checked,
+    reset and returned to the idle list.  A session is retired (and replaced
+    lazily by the next lease) once it has served max_pages pages, is older than
+    max_age seconds, has sat idle longer than idle_timeout seconds, or fails a
+    health check.  No more than max_size sessions of all kinds exist at once;
+    a lease that finds the pool full evicts an idle session of another kind,
+    or waits for one to be released.  A max_size of 0 disables pooling, so
+    every lease gets a fresh session that is closed on release.
+    """
+
+    def __init__(self, factory, max_size=1, max_pages=50, max_age=1800, idle_timeout=300,
+                 on_close=None):
+        self.factory = factory
+        self.max_size = max_size
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self.idle_timeout = idle_timeout
+        self.on_close = on_close
+        self._idle = {}
+        self._size = 0
+        self._condition = threading.Condition()
+        self._reaper = None
+
+    def _expired(self, session, now):
+        return (
+            (self.max_pages and session.pages >= self.max_pages)
+            or (self.max_age and now - session.created > self.max_age)
+            or (self.idle_timeout and now - session.last_used > self.idle_timeout)
+        )
+
+    def _retire(self, session):
+        """Close a session that has already been taken out of the pool's accounting."""
+        session.close()
+        if self.on_close is not None:
+            try:
+                self.on_close(session)
+            except Exception as e:
+                logging.error(f"Error cleaning up after browser session: {e}")
+
+    def acquire(self, kind, timeout=None):
+        """Lease a session of the given kind, starting a new one if none is idle."""
+        deadline = None if timeout is None else time.time() + timeout
+        retired = []
+        session = None
+        with self._condition:
+            while True:
+                idle = self._idle.get(kind, [])
+                while idle:
+                    candidate = idle.pop()
+                    if not self._expired(candidate, time.time()):
+                        session = candidate
+                        break
+                    self._size -= 1
+                    retired.append(candidate)
+                if session is not None or self._size < max(self.max_size, 1):
+                    break
+
+                # full: make room by evicting an idle session of some other kind
+                victim = next((s for sessions in self._idle.values() for s in sessions), None)
+                if victim is not None:
+                    self._idle[victim.kind].remove(victim)
+                    self._size -= 1
+                    retired.append(victim)
+                    continue
+
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No {kind} browser session available")
+                self._condition.wait(remaining)
+
+            if session is None:
+                self._size += 1
+
+        for old in retired:
+            self._retire(old)
+
+        # health check outside the lock; a dead idle session is replaced in place
+        if session is not None and not session.is_alive():
+            logging.warning(f"Replacing crashed {kind} browser session")
+            self._retire(session)
+            session = None
+
+        if session is None:
+            try:
+                session = self.factory(kind)
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+            self._start_reaper()
+
+        session.last_used = time.time()
+        return session
+
+    def release(self, session):
+        """Return a leased session; broken or worn-out sessions are closed instead."""
+        session.pages += 1
+        session.last_used = time.time()
+        keep = self.max_size > 0 and not self._expired(session, session.last_used)
+        if keep and session.is_alive():
+            try:
+                session.reset()
+            except Exception as e:
+                logging.warning(f"Could not reset {session.kind} browser session: {e}")
+                keep = False
+        else:
+            keep = False
+
+        with self._condition:
+            if keep:
+                self._idle.setdefault(session.kind, []).append(session)
+            else:
+                self._size -= 1
+            self._condition.notify()
+
+        if not keep:
+            self._retire(session)
+
+    @contextmanager
+    def lease(self, kind, timeout=None):
+        session = self.acquire(kind, timeout=timeout)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def reap(self):
+        """Close idle sessions that have expired while nobody was using them."""
+        now = time.time()
+        retired = []
+        with self._condition:
+            for sessions in self._idle.values():
+                for session in list(sessions):
+                    if self._expired(session, now):
+                        sessions.remove(session)
+                        self._size -= 1
+                        retired.append(session)
+            if retired:
+                self._condition.notify_all()
+        for session in retired:
+            self._retire(session)
+        return len(retired)
+
+    def _start_reaper(self):
+        def reaper():
+            while True:
+                time.sleep(min(self.idle_timeout or 30, 30))
+                try:
+                    self.reap()
+                except Exception as e:
+                    logging.error(f"Error reaping browser sessions: {e}")
+
+        # checked and started under the lock, so concurrent acquires start only one
+        with self._condition:
+            if self._reaper is not None or not self.idle_timeout:
+                return
+            self._reaper = threading.Thread(target=reaper, daemon=True)
+            self._reaper.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """Close every idle session.  Leased sessions are closed when released."""
+        with self._condition:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            self._idle = {}
+            self._size -= len(sessions)
+            self._condition.notify_all()
+        for session in sessions:
+            self._retire(session)
+
+    def stats(self):
+        with self._condition:
+            idle = {kind: len(sessions) for kind, sessions in self._idle.items()}
+            return {
+                "size": self._size,
+                "max_size": self.max_size,
+                "idle": idle,
+                "leased": self._size - sum(idle.values()),
+            }
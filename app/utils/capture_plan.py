@@ -0,0 +1,97 @@
+# app/utils/capture_plan.py
+
+import datetime
+import logging
+import os
+import tempfile
+
+import app.config as config
+
+from .detect import calculate_difference_fast
+from .screenshots import (
+    CAPTURE_METHODS,
+    capture_flags,
+    capture_with_method,
+    choose_capture_method,
+    save_capture_plan,
+)
+from .template_manager import get_templates
+
+# methods that can stand in for a browser capture
+DOWNGRADES = ["image", "light"]
+
+
+def downgrade_candidates(template, method):
+    """Cheaper methods worth trying in place of the template's current browser-based method."""
+    if method not in ["light", "browser"]:
+        return []
+    if capture_flags(template)["danger"] or template.get("popup_xpath") or template.get("dedicated_xpath"):
+        return []  # these need a real browser to drive the page
+    return [m for m in DOWNGRADES if CAPTURE_METHODS.index(m) < CAPTURE_METHODS.index(method)]
+
+
+def equivalent_output(name, template, method_a, method_b):
+    """Capture with both methods and compare the results with SSIM."""
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path_a = os.path.join(tmpdirname, f"{name}_a.png")
+        path_b = os.path.join(tmpdirname, f"{name}_b.png")
+        if capture_with_method(method_a, name, template, path_a, conditional=False) is not True:
+            return None
+        if capture_with_method(method_b, name, template, path_b, conditional=False) is not True:
+            return False
+        difference = calculate_difference_fast(path_a, path_b)
+        logging.info(f"Capture plan {name}: {method_a} vs {method_b} difference {difference}")
+        return difference is not None and difference <= config.CAPTURE_PLAN_MAX_DIFFERENCE
+
+
+def replan_template(name, template):
+    """
+    Try to move a template onto a cheaper capture method, or back off an old downgrade.
+
+    Returns the method the template is planned with afterwards.
+    """
+    method = template.get("capture_method") or ""
+    if method not in CAPTURE_METHODS:
+        return None  # never captured yet; capture_or_download plans it
+
+    natural = choose_capture_method(template, template.get("capture_content_type") or "")
+    content_type = template.get("capture_content_type") or ""
+
+    if natural in CAPTURE_METHODS and CAPTURE_METHODS.index(method) < CAPTURE_METHODS.index(natural):
+        # an earlier downgrade: check now and then that it still matches the original method
+        try:
+            planned = datetime.datetime.strptime(template.get("capture_plan_time") or "", "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            planned = datetime.datetime.min
+        if datetime.datetime.utcnow() - planned < datetime.timedelta(seconds=config.CAPTURE_PLAN_MAX_AGE):
+            return method
+        same = equivalent_output(name, template, natural, method)
+        if same is None:
+            return method  # the original method failed too; nothing learned
+        if same:
+            save_capture_plan(name, template, method, content_type)
+            return method
+        logging.info(f"Capture plan {name}: {method} no longer matches {natural}, reverting")
+        save_capture_plan(name, template, natural, content_type)
+        return natural
+
+    for candidate in downgrade_candidates(template, method):
+        same = equivalent_output(name, template, method, candidate)
+        if same is None:
+            break  # the current method failed; leave it to capture_or_download
+        if same:
+            logging.info(f"Capture plan {name}: downgrading {method} to {candidate}")
+            save_capture_plan(name, template, candidate, content_type)
+            return candidate
+    return method
+
+
+def replan_templates():
+    """Background job: look for cheaper capture methods across all templates."""
+    for name, template in get_templates().items():
+        if not name:
+            continue
+        try:
+            replan_template(name, template)
+        except Exception as e:
+            logging.error(f"Error replanning capture for {name}: {e}")
@@ -0,0 +1,351 @@
+# app/utils/capture_scheduler.py
+
+import atexit
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import app.config as config
+
+from .screenshots import choose_capture_method
+
+# capture method (see screenshots.CAPTURE_METHODS) -> the slot pool it runs in
+METHOD_POOLS = {
+    "image": "image",
+    "pdf": "pdf",
+    "stream": "stream",
+    "ytdlp": "stream",
+    "light": "browser",
+    "browser": "browser",
+}
+
+
+def capture_pool(template):
+    """
+    The slot pool a template's captures run in.
+
+    Uses the stored capture plan when there is one, otherwise guesses from the url
+    and flags alone; anything we cannot tell apart is treated as a browser capture.
+    """
+    method = template.get("capture_method") or choose_capture_method(template, "")
+    return METHOD_POOLS.get(method, "browser")
+
+
+def base_interval(template):
+    """The template's configured capture interval in seconds (frequency is in minutes)."""
+    try:
+        return 60 * int(template.get("frequency", 30) or 30)
+    except (TypeError, ValueError):
+        return 60 * 30
+
+
+def frequency_bounds(template):
+    """
+    The adaptive interval range in seconds.
+
+    min_frequency/max_frequency are in minutes; left at 0 they default to one
+    minute and eight times the frequency.  The frequency itself is always in range.
+    """
+    base = base_interval(template)
+    lo = 60 * int(template.get("min_frequency") or 0) or 60
+    hi = 60 * int(template.get("max_frequency") or 0) or base * 8
+    return min(lo, base), max(hi, base)
+
+
+def adaptive_interval(template, interval, changed):
+    """
+    The interval until a template's next capture.
+
+    Fixed templates always use their frequency.  Adaptive ones drop to the
+    minimum after motion (burst mode) and stretch by ADAPTIVE_STRETCH after each
+    capture that found no change; changed is None when the capture said neither.
+    """
+    if not template.get("adaptive"):
+        return base_interval(template)
+    lo, hi = frequency_bounds(template)
+    if changed is True:
+        return lo
+    if changed is False:
+        interval *= config.ADAPTIVE_STRETCH
+    return min(hi, max(lo, interval))
+
+
+def runs_in_thread(template):
+    """Persistent stream readers live in this process, so those cameras run on threads."""
+    return bool(template.get("persistent_stream"))
+
+
+class CaptureScheduler:
+    """
+    Runs every camera's captures off one deadline-ordered queue per slot pool.
+
+    Each pool (browser, stream, image, pdf) has a fixed number of slots, so slow
+    browser captures can only ever hold their own slots and never starve the
+    cheap snapshot cameras.  max_workers caps the total across all pools.
+
+    A camera has at most one pending and one running capture.  When it finishes
+    its next deadline is one interval after the last one; if that has already
+    passed, the missed runs are coalesced into a single run as soon as a slot is
+    free, rather than stacked up behind each other.
+
+    A worker process that dies (OOM kill, a crash in a native library) breaks the
+    whole process pool; it is replaced, and the captures it took down are
+    retried once before they count as failed.
+    """
+
+    def __init__(self, run, slots, max_workers=8, refresh=None, use_processes=True):
+        self.run = run
+        self.slots = dict(slots)
+        self.max_workers = max_workers
+        self.refresh = refresh
+        self.use_processes = use_processes
+        self._jobs = {}
+        self._queues = {pool: [] for pool in self.slots}
+        self._running = {pool: 0 for pool in self.slots}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._dispatcher = None
+        self._stopped = False
+        self._threads = None
+        self._processes = None
+        self._metrics = {
+            "dispatched": 0,
+            "completed": 0,
+            "failed": 0,
+            "coalesced": 0,
+            "pool_restarts": 0,
+            "lag_last": 0.0,
+            "lag_max": 0.0,
+            "lag_avg": 0.0,
+        }
+
+    def _push(self, job, due):
+        job["due"] = due
+        job["seq"] = next(self._counter)
+        job["pending"] = True
+        heapq.heappush(self._queues.setdefault(job["pool"], []), (due, job["seq"], job["name"]))
+        self._running.setdefault(job["pool"], 0)
+        self._condition.notify()
+
+    def schedule(self, name, template, interval, delay=0):
+        """Add or replace a camera; its first capture is due delay seconds from now."""
+        with self._condition:
+            job = self._jobs.get(name)
+            if job is None:
+                job = self._jobs[name] = {"name": name, "running": False, "pending": False}
+            job["template"] = template
+            job["interval"] = interval if interval > 0 else 60
+            job["pool"] = capture_pool(template)
+            job["threaded"] = runs_in_thread(template)
+            if not job["running"]:
+                # re-queued under a new seq; any older heap entry is now stale
+                self._push(job, time.time() + delay)
+
+    def set_slots(self, slots):
+        """Change the slots per pool while running; captures already running keep theirs."""
+        with self._condition:
+            self.slots.update(slots)
+            for pool in slots:
+                self._queues.setdefault(pool, [])
+                self._running.setdefault(pool, 0)
+            self._condition.notify_all()
+
+    def unschedule(self, name):
+        with self._condition:
+            self._jobs.pop(name, None)
+
+    def run_now(self, name):
+        """Move a camera's next capture up to now (no-op while it is already running)."""
+        with self._condition:
+            job = self._jobs.get(name)
+            if job is not None and not job["running"]:
+                self._push(job, time.time())
+
+    def _slot_free(self, pool):
+        return self._running.get(pool, 0) < self.slots.get(pool, 1)
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+                now = time.time()
+                job, wait = None, None
+                if sum(self._running.values()) < self.max_workers:
+                    job, wait = self._take_ready(now)
+                if job is None:
+                    self._condition.wait(wait)
+                    continue
+                job["pending"] = False
+                job["running"] = True
+                self._running[job["pool"]] += 1
+                lag = now - job["due"]
+                metrics = self._metrics
+                metrics["dispatched"] += 1
+                metrics["lag_last"] = lag
+                metrics["lag_max"] = max(metrics["lag_max"], lag)
+                metrics["lag_avg"] += (lag - metrics["lag_avg"]) * 0.1
+                executor = self._threads if job["threaded"] or not self.use_processes else self._processes
+                name, template, pool = job["name"], job["template"], job["pool"]
+
+            try:
+                future = executor.submit(self.run, name, template)
+            except BrokenProcessPool as e:
+                logging.error(f"Capture process pool is broken, restarting it: {e}")
+                self._restart_processes(executor)
+                self._retry(name, pool)
+                continue
+            except Exception as e:
+                logging.error(f"Could not start capture for {name}: {e}")
+                self._finish(name, pool, failed=True)
+                continue
+            future.add_done_callback(lambda f, name=name, pool=pool, executor=executor:
+                                     self._done(name, pool, f, executor))
+
+    def _done(self, name, pool, future, executor=None):
+        if future.cancelled():
+            self._finish(name, pool, failed=True)
+        elif isinstance(future.exception(), BrokenProcessPool):
+            logging.error(f"Capture process pool broke while running {name}, restarting it")
+            self._restart_processes(executor)
+            self._retry(name, pool)
+        elif future.exception() is not None:
+            self._finish(name, pool, failed=True)
+        else:
+            self._finish(name, pool, result=future.result())
+
+    def _restart_processes(self, broken):
+        """Swap in a new process pool for a broken one; only the first caller per pool does it."""
+        with self._condition:
+            if self._stopped or broken is None or self._processes is not broken:
+                return
+            self._processes = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._metrics["pool_restarts"] += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _retry(self, name, pool):
+        """Requeue a capture lost to a broken pool, once; a second loss in a row counts as a failure."""
+        with self._condition:
+            job = self._jobs.get(name)
+            if job is not None and not job.get("retried"):
+                job["retried"] = True
+                job["running"] = False
+                self._running[pool] -= 1
+                self._push(job, time.time())
+                return
+        self._finish(name, pool, failed=True)
+
+    def _take_ready(self, now):
+        best, wait = None, None
+        for pool, queue in self._queues.items():
+            if not self._slot_free(pool):
+                continue
+            while queue:
+                due, seq, name = queue[0]
+                job = self._jobs.get(name)
+                if job is None or job["seq"] != seq or not job["pending"]:
+                    heapq.heappop(queue)  # unscheduled or re-queued since
+                    continue
+                if due > now:
+                    wait = due - now if wait is None else min(wait, due - now)
+                elif best is None or due < best[0]:
+                    best = (due, pool, name)
+                break
+        if best is None:
+            return None, wait
+        heapq.heappop(self._queues[best[1]])
+        return self._jobs[best[2]], None
+
+    def _finish(self, name, pool, failed=False, result=None):
+        template, deleted = None, False
+        if self.refresh is not None:
+            try:
+                template = self.refresh(name)
+                deleted = not template  # get_template returns {} for a deleted camera
+            except Exception as e:
+                logging.error(f"Could not reload template {name}: {e}")
+
+        with self._condition:
+            self._running[pool] -= 1
+            self._metrics["completed"] += 1
+            if failed:
+                self._metrics["failed"] += 1
+                logging.error(f"Capture for {name} failed")
+            job = self._jobs.get(name)
+            if job is not None:
+                job["running"] = False
+                job["retried"] = False
+                if deleted:
+                    self._jobs.pop(name, None)  # the template was deleted
+                else:
+                    if template is not None:
+                        job["template"] = template
+                        job["pool"] = capture_pool(template)
+                        job["threaded"] = runs_in_thread(template)
+                    if template is not None or job["template"].get("adaptive"):
+                        # pick up a new frequency; the run's result says whether it saw change
+                        job["interval"] = adaptive_interval(job["template"], job["interval"], result)
+                    if not job["pending"]:
+                        now = time.time()
+                        due = job["due"] + job["interval"]
+                        if due < now:
+                            # overdue: one run now stands in for every run we missed
+                            self._metrics["coalesced"] += int((now - due) // job["interval"]) + 1
+                            due = now
+                        self._push(job, due)
+            self._condition.notify()
+
+    def start(self):
+        with self._condition:
+            if self._dispatcher is not None:
+                return
+            self._stopped = False
+            self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="capture")
+            if self.use_processes:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._dispatcher = threading.Thread(target=self._dispatch, name="capture-scheduler", daemon=True)
+            self._dispatcher.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self, wait=False):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            dispatcher, self._dispatcher = self._dispatcher, None
+        if dispatcher is not None:
+            dispatcher.join(timeout=5)
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
+        self._threads = self._processes = None
+
+    def stats(self):
+        """Queue lag (seconds past due when started) and per-pool slot utilization."""
+        with self._condition:
+            now = time.time()
+            pools = {}
+            for pool, slots in self.slots.items():
+                pending = [j for j in self._jobs.values() if j["pool"] == pool and j["pending"]]
+                overdue = [now - j["due"] for j in pending if j["due"] <= now]
+                running = self._running.get(pool, 0)
+                pools[pool] = {
+                    "slots": slots,
+                    "running": running,
+                    "utilization": round(running / slots, 2) if slots else 0,
+                    "queued": len(pending),
+                    "overdue": len(overdue),
+                    "max_wait": round(max(overdue, default=0), 1),
+                }
+            stats = {key: round(value, 2) if isinstance(value, float) else value
+                     for key, value in self._metrics.items()}
+            stats.update({
+                "cameras": len(self._jobs),
+                "running": sum(self._running.values()),
+                "max_workers": self.max_workers,
+                "pools": pools,
+            })
+            return stats
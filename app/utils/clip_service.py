@@ -0,0 +1,363 @@
+# app/utils/clip_service.py
+
+import atexit
+import inspect
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from PIL import Image
+
+import app.config as config
+from app.config import (
+    CLIP_BATCH_SIZE,
+    CLIP_BATCH_WAIT,
+    CLIP_IMAGE_SIZE,
+    CLIP_MODEL,
+    CLIP_QUANTIZE,
+    CLIP_TEXT_CACHE_SIZE,
+    SECRET_KEY,
+)
+
+# worker processes find the service through the environment they inherit
+SERVICE_ENV = "GLIMPSER_CLIP_SERVICE"
+
+
+def normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.maximum(np.linalg.norm(embeddings, axis=-1, keepdims=True), 1e-12)
+
+
+def softmax(logits):
+    logits = logits - logits.max()
+    exp = np.exp(logits)
+    return exp / exp.sum()
+
+
+def features(output):
+    """get_*_features return a tensor in older transformers and a model output in newer ones."""
+    return getattr(output, "pooler_output", output)
+
+
+def interpolates(model):
+    """Whether the model can take other input sizes (interpolate_pos_encoding, transformers 4.45+)."""
+    try:
+        parameters = inspect.signature(model.get_image_features).parameters
+    except (TypeError, ValueError):
+        return False
+    return "interpolate_pos_encoding" in parameters or any(
+        p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters.values())
+
+
+class ClipModel:
+    """
+    The CLIP model itself, loaded on first use.
+
+    With quantize, the Linear layers (nearly all of the compute) run as dynamic
+    int8 on the CPU.  image_size scales the input resolution, interpolating the
+    position embeddings; ViT-B/32 costs roughly (image_size / 32) ** 2 patches.
+    Returns normalized embeddings as numpy arrays so the service does not care
+    what the model runs on.
+    """
+
+    def __init__(self, model_name=CLIP_MODEL, quantize=CLIP_QUANTIZE, image_size=CLIP_IMAGE_SIZE):
+        self.model_name = model_name
+        self.quantize = quantize
+        self.image_size = image_size
+        self.model = None
+        self.image_processor = None
+        self.tokenizer = None
+        self.image_options = {}
+        self.logit_scale = 100.0
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.model is None:
+                from transformers import CLIPModel, CLIPProcessor
+
+                started = time.time()
+                processor = CLIPProcessor.from_pretrained(self.model_name)
+                self.prepare(CLIPModel.from_pretrained(self.model_name),
+                             processor.image_processor, processor.tokenizer)
+                logging.info(f"Loaded {self.model_name} in {time.time() - started:.1f}s"
+                             f"{' (int8)' if self.quantize else ''}")
+        return self.model
+
+    def prepare(self, model, image_processor, tokenizer):
+        """Apply the precision and resolution settings to a freshly loaded model."""
+        import torch
+
+        model = model.eval()
+        self.image_options = {}
+        native = model.config.vision_config.image_size
+        if self.image_size and self.image_size != native and not interpolates(model):
+            logging.warning(f"CLIP_IMAGE_SIZE {self.image_size} needs transformers 4.45 or later; "
+                            f"using the model's own {native}px")
+        elif self.image_size and self.image_size != native:
+            size = max(32, int(self.image_size))
+            self.image_options = {"size": {"shortest_edge": size},
+                                  "crop_size": {"height": size, "width": size}}
+        if self.quantize:
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model, self.image_processor, self.tokenizer = model, image_processor, tokenizer
+        self.logit_scale = float(model.logit_scale.detach().exp())
+
+    def image_embeddings(self, images):
+        import torch
+
+        model = self.load()
+        inputs = self.image_processor(images=images, return_tensors="pt", **self.image_options)
+        kwargs = {"interpolate_pos_encoding": True} if self.image_options else {}
+        with torch.no_grad():
+            output = model.get_image_features(pixel_values=inputs["pixel_values"], **kwargs)
+        return normalize(features(output).numpy())
+
+    def text_embeddings(self, texts):
+        import torch
+
+        model = self.load()
+        inputs = self.tokenizer(texts, return_tensors="pt", padding=True)
+        with torch.no_grad():
+            output = model.get_text_features(**inputs)
+        return normalize(features(output).numpy())
+
+
+class ClipService:
+    """
+    Scores frames against object_filter prompts for every camera on the host.
+
+    Requests from all cameras go on one queue; a single worker thread takes up to
+    CLIP_BATCH_SIZE of them at a time (waiting at most CLIP_BATCH_WAIT for a batch
+    to fill) and runs them through the model in one forward pass.  Text embeddings
+    are cached per prompt.  Requests that have waited longer than CLIP_TIMEOUT are
+    answered with None instead of being scored, so a backlog cannot grow without
+    bound.
+
+    Capture worker processes reach the service over a local socket (see
+    start_clip_service and clip_scores); the hosting process uses it directly.
+    """
+
+    def __init__(self, model=None, batch_size=CLIP_BATCH_SIZE, batch_wait=CLIP_BATCH_WAIT,
+                 timeout=None, text_cache_size=CLIP_TEXT_CACHE_SIZE):
+        self.model = model or ClipModel()
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.timeout = timeout  # None follows CLIP_TIMEOUT
+        self.text_cache_size = text_cache_size
+        self.text_cache = OrderedDict()
+        self.requests = queue.Queue()
+        self.listener = None
+        self.address = None
+        self.stopped = threading.Event()
+        self.threads = []
+        self.metrics = {"requests": 0, "batches": 0, "expired": 0, "failed": 0,
+                        "text_hits": 0, "text_misses": 0}
+
+    def text_embeddings(self, texts):
+        """Embeddings for each prompt, computing only the ones not cached yet."""
+        missing = [t for t in dict.fromkeys(texts) if t not in self.text_cache]
+        self.metrics["text_hits"] += len(texts) - len(missing)
+        self.metrics["text_misses"] += len(missing)
+        if missing:
+            for text, embedding in zip(missing, self.model.text_embeddings(missing)):
+                self.text_cache[text] = embedding
+        for text in texts:
+            self.text_cache.move_to_end(text)
+        while len(self.text_cache) > self.text_cache_size:
+            self.text_cache.popitem(last=False)
+        return np.stack([self.text_cache[text] for text in texts])
+
+    def submit(self, image_path, texts):
+        """Queue a frame; returns a dict whose "done" event is set once "result" is filled in."""
+        request = {"path": image_path, "texts": list(texts), "queued": time.time(),
+                   "done": threading.Event(), "result": None}
+        self.requests.put(request)
+        return request
+
+    def request_timeout(self):
+        return config.CLIP_TIMEOUT if self.timeout is None else self.timeout
+
+    def score(self, image_path, texts, timeout=None):
+        """
+        The softmax over texts of the frame's CLIP similarity to each one.
+
+        Returns None if the frame could not be scored within the timeout.
+        """
+        request = self.submit(image_path, texts)
+        if not request["done"].wait(self.request_timeout() if timeout is None else timeout):
+            return None
+        return request["result"]
+
+    def next_batch(self):
+        try:
+            batch = [self.requests.get(timeout=1)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                batch.append(self.requests.get(timeout=remaining) if remaining > 0
+                             else self.requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def run_batch(self, batch):
+        now = time.time()
+        live, images = [], []
+        for request in batch:
+            self.metrics["requests"] += 1
+            if now - request["queued"] > self.request_timeout():
+                self.metrics["expired"] += 1
+                request["done"].set()  # the caller has given up on it already
+                continue
+            try:
+                with Image.open(request["path"]) as image:
+                    images.append(image.convert("RGB"))
+                live.append(request)
+            except Exception as e:
+                self.metrics["failed"] += 1
+                logging.warning(f"CLIP could not read {request['path']}: {e}")
+                request["done"].set()
+        if not live:
+            return
+        try:
+            image_embeddings = self.model.image_embeddings(images)
+            self.metrics["batches"] += 1
+            for request, image_embedding in zip(live, image_embeddings):
+                logits = self.model.logit_scale * self.text_embeddings(request["texts"]) @ image_embedding
+                request["result"] = [float(p) for p in softmax(logits)]
+        except Exception as e:
+            self.metrics["failed"] += len(live)
+            logging.error(f"CLIP batch of {len(live)} failed: {e}")
+        finally:
+            for request in live:
+                request["done"].set()
+
+    def work(self):
+        while not self.stopped.is_set():
+            batch = self.next_batch()
+            if batch:
+                self.run_batch(batch)
+
+    def serve(self):
+        while not self.stopped.is_set():
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                if self.stopped.is_set():
+                    return
+                continue  # e.g. a client with the wrong authkey
+            threading.Thread(target=self.handle, args=(conn,), name="clip-client", daemon=True).start()
+
+    def handle(self, conn):
+        with conn:
+            while not self.stopped.is_set():
+                try:
+                    image_path, texts = conn.recv()
+                except (EOFError, OSError):
+                    return
+                conn.send(self.score(image_path, texts))
+
+    def start(self, address=("127.0.0.1", 0)):
+        """Start the batch worker and listen on address (an ephemeral localhost port by default)."""
+        if self.threads:
+            return self.address
+        self.stopped.clear()
+        self.listener = Listener(address, authkey=SECRET_KEY.encode())
+        self.address = self.listener.address
+        self.threads = [
+            threading.Thread(target=self.work, name="clip-batch", daemon=True),
+            threading.Thread(target=self.serve, name="clip-service", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        return self.address
+
+    def stop(self):
+        self.stopped.set()
+        if self.listener is not None:
+            try:
+                # wake accept() up so the serve thread sees the stop flag
+                Client(self.address, authkey=SECRET_KEY.encode()).close()
+            except Exception:
+                pass
+            self.listener.close()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.threads = []
+
+
+clip_service = None
+client_state = threading.local()
+
+
+def forget_clip_service():
+    """In a forked child: the service's threads stayed in the parent, so reach it over the socket."""
+    global clip_service, client_state
+    clip_service = None
+    client_state = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=forget_clip_service)
+
+
+def start_clip_service():
+    """Host the CLIP service in this process; capture workers forked or spawned later find it."""
+    global clip_service
+    if clip_service is None:
+        clip_service = ClipService()
+        host, port = clip_service.start()
+        os.environ[SERVICE_ENV] = f"{host}:{port}"
+        atexit.register(clip_service.stop)
+    return clip_service
+
+
+def service_address():
+    value = os.environ.get(SERVICE_ENV, "")
+    if ":" not in value:
+        return None
+    host, port = value.rsplit(":", 1)
+    return (host, int(port))
+
+
+def clip_scores(image_path, texts):
+    """
+    Score a frame against prompts using the host's CLIP service.
+
+    Returns a probability per prompt, or None if there is no service or it did
+    not answer within CLIP_TIMEOUT.
+    """
+    if clip_service is not None:
+        return clip_service.score(image_path, texts)
+    address = service_address()
+    if address is None:
+        logging.warning("No CLIP service is running; skipping the object filter")
+        return None
+    conn = getattr(client_state, "conn", None)
+    try:
+        if conn is None:
+            conn = client_state.conn = Client(address, authkey=SECRET_KEY.encode())
+        conn.send((os.path.abspath(image_path), list(texts)))
+        # a little extra for the round trip; past that the answer is not worth waiting for
+        if conn.poll(config.CLIP_TIMEOUT + 1):
+            return conn.recv()
+        logging.warning(f"CLIP service timed out scoring {image_path}")
+    except Exception as e:
+        logging.warning(f"CLIP service unavailable: {e}")
+    # drop the connection so a late answer cannot be read as the next frame's
+    client_state.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    return None
@@ -1,16 +1,90 @@
-from sqlalchemy import create_engine
+# app/utils/db.py
+#
+# The one database engine for the settings (app/config.py) and the templates.
+# It is set up here rather than from settings, since settings are read through it.
+
+import os
+import threading
+
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import Column, Integer, String, Text, Boolean, Float
 
-from app.config import DATABASE_PATH
-
+DATABASE_PATH = os.getenv("GLIMPSER_DATABASE_PATH", "data/glimpser.db")
 DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
 
-engine = create_engine(DATABASE_URL)
+# how long a connection waits for another process's write lock before "database is locked"
+BUSY_TIMEOUT = float(os.getenv("GLIMPSER_DATABASE_BUSY_TIMEOUT", 30))  # seconds
+# page cache per connection
+CACHE_SIZE = int(os.getenv("GLIMPSER_DATABASE_CACHE_SIZE", 8 * 1024))  # KiB
+
+# WAL lets readers (the web app) carry on while a capture worker writes, and
+# synchronous=NORMAL is durable in WAL mode except for the last commits on power loss
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={int(BUSY_TIMEOUT * 1000)}",
+    f"PRAGMA cache_size=-{CACHE_SIZE}",
+]
+
+
+def make_engine(url=DATABASE_URL, busy_timeout=BUSY_TIMEOUT):
+    """A SQLite engine with PRAGMAS set on every new connection, safe to keep across fork()."""
+    engine = create_engine(url, connect_args={"timeout": busy_timeout, "check_same_thread": False})
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in PRAGMAS:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    # a forked worker must not use its parent's pooled connections; it opens its own
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    return engine
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+db_ready = False
+db_ready_lock = threading.Lock()
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """Create and migrate the tables, once per process; later calls return at once."""
+    global db_ready
+    if db_ready:
+        return
+    with db_ready_lock:
+        if not db_ready:
+            Base.metadata.create_all(bind=engine)
+            migrate_db()
+            db_ready = True
+
+
+def migrate_db():
+    """create_all() never alters existing tables, so add any columns that are new to the models."""
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                default = column.default.arg if column.default is not None else None
+                if isinstance(default, (bool, int, float)):
+                    ddl += f" DEFAULT {int(default) if isinstance(default, bool) else default}"
+                elif isinstance(default, str):
+                    ddl += " DEFAULT '%s'" % default.replace("'", "''")
+                connection.execute(text(ddl))
@@ -1,35 +1,288 @@
 # app/utils/detect.py
 
+import functools
+import os
+import re
+import threading
+
 import numpy as np
 from PIL import Image
-from skimage.metrics import structural_similarity as ssim
+
+import app.config as config
+
+from .frames import sidecar_path
+
+# motion is measured on small grayscale thumbnails of each frame
+THUMBNAIL_SIZE = (100, 100)
+
+# SSIM parameters, the same as skimage.metrics.structural_similarity's defaults for uint8 input
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+# template motion_detector values: "" compares whole frames with SSIM, "grid" compares tiles
+MOTION_DETECTORS = ["", "grid"]
+
+# the last thumbnail this process saw per camera directory: (frame filename, thumbnail)
+last_thumbnails = {}
+last_thumbnails_lock = threading.Lock()
+
+
+def motion_thumbnail(image, size=THUMBNAIL_SIZE):
+    """The grayscale thumbnail motion is measured on, as a uint8 array."""
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    return np.asarray(image.resize(size).convert("L"), dtype=np.uint8)
 
 
-def calculate_difference_fast(image_path_a, image_path_b, downsample_size=(100, 100)):
+def window_sums(stack, w=SSIM_WINDOW):
+    """Sums over every w x w window that fits inside each image of an (..., height, width) int array."""
+    columns = np.cumsum(stack, axis=-2)
+    rows = columns[..., w - 1:, :].copy()
+    rows[..., 1:, :] -= columns[..., :-w, :]
+    sums = np.cumsum(rows, axis=-1)
+    windows = sums[..., w - 1:].copy()
+    windows[..., 1:] -= sums[..., :-w]
+    return windows
+
+
+def ssim_batch(images_a, images_b, chunk=8):
+    """
+    Mean SSIM of each pair of equally sized grayscale images, vectorized.
+
+    images_a and images_b are (n, height, width) uint8 arrays (or single images).
+    Window sums are exact integers from running sums over the 7x7 windows that fit
+    inside the image, which gives the same result as skimage's structural_similarity
+    with its defaults.  Pairs are scored chunk at a time so the working set stays
+    in cache.
+    """
+    a = np.asarray(images_a)
+    b = np.asarray(images_b)
+    if a.ndim == 2:
+        a, b = a[np.newaxis], b[np.newaxis]
+    if a.shape[-2] < SSIM_WINDOW or a.shape[-1] < SSIM_WINDOW:
+        raise ValueError(f"images must be at least {SSIM_WINDOW}x{SSIM_WINDOW} for SSIM")
+
+    n = SSIM_WINDOW * SSIM_WINDOW
+    # the SSIM terms scaled by n * n (means) and n * (n - 1) (sample variances) stay integers
+    c1 = SSIM_C1 * n * n
+    c2 = SSIM_C2 * n * (n - 1)
+    scores = []
+    for start in range(0, len(a), chunk):
+        x = a[start:start + chunk].astype(np.int32)
+        y = b[start:start + chunk].astype(np.int32)
+        sx, sy, sxx, syy, sxy = window_sums(np.stack([x, y, x * x, y * y, x * y])).astype(np.int64)
+        sxsy = sx * sy
+        means = sx * sx + sy * sy
+        s = ((2 * sxsy + c1) * (2 * (n * sxy - sxsy) + c2)) / ((means + c1) * (n * (sxx + syy) - means + c2))
+        scores.append(s.reshape(len(x), -1).mean(axis=1))
+    return np.concatenate(scores) if scores else np.zeros(0)
+
+
+def batch_differences(previous, current):
+    """Dissimilarity (1 - SSIM) for many cameras at once: two stacks of thumbnails, pairwise."""
+    return 1 - ssim_batch(previous, current)
+
+
+def calculate_difference_fast(image_path_a, image_path_b, downsample_size=THUMBNAIL_SIZE):
     """
     Calculate the difference between two images using the Structural Similarity Index (SSIM).
 
     Args:
-        image_path_a (str): The file path to the first image.
-        image_path_b (str): The file path to the second image.
+        image_path_a (str or PIL.Image): The file path to the first image, or the decoded image.
+        image_path_b (str or PIL.Image): The file path to the second image, or the decoded image.
         downsample_size (tuple): The new size for downsampling the images before comparison.
 
     Returns:
-        float: The SSIM index between the two downsampled images. Values closer to 0 indicate greater dissimilarity.
+        float: 1 - the SSIM index of the two downsampled images. Values closer to 0 indicate greater similarity.
+    """
+    try:
+        thumbnail_a = motion_thumbnail(image_path_a, downsample_size)
+        thumbnail_b = motion_thumbnail(image_path_b, downsample_size)
+        return float(batch_differences(thumbnail_a, thumbnail_b)[0])
+    except Exception as e:
+        # Handle exceptions (e.g., file not found, invalid image format)
+        print(f"Error: {e}")
+        return None
+
+
+def save_thumbnail(frame_path, thumbnail):
+    """Store a frame's motion thumbnail in its .npy sidecar and remember it as the camera's latest."""
+    path = sidecar_path(frame_path, "npy")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, thumbnail)
+    os.replace(tmp_path, path)
+    directory, filename = os.path.split(os.path.abspath(frame_path))
+    with last_thumbnails_lock:
+        last_thumbnails[directory] = (filename, thumbnail)
+    return path
+
+
+def load_thumbnail(frame_path):
     """
+    A frame's motion thumbnail without decoding the frame if at all possible.
+
+    Checks the camera's last thumbnail in memory, then the .npy sidecar; frames
+    from before sidecars existed are decoded once and get one written.
+    """
+    directory, filename = os.path.split(os.path.abspath(frame_path))
+    cached = last_thumbnails.get(directory)
+    if cached is not None and cached[0] == filename:
+        return cached[1]
     try:
-        # Open and resize the images
-        image_a = Image.open(image_path_a).resize(downsample_size).convert("L")
-        image_b = Image.open(image_path_b).resize(downsample_size).convert("L")
+        thumbnail = np.load(sidecar_path(frame_path, "npy"))
+        if thumbnail.shape == THUMBNAIL_SIZE[::-1]:
+            return thumbnail
+    except (OSError, ValueError):
+        pass
+    thumbnail = motion_thumbnail(frame_path)
+    try:
+        save_thumbnail(frame_path, thumbnail)
+    except OSError:
+        pass
+    return thumbnail
 
-        # Convert images to arrays
-        array_a = np.array(image_a)
-        array_b = np.array(image_b)
 
-        # Calculate SSIM
-        ssim_index, _ = ssim(array_a, array_b, full=True)
-        return 1 - ssim_index  # Convert to a dissimilarity measure
+def frame_difference(previous_path, thumbnail):
+    """1 - SSIM between a stored frame and a new frame's thumbnail, or None if it cannot be read."""
+    try:
+        return float(batch_differences(load_thumbnail(previous_path), thumbnail)[0])
     except Exception as e:
-        # Handle exceptions (e.g., file not found, invalid image format)
         print(f"Error: {e}")
         return None
+
+
+MASK_ENTRY = re.compile(r"^([+-]?)\s*([\d.]+)\s*,\s*([\d.]+)\s*,\s*([\d.]+)\s*,\s*([\d.]+)$")
+
+
+def parse_motion_mask(spec):
+    """
+    Parse a template's motion_mask into (include, (x1, y1, x2, y2)) rectangles.
+
+    Rectangles are in percent of the frame, separated by ";" or new lines.
+    A rectangle is ignored by motion detection, or with a leading "+" it is
+    watched; once there is any "+" rectangle only those areas are watched.
+    "90,0,100,8" ignores a clock in the top right corner.
+    """
+    rectangles = []
+    for entry in re.split(r"[;\n]", spec or ""):
+        entry = entry.strip()
+        if not entry:
+            continue
+        match = MASK_ENTRY.match(entry)
+        if match is None:
+            raise ValueError(f"motion mask entry {entry!r} is not x1,y1,x2,y2")
+        x1, y1, x2, y2 = (float(v) for v in match.groups()[1:])
+        if not (0 <= x1 < x2 <= 100 and 0 <= y1 < y2 <= 100):
+            raise ValueError(f"motion mask entry {entry!r} must be a rectangle within 0-100")
+        rectangles.append((match.group(1) == "+", (x1 / 100, y1 / 100, x2 / 100, y2 / 100)))
+    return rectangles
+
+
+@functools.lru_cache(maxsize=256)
+def motion_mask(spec, shape=THUMBNAIL_SIZE[::-1]):
+    """The watched pixels of a thumbnail as a read-only boolean array, or None when everything is watched."""
+    rectangles = parse_motion_mask(spec)
+    if not rectangles:
+        return None
+    height, width = shape
+    includes = [box for include, box in rectangles if include]
+    mask = np.zeros(shape, dtype=bool) if includes else np.ones(shape, dtype=bool)
+    for include, (x1, y1, x2, y2) in rectangles:
+        rows = slice(int(y1 * height), max(int(y1 * height) + 1, int(round(y2 * height))))
+        cols = slice(int(x1 * width), max(int(x1 * width) + 1, int(round(x2 * width))))
+        mask[rows, cols] = include
+    mask.setflags(write=False)
+    return mask
+
+
+def tile_changes(previous, current, mask=None, grid=None):
+    """
+    Mean absolute grey-level change per tile of a grid x grid split, vectorized.
+
+    previous and current are (..., height, width) uint8 thumbnails, so a stack of
+    cameras is done in one call.  Only watched pixels count; returns the per-tile
+    change and the fraction of each tile that is watched.  grid defaults to MOTION_GRID.
+    """
+    grid = grid or config.MOTION_GRID
+    difference = np.abs(np.asarray(current, dtype=np.int16) - np.asarray(previous, dtype=np.int16))
+    height, width = difference.shape[-2:]
+    rows = np.linspace(0, height, grid + 1).astype(int)[:-1]
+    cols = np.linspace(0, width, grid + 1).astype(int)[:-1]
+    watched = np.ones((height, width), dtype=np.int32) if mask is None else mask.astype(np.int32)
+    if mask is not None:
+        difference = difference * watched
+
+    def tile_sums(values):
+        return np.add.reduceat(np.add.reduceat(values, rows, axis=-2), cols, axis=-1)
+
+    pixels = tile_sums(watched)
+    sizes = np.diff(np.append(rows, height))[:, None] * np.diff(np.append(cols, width))[None, :]
+    changes = tile_sums(difference.astype(np.int32)) / np.maximum(pixels, 1)
+    return changes, pixels / sizes
+
+
+def motion_regions(moving):
+    """Bounding boxes (x1, y1, x2, y2 as fractions of the frame) of 8-connected groups of moving tiles, largest first."""
+    rows, cols = moving.shape
+    remaining = set(map(tuple, np.argwhere(moving).tolist()))
+    regions = []
+    while remaining:
+        stack = [remaining.pop()]
+        tiles = []
+        while stack:
+            r, c = stack.pop()
+            tiles.append((r, c))
+            for neighbour in ((r - 1, c - 1), (r - 1, c), (r - 1, c + 1), (r, c - 1),
+                              (r, c + 1), (r + 1, c - 1), (r + 1, c), (r + 1, c + 1)):
+                if neighbour in remaining:
+                    remaining.remove(neighbour)
+                    stack.append(neighbour)
+        r_values = [r for r, _ in tiles]
+        c_values = [c for _, c in tiles]
+        regions.append({
+            "box": (min(c_values) / cols, min(r_values) / rows, (max(c_values) + 1) / cols, (max(r_values) + 1) / rows),
+            "tiles": len(tiles),
+        })
+    return sorted(regions, key=lambda region: -region["tiles"])
+
+
+def grid_motion(previous, current, mask=None, grid=None, threshold=None):
+    """
+    Block-grid motion between two thumbnails.
+
+    Returns the fraction of watched tiles that changed by at least threshold grey
+    levels on average (MOTION_TILE_THRESHOLD by default), and the connected
+    regions of those tiles.  Tiles less than half watched are left out entirely.
+    """
+    if threshold is None:
+        threshold = config.MOTION_TILE_THRESHOLD
+    changes, watched = tile_changes(previous, current, mask, grid)
+    active = watched >= 0.5
+    moving = (changes >= threshold) & active
+    fraction = moving.sum() / max(active.sum(), 1)
+    return float(fraction), motion_regions(moving)
+
+
+def measure_motion(template, previous_path, thumbnail):
+    """
+    How much a new frame moved since the stored previous frame, for update_camera.
+
+    Returns (score, regions): score is compared with the template's motion setting.
+    The default detector scores 1 - SSIM of the whole frame; "grid" scores the
+    fraction of moving tiles and also finds the regions that moved.  Pixels the
+    template's motion_mask ignores never count in either.  Returns (None, [])
+    when the previous frame cannot be read.
+    """
+    try:
+        previous = load_thumbnail(previous_path)
+        mask = motion_mask(template.get("motion_mask") or "")
+        if template.get("motion_detector") == "grid":
+            return grid_motion(previous, thumbnail, mask)
+        if mask is not None:
+            thumbnail = np.where(mask, thumbnail, previous)
+        return float(batch_differences(previous, thumbnail)[0]), []
+    except Exception as e:
+        print(f"Error: {e}")
+        return None, []
@@ -1,25 +1,16 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from app.config import (
-    EMAIL_ENABLED,
-    EMAIL_SENDER,
-    EMAIL_RECIPIENTS,
-    EMAIL_SMTP_SERVER,
-    EMAIL_SMTP_PORT,
-    EMAIL_USE_TLS,
-    EMAIL_USERNAME,
-    EMAIL_PASSWORD,
-)
+import app.config as config
 
 
 def send_email_alert(subject, body):
-    if not EMAIL_ENABLED.lower() == "true":
+    if not config.EMAIL_ENABLED.lower() == "true":
         print("Email alerts are disabled.")
         return
 
-    sender_email = EMAIL_SENDER
-    receiver_emails = EMAIL_RECIPIENTS.split(",")
+    sender_email = config.EMAIL_SENDER
+    receiver_emails = config.EMAIL_RECIPIENTS.split(",")
 
     message = MIMEMultipart()
     message["From"] = sender_email
@@ -29,10 +20,10 @@ def send_email_alert(subject, body):
     message.attach(MIMEText(body, "plain"))
 
     try:
-        with smtplib.SMTP(EMAIL_SMTP_SERVER, int(EMAIL_SMTP_PORT)) as server:
-            if EMAIL_USE_TLS.lower() == "true":
+        with smtplib.SMTP(config.EMAIL_SMTP_SERVER, int(config.EMAIL_SMTP_PORT)) as server:
+            if config.EMAIL_USE_TLS.lower() == "true":
                 server.starttls()
-            server.login(EMAIL_USERNAME, EMAIL_PASSWORD)
+            server.login(config.EMAIL_USERNAME, config.EMAIL_PASSWORD)
             server.sendmail(sender_email, receiver_emails, message.as_string())
         print("Email alert sent successfully")
     except Exception as e:
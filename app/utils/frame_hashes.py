@@ -0,0 +1,236 @@
+# app/utils/frame_hashes.py
+
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+import app.config as config
+from app.config import SCREENSHOT_DIRECTORY
+
+from .frames import frame_key, is_frame_file, loaded_frame_index
+
+# per camera directory: one "<frame filename> <16 hex digit dHash>" line per frame, appended at capture
+HASH_FILE = ".hashes"
+
+# numpy 2 counts set bits natively; older releases look them up per byte
+BITWISE_COUNT = getattr(np, "bitwise_count", None)
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(image):
+    """
+    The 64-bit difference hash of a frame (PIL image or grayscale array).
+
+    Each bit says whether a pixel of the 9x8 grayscale reduction is brighter
+    than its right-hand neighbour, so it survives rescaling and re-encoding.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(np.asarray(image, dtype=np.uint8))
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def popcount(values):
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if BITWISE_COUNT is not None:
+        return BITWISE_COUNT(values).astype(np.int64)
+    return POPCOUNT[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.int64)
+
+
+def hamming(hashes, value):
+    """Hamming distance from value to each hash of a packed uint64 array."""
+    return popcount(np.asarray(hashes, dtype=np.uint64) ^ np.uint64(value))
+
+
+def duplicate_mask(hashes, max_distance=None):
+    """
+    True for each frame that is a near-duplicate of the one before it.
+
+    hashes are in time order; the first frame is never a duplicate.  This is the
+    dedup primitive for callers that walk a camera's frames (archiver, retention).
+    max_distance defaults to FRAME_HASH_DISTANCE.
+    """
+    if max_distance is None:
+        max_distance = config.FRAME_HASH_DISTANCE
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    mask = np.zeros(len(hashes), dtype=bool)
+    if len(hashes) > 1:
+        mask[1:] = popcount(hashes[1:] ^ hashes[:-1]) <= max_distance
+    return mask
+
+
+class FrameHashes:
+    """
+    The dHash of every frame of one camera directory, as packed uint64 arrays.
+
+    Backed by the append-only HASH_FILE, so hashes written by capture workers in
+    other processes are picked up by reading whatever was appended since.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, HASH_FILE)
+        self.filenames = []
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.positions = {}
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        with self.lock:
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                size = 0
+            if size < self.offset:
+                # rewritten by prune_frame_hashes
+                self.filenames, self.hashes, self.positions, self.offset = [], np.zeros(0, dtype=np.uint64), {}, 0
+            if size == self.offset:
+                return self
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read(size - self.offset)
+            complete = data.rfind(b"\n") + 1  # leave a half-written last line for next time
+            self.offset += complete
+            names, values = [], []
+            for line in data[:complete].decode("utf-8", "replace").splitlines():
+                try:
+                    name, value = line.split()
+                    value = int(value, 16)
+                except ValueError:
+                    continue
+                names.append(name)
+                values.append(value)
+            self._extend(names, values)
+        return self
+
+    def _extend(self, names, values):
+        new = []
+        for name, value in zip(names, values):
+            position = self.positions.get(name)
+            if position is not None and position < len(self.hashes):
+                self.hashes[position] = value  # a frame rehashed, e.g. rewritten in place
+                continue
+            if position is None:
+                self.positions[name] = len(self.filenames)
+                self.filenames.append(name)
+                new.append(value)
+            else:
+                new[position - len(self.hashes)] = value
+        self.hashes = np.concatenate([self.hashes, np.array(new, dtype=np.uint64)])
+
+    def add(self, filename, value):
+        line = f"{filename} {value:016x}\n".encode()
+        with self.lock:
+            with open(self.path, "ab") as f:
+                f.write(line)
+        self.refresh()
+
+    def hash_of(self, filename):
+        with self.lock:
+            position = self.positions.get(filename)
+            return None if position is None else int(self.hashes[position])
+
+    def similar(self, value, max_distance=None, limit=20):
+        """(filename, distance) of the frames within max_distance bits of value, closest and then newest first."""
+        if max_distance is None:
+            max_distance = config.FRAME_HASH_DISTANCE
+        with self.lock:
+            distances = hamming(self.hashes, value)
+            matches = np.nonzero(distances <= max_distance)[0]
+            order = matches[np.lexsort((-matches, distances[matches]))][:limit]
+            return [(self.filenames[i], int(distances[i])) for i in order]
+
+
+frame_hashes = {}
+frame_hashes_lock = threading.Lock()
+
+
+def get_frame_hashes(directory):
+    directory = os.path.abspath(directory)
+    with frame_hashes_lock:
+        hashes = frame_hashes.get(directory)
+        if hashes is None:
+            hashes = frame_hashes[directory] = FrameHashes(directory)
+    return hashes.refresh()
+
+
+def record_frame_hash(frame_path, value):
+    """Add a newly captured frame's hash to its camera's index."""
+    directory, filename = os.path.split(os.path.abspath(frame_path))
+    get_frame_hashes(directory).add(filename, value)
+    index = loaded_frame_index(frame_path)
+    if index is not None:
+        index.mark(filename, dhash=value)
+
+
+def similar_frames(value, cameras=None, max_distance=None, limit=20):
+    """
+    Frames like this one, across cameras (all of them by default).
+
+    Returns [(camera, filename, distance)], closest first.
+    """
+    if cameras is None:
+        try:
+            cameras = [c for c in os.listdir(SCREENSHOT_DIRECTORY)
+                       if os.path.isdir(os.path.join(SCREENSHOT_DIRECTORY, c))]
+        except OSError:
+            cameras = []
+    matches = []
+    for camera in cameras:
+        directory = os.path.join(SCREENSHOT_DIRECTORY, camera)
+        for filename, distance in get_frame_hashes(directory).similar(value, max_distance, limit):
+            matches.append((camera, filename, distance))
+    matches.sort(key=lambda match: frame_key(match[1]) or "", reverse=True)
+    matches.sort(key=lambda match: match[2])
+    return matches[:limit]
+
+
+def dedupe_frames(directory, filenames, max_distance=None):
+    """
+    filenames (in time order) without the frames that are near-duplicates of the one before.
+
+    Frames without a recorded hash are always kept.
+    """
+    hashes = get_frame_hashes(directory)
+    known = [(f, hashes.hash_of(os.path.basename(f))) for f in filenames]
+    keep, run = [], []
+
+    def flush():
+        if run:
+            mask = duplicate_mask([value for _, value in run], max_distance)
+            keep.extend(f for (f, _), duplicate in zip(run, mask) if not duplicate)
+            run.clear()
+
+    for f, value in known:
+        if value is None:
+            flush()
+            keep.append(f)
+        else:
+            run.append((f, value))
+    flush()
+    return keep
+
+
+def prune_frame_hashes(directory):
+    """Rewrite a camera's HASH_FILE without the frames that have since been deleted."""
+    hashes = get_frame_hashes(directory)
+    with hashes.lock:
+        kept = [
+            (name, int(value))
+            for name, value in zip(hashes.filenames, hashes.hashes)
+            if is_frame_file(name) and os.path.exists(os.path.join(hashes.directory, name))
+        ]
+        if len(kept) == len(hashes.filenames):
+            return 0
+        tmp_path = f"{hashes.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{name} {value:016x}\n" for name, value in kept)
+        os.replace(tmp_path, hashes.path)
+        removed = len(hashes.filenames) - len(kept)
+        hashes.filenames, hashes.hashes, hashes.positions, hashes.offset = [], np.zeros(0, dtype=np.uint64), {}, 0
+    hashes.refresh()
+    return removed
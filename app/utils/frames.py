@@ -0,0 +1,481 @@
+# app/utils/frames.py
+
+import bisect
+import calendar
+import datetime
+import functools
+import hashlib
+import os
+import re
+import threading
+import time
+
+from PIL import Image, ImageFont
+
+import app.config as config
+
+FONT_NAMES = ["Arial.ttf", "LiberationSans-Regular.ttf"]
+
+# storage formats for captured frames: extension -> PIL format
+FRAME_FORMATS = {"png": "PNG", "webp": "WEBP", "jpg": "JPEG"}
+FRAME_EXTENSIONS = tuple("." + extension for extension in FRAME_FORMATS)
+FRAME_MIMETYPES = {"png": "image/png", "webp": "image/webp", "jpg": "image/jpeg"}
+
+
+def frame_extension(template=None):
+    """The extension new frames are stored with: the template's frame_format, else FRAME_FORMAT."""
+    extension = ((template or {}).get("frame_format") or config.FRAME_FORMAT or "png").lower().lstrip(".")
+    if extension == "jpeg":
+        extension = "jpg"
+    return extension if extension in FRAME_FORMATS else "png"
+
+
+def is_frame_file(filename):
+    """True for stored frames of any format; skips in-flight .tmp files and hidden write targets."""
+    filename = os.path.basename(filename)
+    return filename.endswith(FRAME_EXTENSIONS) and not filename.startswith(".") and ".tmp" not in filename
+
+
+def list_frames(directory):
+    """
+    The frames in a camera directory, oldest first.
+
+    The latest_camera/last_motion style symlinks are left out; they only point at frames.
+    Frames sort by the capture time in their names, since repeated frames are hard
+    links that share one mtime (see repeat_frame).
+    """
+    try:
+        frames = [
+            f
+            for f in os.listdir(directory)
+            if is_frame_file(f) and not os.path.islink(os.path.join(directory, f))
+        ]
+        return sorted(frames, key=lambda f: (frame_key(f) or "", os.path.getmtime(os.path.join(directory, f))))
+    except OSError:
+        return []  # the directory, or a frame in it, went away underneath us
+
+
+def frame_mimetype(path):
+    """The content type of a frame, looking through symlinks such as latest_camera.png."""
+    extension = os.path.splitext(os.path.realpath(path))[1].lstrip(".").lower()
+    return FRAME_MIMETYPES.get(extension, "image/png")
+
+
+def frame_save_options(extension):
+    """PIL save options for a frame format, from the current FRAME_QUALITY/PNG_COMPRESS_LEVEL."""
+    if extension == "png":
+        return {"compress_level": config.PNG_COMPRESS_LEVEL}
+    if extension == "webp":
+        return {"lossless": True, "method": 0}
+    if extension == "jpg":
+        return {"quality": config.FRAME_QUALITY}
+    return {}
+
+
+def write_frame(image, output_path, format=None):
+    """
+    Encode a frame once and move it into place atomically.
+
+    The format follows output_path's extension (see FRAME_FORMATS), falling back to
+    PNG.  The frame is written to a hidden temporary file next to output_path and then
+    renamed over it, so the archiver, the web routes and the latest_camera symlinks
+    never see a half-written image.  Returns output_path.
+    """
+    directory, filename = os.path.split(output_path)
+    extension = os.path.splitext(filename)[1].lstrip(".").lower()
+    if extension not in FRAME_FORMATS:
+        extension = "png"
+    pil_format, options = FRAME_FORMATS[extension], frame_save_options(extension)
+    if format is not None and format.upper() != pil_format:
+        pil_format, options = format, {}
+    tmp_path = os.path.join(directory, f".{filename}.{os.getpid()}.tmp")
+    try:
+        image.save(tmp_path, pil_format, **options)
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    note_frame_written(output_path)
+    return output_path
+
+
+@functools.lru_cache(maxsize=64)
+def load_font(font_size):
+    """The overlay font at a given size, looked up on disk once per size."""
+    for font_name in FONT_NAMES:
+        try:
+            return ImageFont.truetype(font_name, font_size)
+        except IOError:
+            continue
+    return ImageFont.load_default()
+
+
+@functools.lru_cache(maxsize=1024)
+def label_background(text_w, font_size):
+    """The 25% opaque black box drawn behind a label of this width and font size."""
+    return Image.new("RGBA", (text_w + 20, font_size + 10), (0, 0, 0, 64))
+
+
+def paste_label_background(image, text_w, font_size, x, y):
+    background = label_background(text_w, font_size)
+    image.paste(background, (x - 10, y - 5), background)
+
+
+# capture frames are named <camera>_<YYYYmmddHHMMSS>.<ext>, in UTC
+FRAME_TIME_PATTERN = re.compile(r"_(\d{14})\.[a-z]+$")
+
+
+def frame_key(filename):
+    """The sortable timestamp of a capture frame's filename, or None for anything else."""
+    if not is_frame_file(filename):
+        return None
+    match = FRAME_TIME_PATTERN.search(filename)
+    return match.group(1) if match else None
+
+
+def frame_time(path):
+    """
+    When a frame was captured, from the UTC time in its name (its ctime for other names).
+
+    Repeated frames are hard links to an earlier one, and linking changes the ctime
+    of every name of the file, so ctime alone would pull old frames back in.
+    """
+    key = frame_key(path)
+    if key is None:
+        return os.path.getctime(path)
+    return calendar.timegm(time.strptime(key, "%Y%m%d%H%M%S"))
+
+
+# hidden file in an indexed camera directory whose mtime changes whenever a frame
+# is stored or deleted; sidecars, .hashes and symlinks leave it alone.  Created by
+# the first FrameIndex built for the directory, in any process.
+FRAMES_STAMP = ".frames"
+
+
+def frames_stamp(directory):
+    """The mtime of a camera directory's FRAMES_STAMP, or None before any frame was written."""
+    try:
+        return os.stat(os.path.join(directory, FRAMES_STAMP)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def touch_frames_stamp(directory):
+    """Bump FRAMES_STAMP, if the directory has one; returns its mtime before and after."""
+    before = frames_stamp(directory)
+    if before is None:
+        return None, None  # no index has been built for this directory yet
+    try:
+        os.utime(os.path.join(directory, FRAMES_STAMP))
+    except OSError:
+        return before, None
+    return before, frames_stamp(directory)
+
+
+class FrameIndex:
+    """
+    The capture frames of one camera directory, sorted by the time in their names.
+
+    Kept up to date by write_frame, repeat_frame and forget_frame in this process,
+    which insert or remove the one frame they touched.  Those also bump the
+    directory's FRAMES_STAMP, so a frame stored or deleted by another process makes
+    the next lookup here rebuild with a single listdir; other files (sidecars,
+    .hashes, symlinks) never do.  A full rebuild also happens every
+    FRAME_INDEX_MAX_AGE seconds as a fallback for frames changed some other way.
+    Lookups are O(log n) and check that the frame they return still exists.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.keys = []
+        self.entries = []
+        self.stamp = None
+        self.built = 0
+        self.lock = threading.RLock()
+
+    def rebuild(self):
+        with self.lock:
+            stamp_path = os.path.join(self.directory, FRAMES_STAMP)
+            if not os.path.exists(stamp_path) and os.path.isdir(self.directory):
+                try:
+                    open(stamp_path, "a").close()
+                except OSError:
+                    pass
+            # read before listing, so a frame stored meanwhile shows up now or at the next refresh
+            self.stamp = frames_stamp(self.directory)
+            self.built = time.time()
+            entries = []
+            try:
+                for filename in os.listdir(self.directory):
+                    key = frame_key(filename)
+                    if key is not None:
+                        entries.append((key, {"filename": filename, "size": None}))
+            except OSError:
+                pass
+            entries.sort(key=lambda entry: entry[0])
+            self.keys = [key for key, _ in entries]
+            self.entries = [entry for _, entry in entries]
+
+    def refresh(self):
+        """Rebuild if another process stored or deleted a frame, or the index is old."""
+        with self.lock:
+            if not self.built or self.stamp != frames_stamp(self.directory) or (
+                time.time() - self.built > config.FRAME_INDEX_MAX_AGE
+            ):
+                self.rebuild()
+        return self
+
+    def settle(self, before, after):
+        """
+        Record a FRAMES_STAMP bump for a change this process already applied.
+
+        Only when the stamp was where this index last saw it; otherwise another
+        process changed frames in between and the next refresh has to rebuild.
+        """
+        with self.lock:
+            if self.built and self.stamp == before:
+                self.stamp = after
+
+    def add(self, filename, size=None, **flags):
+        key = frame_key(filename)
+        if key is None:
+            return
+        entry = {"filename": filename, "size": size, **flags}
+        with self.lock:
+            i = bisect.bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                self.entries[i] = entry
+            else:
+                self.keys.insert(i, key)
+                self.entries.insert(i, entry)
+
+    def remove(self, filename):
+        key = frame_key(filename)
+        with self.lock:
+            i = bisect.bisect_left(self.keys, key) if key is not None else len(self.keys)
+            if i < len(self.keys) and self.entries[i]["filename"] == filename:
+                del self.keys[i]
+                del self.entries[i]
+
+    def mark(self, filename, **flags):
+        """Attach flags (motion, hashes, ...) to a frame already in the index."""
+        key = frame_key(filename)
+        with self.lock:
+            i = bisect.bisect_left(self.keys, key) if key is not None else len(self.keys)
+            if i < len(self.keys) and self.entries[i]["filename"] == filename:
+                self.entries[i].update(flags)
+
+    def _existing(self, i, step):
+        """Walk from position i in direction step to the first frame still on disk."""
+        with self.lock:
+            while 0 <= i < len(self.entries):
+                entry = self.entries[i]
+                if os.path.exists(os.path.join(self.directory, entry["filename"])):
+                    return entry
+                del self.keys[i]
+                del self.entries[i]
+                if step < 0:
+                    i -= 1
+            return None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def filenames(self):
+        with self.lock:
+            return [entry["filename"] for entry in self.entries]
+
+    def latest(self):
+        with self.lock:
+            return self._existing(len(self.entries) - 1, -1)
+
+    def previous(self, filename=None):
+        """The frame before filename (default: before the latest)."""
+        with self.lock:
+            if filename is None:
+                latest = self.latest()
+                if latest is None:
+                    return None
+                filename = latest["filename"]
+            i = bisect.bisect_left(self.keys, frame_key(filename) or "")
+            return self._existing(i - 1, -1)
+
+    def closest(self, when, before=True):
+        """The frame nearest to a UTC datetime; with before, the last one not after it."""
+        key = when.strftime("%Y%m%d%H%M%S")
+        with self.lock:
+            i = bisect.bisect_right(self.keys, key)
+            earlier = self._existing(i - 1, -1)
+            if before:
+                return earlier
+            i = bisect.bisect_right(self.keys, key)
+            later = self._existing(i, 1)
+            if earlier is None or later is None:
+                return earlier or later
+
+            def distance(entry):
+                taken = datetime.datetime.strptime(frame_key(entry["filename"]), "%Y%m%d%H%M%S")
+                return abs(taken - when)
+            return min(earlier, later, key=distance)
+
+
+frame_indexes = {}
+frame_indexes_lock = threading.Lock()
+
+
+def get_frame_index(directory):
+    """The (refreshed) frame index of a camera directory, built on first use."""
+    directory = os.path.abspath(directory)
+    with frame_indexes_lock:
+        index = frame_indexes.get(directory)
+        if index is None:
+            index = frame_indexes[directory] = FrameIndex(directory)
+    return index.refresh()
+
+
+def loaded_frame_index(path):
+    """The index covering path's directory, if this process has one loaded."""
+    return frame_indexes.get(os.path.dirname(os.path.abspath(path)))
+
+
+def note_frame_written(path, **flags):
+    """Insert a newly stored frame into this process's index and tell other processes about it."""
+    index = loaded_frame_index(path)
+    if index is None:
+        touch_frames_stamp(os.path.dirname(os.path.abspath(path)))
+        return
+    with index.lock:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        index.add(os.path.basename(path), size=size, **flags)
+        index.settle(*touch_frames_stamp(index.directory))
+
+
+# hidden file in each camera directory: "<digest> <frame>" for the last source image
+# stored and the frame it is stored as.  On disk, so a camera's captures compare
+# against each other whichever worker process runs them.
+CONTENT_FILE = ".content"
+
+
+def content_digest(image):
+    """A digest of a decoded source image, taken before the name and time are stamped on it."""
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+    digest.update(f"{image.mode} {image.size}".encode())
+    return digest.hexdigest()
+
+
+def remember_content(output_path, digest):
+    directory, filename = os.path.split(os.path.abspath(output_path))
+    path = os.path.join(directory, CONTENT_FILE)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(f"{digest} {filename}\n")
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def last_content(directory):
+    """(digest, frame) of the camera's last stored source image, or None."""
+    try:
+        with open(os.path.join(directory, CONTENT_FILE)) as f:
+            digest, filename = f.read().split()
+    except (OSError, ValueError):
+        return None
+    return digest, filename
+
+
+def repeat_frame(output_path, digest):
+    """
+    Store output_path as a hard link to the camera's previous frame if it came from the same source image.
+
+    Static dashboards and offline cameras send the same picture for hours; linking
+    it in keeps a frame at every capture time for the video timeline, and a fresh
+    mtime for last_screenshot_time, without encoding or storing it again.  The index
+    entry gets repeat_of so update_camera can skip motion and captioning.  Returns
+    False, having written nothing, when the frame has to be written normally.
+    """
+    if not config.SKIP_UNCHANGED_FRAMES:
+        return False
+    previous = last_content(os.path.dirname(os.path.abspath(output_path)))
+    if previous is None or previous[0] != digest:
+        return False
+    return link_previous_frame(output_path, previous)
+
+
+def repeat_last_frame(output_path):
+    """
+    Store output_path as a hard link to the camera's previous frame, for a camera that answered 304 Not Modified.
+
+    There is no picture to compare, but the camera vouches for it, so the capture
+    still leaves a frame on the timeline and a fresh mtime, as repeat_frame does.
+    Returns False when there is no previous frame to link.
+    """
+    previous = last_content(os.path.dirname(os.path.abspath(output_path)))
+    if previous is None:
+        return False
+    return link_previous_frame(output_path, previous)
+
+
+def link_previous_frame(output_path, previous):
+    """Hard link the frame named in previous, a last_content() pair, in at output_path."""
+    directory, filename = os.path.split(os.path.abspath(output_path))
+    digest = previous[0]
+    if previous[1] == filename:
+        return False
+    if os.path.splitext(previous[1])[1] != os.path.splitext(filename)[1]:
+        return False  # FRAME_FORMAT changed
+    tmp_path = os.path.join(directory, f".{filename}.{os.getpid()}.tmp")
+    try:
+        os.link(os.path.join(directory, previous[1]), tmp_path)
+        os.replace(tmp_path, output_path)
+        os.utime(output_path)
+    except OSError:
+        # previous frame deleted, too many links, or no hard links on this filesystem
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        return False
+    remember_content(output_path, digest)
+    note_frame_written(output_path, repeat_of=previous[1])
+    return True
+
+
+# per-frame data kept beside each frame: motion thumbnails (see detect.py)
+SIDECAR_EXTENSIONS = ["npy"]
+
+
+def sidecar_path(path, extension):
+    """The hidden file beside a frame that holds its extra data, e.g. .cam_20240101120000.png.npy"""
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f".{filename}.{extension}")
+
+
+def forget_frame(path):
+    """Delete a frame, and whatever sidecars it has, from disk and from the index."""
+    os.remove(path)
+    for extension in SIDECAR_EXTENSIONS:
+        try:
+            os.remove(sidecar_path(path, extension))
+        except OSError:
+            pass
+    index = loaded_frame_index(path)
+    if index is None:
+        touch_frames_stamp(os.path.dirname(os.path.abspath(path)))
+        return
+    with index.lock:
+        index.remove(os.path.basename(path))
+        index.settle(*touch_frames_stamp(index.directory))
+
+
+def link_frame(target, link_path):
+    """Atomically point a symlink such as latest_camera.png at a frame."""
+    tmp_path = link_path + ".tmp"
+    if os.path.lexists(tmp_path):
+        os.unlink(tmp_path)
+    os.symlink(target, tmp_path)
+    os.rename(tmp_path, link_path)
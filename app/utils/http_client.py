@@ -0,0 +1,147 @@
+# app/utils/http_client.py
+
+import json
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import app.config as config
+
+sessions = {}
+sessions_lock = threading.Lock()
+
+# auth objects are reused so a negotiated Digest nonce carries over to the next request
+auths = {}
+
+# per camera directory: url -> the ETag/Last-Modified of the frame last stored from it.
+# On disk, so they hold whichever capture worker process (or restart) asks next.
+VALIDATORS_FILE = ".validators"
+
+
+def host_key(url):
+    parsed = urlparse(url)
+    return (parsed.scheme, parsed.hostname, parsed.port)
+
+
+def get_session(url):
+    """One keep-alive requests.Session per host, so repeat captures skip the TCP/TLS handshake."""
+    key = host_key(url)
+    with sessions_lock:
+        session = sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            session.verify = False
+            session.headers["user-agent"] = config.UA
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            sessions[key] = session
+        return session
+
+
+def url_credentials(url):
+    match = re.findall(r"\/\/([^\:]+?)\:([^\@]+?)\@", url)
+    return match[0] if match else None
+
+
+def get_auth(url):
+    """Return the auth that last worked for this host and user, starting with Basic."""
+    credentials = url_credentials(url)
+    if credentials is None:
+        return None
+    key = (host_key(url), credentials)
+    auth = auths.get(key)
+    if auth is None:
+        auth = auths[key] = requests.auth.HTTPBasicAuth(*credentials)
+    return auth
+
+
+def upgrade_auth(url):
+    """The camera turned Basic down; switch this host and user to Digest for good."""
+    credentials = url_credentials(url)
+    key = (host_key(url), credentials)
+    auth = auths[key] = requests.auth.HTTPDigestAuth(*credentials)
+    return auth
+
+
+def request(method, url, timeout=30, headers=None, **kwargs):
+    """Issue a request on the host's pooled session, negotiating Basic/Digest auth once."""
+    session = get_session(url)
+    auth = get_auth(url)
+    kwargs.setdefault("allow_redirects", True)
+    response = session.request(method, url, timeout=timeout, headers=headers, auth=auth, **kwargs)
+    if response.status_code == 401 and auth is not None and not isinstance(auth, requests.auth.HTTPDigestAuth):
+        response.close()
+        auth = upgrade_auth(url)
+        response = session.request(method, url, timeout=timeout, headers=headers, auth=auth, **kwargs)
+    return response
+
+
+def validators_path(frame_path):
+    return os.path.join(os.path.dirname(os.path.abspath(frame_path)), VALIDATORS_FILE)
+
+
+def read_validators(frame_path):
+    try:
+        with open(validators_path(frame_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_validators(frame_path, stored):
+    path = validators_path(frame_path)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(stored, f)
+    os.replace(tmp_path, path)
+
+
+def stored_validators(url, frame_path):
+    """(etag, last_modified) of the frame last stored from url next to frame_path, while that frame exists."""
+    entry = read_validators(frame_path).get(url)
+    if not entry:
+        return None, None
+    frame = os.path.join(os.path.dirname(os.path.abspath(frame_path)), entry.get("frame", ""))
+    if not entry.get("frame") or not os.path.exists(frame):
+        return None, None  # deleted by retention: a 304 would leave us without it
+    return entry.get("etag"), entry.get("last_modified")
+
+
+def conditional_get(url, timeout=30, frame_path=None, **kwargs):
+    """
+    GET that sends If-None-Match/If-Modified-Since from the last stored response, if any.
+
+    frame_path is where this response's frame will be stored; the validators are
+    kept in its camera directory (see remember_validators).  Without it the GET is
+    unconditional.
+    """
+    headers = {}
+    etag, last_modified = stored_validators(url, frame_path) if frame_path else (None, None)
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return request("GET", url, timeout=timeout, headers=headers, **kwargs)
+
+
+def remember_validators(url, response, frame_path):
+    """Call once the response body has been stored at frame_path, so a 304 really means we have the frame."""
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    stored = read_validators(frame_path)
+    if etag or last_modified:
+        stored[url] = {"etag": etag, "last_modified": last_modified, "frame": os.path.basename(frame_path)}
+    elif stored.pop(url, None) is None:
+        return
+    write_validators(frame_path, stored)
+
+
+def forget_validators(url, frame_path):
+    stored = read_validators(frame_path)
+    if stored.pop(url, None) is not None:
+        write_validators(frame_path, stored)
@@ -8,13 +8,13 @@ import os
 import requests
 from PIL import Image
 
-from app.config import CHATGPT_KEY, LLM_CAPTION_PROMPT, LLM_MODEL_VERSION
+import app.config as config
 
 last_429_error_time = None
 
 class ChatGPTImageComparison:
     def __init__(self):
-        self.api_key = CHATGPT_KEY
+        self.api_key = config.CHATGPT_KEY
         self.headers = {"Authorization": f"Bearer {self.api_key}"}
         self.url = "https://api.openai.com/v1/chat/completions"
 
@@ -38,7 +38,7 @@ class ChatGPTImageComparison:
         messages = [
             {
                 "role": "system",
-                "content": [{"type": "text", "text": LLM_CAPTION_PROMPT}],
+                "content": [{"type": "text", "text": config.LLM_CAPTION_PROMPT}],
             }
         ]
         messages.append({"role": "user", "content": [{"type": "text", "text": prompt}]})
@@ -72,7 +72,7 @@ class ChatGPTImageComparison:
 
         # Construct the payload with the prompt and images
         payload = {
-            "model": LLM_MODEL_VERSION,
+            "model": config.LLM_MODEL_VERSION,
             "messages": messages,
             "max_tokens": tokens,  # might even be less
         }
@@ -120,7 +120,7 @@ def chatgpt_compare(image_paths, prompt):
             return "Missing image"
 
     # Use the ChatGPT API for comparison
-    if len(CHATGPT_KEY) < 1:
+    if len(config.CHATGPT_KEY) < 1:
         return "Missing ChatGPT key"
 
     chatgpt_comparison = ChatGPTImageComparison()
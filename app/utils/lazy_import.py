@@ -0,0 +1,46 @@
+# app/utils/lazy_import.py
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Stands in for a module until one of its attributes is first used, then imports it.
+
+    For the heavy capture backends (selenium, yt-dlp) that most processes never
+    touch.  Attributes are read from and set on the real module, so patching
+    through the stand-in works as it would on the module itself.
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_module", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    module = importlib.import_module(self._name)
+                    object.__setattr__(self, "_module", module)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
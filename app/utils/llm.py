@@ -7,7 +7,7 @@ import time
 
 import requests
 
-from app.config import CHATGPT_KEY, LLM_MODEL_VERSION, LLM_SUMMARY_PROMPT
+import app.config as config
 from app.utils.email_alerts import email_alert
 
 last_429_error_time = None
@@ -37,20 +37,20 @@ def summarize(prompt, history=None, tokens=4096):
     ) < datetime.timedelta(minutes=15):
         return None
 
-    if CHATGPT_KEY is None or len(CHATGPT_KEY) < 1 or len(CHATGPT_KEY) > 128:
+    if config.CHATGPT_KEY is None or len(config.CHATGPT_KEY) < 1 or len(config.CHATGPT_KEY) > 128:
         return None
-    if LLM_MODEL_VERSION is None or len(LLM_MODEL_VERSION) < 1:
+    if config.LLM_MODEL_VERSION is None or len(config.LLM_MODEL_VERSION) < 1:
         return None
-    if LLM_SUMMARY_PROMPT is None or len(LLM_SUMMARY_PROMPT) < 1:
+    if config.LLM_SUMMARY_PROMPT is None or len(config.LLM_SUMMARY_PROMPT) < 1:
         return None
 
     # note - if history is None or [], there isnt much to do ..
 
-    headers = {"Authorization": f"Bearer {CHATGPT_KEY}"}
+    headers = {"Authorization": f"Bearer {config.CHATGPT_KEY}"}
     url = "https://api.openai.com/v1/chat/completions"
 
     # Prepare the summary prompt
-    lsummary_prompt = LLM_SUMMARY_PROMPT.replace("$datetime", str(datetime.datetime.now()))
+    lsummary_prompt = config.LLM_SUMMARY_PROMPT.replace("$datetime", str(datetime.datetime.now()))
 
     # Construct the messages for the API request
     messages = [
@@ -68,7 +68,7 @@ def summarize(prompt, history=None, tokens=4096):
 
     # Prepare the payload for the API request
     payload = {
-        "model": LLM_MODEL_VERSION,
+        "model": config.LLM_MODEL_VERSION,
         "messages": messages,
         "max_tokens": tokens,
     }
@@ -4,26 +4,29 @@ import os
 import time
 import logging
 
+import app.config as config
 from app.config import (
-    MAX_COMPRESSED_VIDEO_AGE,
-    MAX_RAW_DATA_SIZE,
     SCREENSHOT_DIRECTORY,
     VIDEO_DIRECTORY,
 )
 
+from .frame_hashes import prune_frame_hashes
+from .frames import forget_frame, frame_time
+
 
 def get_files_sorted_by_creation_time(directory):
     if not os.path.isdir(directory):
         return []
 
-    # Get all files with their full path and sort them by creation time in ascending order
+    # Get all files with their full path and sort them by capture time in ascending order
+    # (hidden files are per-frame sidecars and the hash index, which go with their frames)
     try:
         files = [
             os.path.join(directory, f)
             for f in os.listdir(directory)
-            if not os.path.islink(os.path.join(directory, f))
+            if not f.startswith(".") and not os.path.islink(os.path.join(directory, f))
         ]
-        files.sort(key=lambda x: os.path.getctime(x))
+        files.sort(key=frame_time)
     except Exception as e:
         print("Warning: file sort error", e)
         return []
@@ -33,6 +36,7 @@ def get_files_sorted_by_creation_time(directory):
 def delete_old_files(file_list, max_age, max_size, minimum=10):
     current_time = time.time()
     total_size = 0
+    seen = set()
 
     # sort the list so we keep it in the right date order (it should already be sorted)
     file_list = sorted(file_list, reverse=True)[minimum:]
@@ -48,14 +52,18 @@ def delete_old_files(file_list, max_age, max_size, minimum=10):
             continue
 
         try:
-            file_age = current_time - os.path.getctime(file_path)
-            file_size = os.path.getsize(file_path)
+            stat = os.stat(file_path)
+            # by the time in the frame's name: linking a repeat resets the shared ctime
+            file_age = current_time - frame_time(file_path)
+            # repeated frames are hard links to one file (see frames.repeat_frame): count it once
+            file_size = 0 if (stat.st_dev, stat.st_ino) in seen else stat.st_size
+            seen.add((stat.st_dev, stat.st_ino))
             total_size += file_size
 
             # Delete files older than max_age or if total size exceeds max_size
             if file_age > max_age * 86400 or total_size > max_size:
                 try:
-                    os.remove(file_path)
+                    forget_frame(file_path)
                     total_size -= file_size
                     logging.info("Deleted %s", file_path)
                 except Exception as e:
@@ -71,10 +79,12 @@ def retention_cleanup():
     for camera_name in os.listdir(VIDEO_DIRECTORY):
         camera_dir = os.path.join(VIDEO_DIRECTORY, camera_name)
         video_files = get_files_sorted_by_creation_time(camera_dir)
-        delete_old_files(video_files, MAX_COMPRESSED_VIDEO_AGE, MAX_RAW_DATA_SIZE)
+        delete_old_files(video_files, config.MAX_COMPRESSED_VIDEO_AGE, config.MAX_RAW_DATA_SIZE)
 
     # For each camera, delete old or excess screenshots
     for camera_name in os.listdir(SCREENSHOT_DIRECTORY):
         camera_dir = os.path.join(SCREENSHOT_DIRECTORY, camera_name)
         image_files = get_files_sorted_by_creation_time(camera_dir)
-        delete_old_files(image_files, MAX_COMPRESSED_VIDEO_AGE, MAX_RAW_DATA_SIZE)
+        delete_old_files(image_files, config.MAX_COMPRESSED_VIDEO_AGE, config.MAX_RAW_DATA_SIZE)
+        if os.path.isdir(camera_dir):
+            prune_frame_hashes(camera_dir)
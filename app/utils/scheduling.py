@@ -14,16 +14,35 @@ from collections import deque
 from apscheduler.triggers.cron import CronTrigger
 from dateutil import parser
 from flask_apscheduler import APScheduler
-from PIL import Image, ImageDraw, ImageFont
-from transformers import CLIPProcessor, CLIPModel
-
-from app.config import DEBUG, SCREENSHOT_DIRECTORY, SUMMARIES_DIRECTORY, VIDEO_DIRECTORY
-
-from .detect import calculate_difference_fast
+from PIL import Image, ImageDraw
+
+import app.config as config
+from app.config import (
+    DEBUG,
+    MAX_WORKERS,
+    SCREENSHOT_DIRECTORY,
+    SUMMARIES_DIRECTORY,
+    VIDEO_DIRECTORY,
+    refresh_settings,
+    subscribe,
+)
+
+from .capture_scheduler import CaptureScheduler, base_interval
+from .clip_service import clip_scores, start_clip_service
+from .detect import load_thumbnail, measure_motion, motion_thumbnail, save_thumbnail
+from .frame_hashes import dhash, get_frame_hashes, record_frame_hash
 from .image_processing import chatgpt_compare
 from .llm import summarize
-from .screenshots import capture_or_download, remove_background, add_timestamp
-from .template_manager import get_template, get_templates, save_template
+from .frames import (
+    frame_extension,
+    get_frame_index,
+    link_frame,
+    load_font,
+    paste_label_background,
+    write_frame,
+)
+from .screenshots import capture_or_download, finish_frame, CAPTURE_UNCHANGED
+from .template_manager import get_template, get_templates, queue_template_status
 from .email_alerts import email_alert
 
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -58,36 +77,78 @@ class GracefulAPScheduler(APScheduler):
 
 scheduler = GracefulAPScheduler()
 
-clip_processor, clip_model = None, None
-
 def find_closest_image(directory, last_caption_time):
-    closest_image = None
-    min_time_diff = None
-
-    for filename in os.listdir(directory):
-        if filename.endswith(".png") and "motion" in filename:
-            # Extract timestamp from filename
-            timestamp_str = filename.split("_")[0]
-            try:
-                timestamp = datetime.datetime.strptime(timestamp_str, "%Y%m%d%H%M%S")
-                time_diff = abs(
-                    last_caption_time - timestamp
-                )  # todo.. can't go over...
-                if min_time_diff is None or time_diff < min_time_diff:
-                    closest_image = filename
-                    min_time_diff = time_diff
-            except ValueError:
-                continue  # Skip files with unexpected filename format
+    """The filename of the last frame taken at or before last_caption_time, if any."""
+    closest = get_frame_index(directory).closest(last_caption_time)
+    return closest["filename"] if closest else None
 
-    return closest_image
 
+def draw_motion_and_caption(image, caption=None, motion=False, regions=None):
+    """
+    Draw the motion marker and caption onto an RGB frame in memory and return it.
 
-def add_motion_and_caption(image_path, caption=None, motion=False):
+    regions are the grid detector's motion regions; each gets a box around it.
+    """
+    if caption is None and motion is False:
+        return image
+
+    # Create an ImageDraw object
+    draw = ImageDraw.Draw(image)
+    line_width = max(1, image.width // 400)
+    for region in regions or []:
+        x1, y1, x2, y2 = region["box"]
+        draw.rectangle(
+            [int(x1 * image.width), int(y1 * image.height),
+             int(x2 * image.width) - 1, int(y2 * image.height) - 1],
+            outline=(255, 64, 64), width=line_width,
+        )
+    max_height = min(image.height, image.width * 9 // 16)
+    font_size = int(max_height * 0.05)
+    if font_size < 5:  # too small to read, and truetype rejects it
+        return image
+    top_offset = (image.height - max_height) / 2
+
+    font = load_font(font_size)
+
+    if motion is True:
+        motion_icon = "░"
+        # Calculate text size and position
+        text_w = int(draw.textlength(motion_icon, font=font))
+        text_h = font_size
+        x, y = int(image.width - text_w - 10), int(
+            image.height - int(font_size * 3) - top_offset
+        )
+        # Paste a black transparent rectangle as the background
+        paste_label_background(image, text_w, text_h, x, y)
+        # Draw the timestamp in white text on the black transparent box
+        draw.text(
+            (x, y), motion_icon, font=font, fill=(255, 255, 255, 255)
+        )  # White text
+
+    if caption is not None:
+        caption = caption[:64]
+        # Calculate text size and position
+        text_w = int(draw.textlength(caption, font=font))
+        text_h = font_size
+        x, y = int(10), int(image.height - int(font_size * 3) - top_offset)
+        # Paste a black transparent rectangle as the background
+        paste_label_background(image, text_w, text_h, x, y)
+        # Draw the timestamp in white text on the black transparent box
+        draw.text(
+            (x, y), caption, font=font, fill=(255, 255, 255, 255)
+        )  # White text
+
+    return image
+
+
+def add_motion_and_caption(image_path, caption=None, motion=False, regions=None):
     if os.path.exists(image_path):
 
         if caption is None and motion is False:
             return
 
+        # write through symlinks such as latest_camera.png to the frame itself
+        image_path = os.path.realpath(image_path)
         try:
             with Image.open(
                 image_path
@@ -98,7 +159,7 @@ def add_motion_and_caption(image_path, caption=None, motion=False):
                 except Exception as e:
                     # for debugging only, otherwise unlink the file
                     if DEBUG:
-                        os.rename(image_path, image_path.replace(".png", ".broken"))
+                        os.rename(image_path, os.path.splitext(image_path)[0] + ".broken")
                     else:
                         # unlink the offending image
                         os.unlink(image_path)
@@ -106,124 +167,155 @@ def add_motion_and_caption(image_path, caption=None, motion=False):
                     logging.error(f"Error saving image: {image_path} {e}")
                     return
 
-                # Create an ImageDraw object
-                draw = ImageDraw.Draw(image)
-                max_height = min(image.height, image.width * 9 // 16)
-                font_size = int(max_height * 0.05)
-                top_offset = (image.height - max_height) / 2
-                # if the image has the "invert" flag, then inverse this image for better readability
-
-                try:
-                    font = ImageFont.truetype("Arial.ttf", font_size)
-                except IOError:
-                    try:
-                        font = ImageFont.truetype(
-                            "LiberationSans-Regular.ttf", font_size
-                        )
-                    except IOError:
-                        font = ImageFont.load_default()
-
-                if motion is True:
-                    motion_icon = "░"
-                    # Calculate text size and position
-                    text_w = int(draw.textlength(motion_icon, font=font))
-                    text_h = font_size
-                    x, y = int(image.width - text_w - 10), int(
-                        image.height - int(font_size * 3) - top_offset
-                    )
-                    # Create a black transparent rectangle as the background
-                    background = Image.new(
-                        "RGBA", (text_w + 20, text_h + 10), (0, 0, 0, 64)
-                    )  # 50% transparent black
-                    image.paste(background, (x - 10, y - 5), background)
-                    # Draw the timestamp in white text on the black transparent box
-                    draw.text(
-                        (x, y), motion_icon, font=font, fill=(255, 255, 255, 255)
-                    )  # White text
-
-                if caption is not None:
-                    caption = caption[:64]
-                    # Calculate text size and position
-                    text_w = int(draw.textlength(caption, font=font))
-                    text_h = font_size
-                    x, y = int(10), int(image.height - int(font_size * 3) - top_offset)
-                    # Create a black transparent rectangle as the background
-                    background = Image.new(
-                        "RGBA", (text_w + 20, text_h + 10), (0, 0, 0, 64)
-                    )  # 50% transparent black
-                    image.paste(background, (x - 10, y - 5), background)
-                    # Draw the timestamp in white text on the black transparent box
-                    draw.text(
-                        (x, y), caption, font=font, fill=(255, 255, 255, 255)
-                    )  # White text
-
-                # Save the image
-                image.save(image_path, "PNG")
+            write_frame(draw_motion_and_caption(image, caption, motion, regions), image_path)
         except Exception as e:
             logging.error(f"Error determining frequency for: {e}")
 
 
+def skip_motion(template):
+    """Templates on the default motion setting stop here once they have a caption."""
+    motion_config = template.get("motion", 1)
+    return motion_config in [1, None] and (template.get("last_caption", "") or "") != ""
+
+
+def object_filter_score(frame_path, object_filter):
+    """
+    How likely CLIP thinks the frame shows any of object_filter's comma separated objects.
+
+    The objects are scored together with OBJECT_FILTER_BACKGROUND; CLIP scores are a
+    softmax over the prompts, so one prompt alone would always score 1.0.  Returns
+    the probability of not being the background, or None if there is no score.
+    """
+    objects = [o.strip() for o in object_filter.split(",") if o.strip()]
+    if not objects:
+        return None
+    probs = clip_scores(frame_path, objects + [config.OBJECT_FILTER_BACKGROUND])
+    if probs is None:
+        return None
+    return 1.0 - probs[-1]
+
+
+def comparison_images(template, directory, frame_path):
+    """
+    The images chatgpt_compare gets for a new frame: the reference image, if any, then the frame.
+
+    With LLM_COMPARE_CAPTION_FRAME the frame behind the last caption goes in
+    between; it is off by default, as every image adds to the cost of the call.
+    """
+    image_paths = []
+    # add reference image if exists
+    if os.path.exists(
+        os.path.join(directory, "reference.png")
+    ):  # if doesnt exist, consider taking the oldest?
+        image_paths.append(os.path.join(directory, "reference.png"))
+
+    # Find the image that closest matches the last_caption_time
+    if config.LLM_COMPARE_CAPTION_FRAME and template.get("last_caption_time"):
+        try:
+            last_caption_time = parser.parse(template["last_caption_time"])
+            closest_image_filename = find_closest_image(directory, last_caption_time)
+            if closest_image_filename:
+                image_paths.append(os.path.join(directory, closest_image_filename))
+        except Exception as e:
+            print(" warning caption parsing error", e)
+
+    image_paths.append(frame_path)
+    return image_paths
+
+
+def motion_overlay(template, previous_path, state):
+    """
+    Build the overlay update_camera hands to the capture pipeline.
+
+    It runs on the stamped frame before it is encoded: compares it with the previous
+    frame, then draws the current caption and motion marker, so the frame is written
+    once.  The un-captioned copy is kept in state in case a fresh caption arrives.
+    """
+
+    def overlay(image):
+        state["clean"] = image.copy()
+        # taken before the caption is drawn, so captions never count as motion or change the frame's hash
+        state["thumbnail"] = motion_thumbnail(image)
+        if skip_motion(template):
+            return image
+
+        lsum = False
+        regions = []
+        if previous_path is not None:
+            percentage_difference, regions = measure_motion(template, previous_path, state["thumbnail"])
+            if (percentage_difference or 0) >= float(template.get("motion", 0)):
+                lsum = True
+        state["lsum"] = lsum
+        state["regions"] = regions if lsum else []
+
+        state["caption"] = template.get(
+            "last_caption", template.get("last_motion_caption", None)
+        )
+        return draw_motion_and_caption(image, caption=state["caption"], motion=lsum, regions=state["regions"])
+
+    return overlay
+
+
 def update_camera(name, template, image_file=None):
+    """
+    Capture a camera and run motion detection and captioning on the new frame.
+
+    Returns True when the frame showed motion, False when it did not (or the camera
+    reported it unchanged), and None when nothing was captured or motion was not
+    checked.  The capture scheduler uses this to adapt the interval.
+    """
+
+    # capture workers are separate processes; pick up settings changed in the web app
+    refresh_settings()
 
     # just ignore the old
     template = get_template(name)
 
+    # the frame we compare against for motion is whatever latest_camera.png points at now
+    directory = os.path.join(SCREENSHOT_DIRECTORY, name)
+    previous_path = os.path.realpath(os.path.join(directory, "latest_camera.png"))
+    if not os.path.isfile(previous_path):
+        previous_path = None
+
+    state = {}
+    overlay = motion_overlay(template, previous_path, state)
+
     lsuc = False
     if image_file is None:
-        lsuc = capture_or_download(name, template)
+        lsuc = capture_or_download(name, template, overlay=overlay)
     else:
         timestamp = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
         # Update the output_path format to include the timestamp
         output_path = os.path.join(
-            SCREENSHOT_DIRECTORY, f"{name}/{name}_{timestamp}.tmp.png"
+            SCREENSHOT_DIRECTORY, f"{name}/{name}_{timestamp}.{frame_extension(template)}"
         )
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        if os.path.exists(output_path):
-            image = Image.open(output_path)
-            # Convert the image to RGBA mode in case it's a format that doesn't support transparency
-            image = image.convert("RGB")
-            image = remove_background(image)
-            image.save(output_path, "PNG")
-            if os.path.exists(output_path):
-                # TODO: add error mark from lerror
-                add_timestamp(output_path, name, invert=template.get('invert',False))
-                os.rename(output_path, output_path.replace(".tmp.png", ".png"))
-                lsuc = True
+        try:
+            # TODO: add error mark from lerror
+            lsuc = finish_frame(
+                Image.open(image_file), output_path, name,
+                invert=template.get('invert', False), overlay=overlay,
+            )
+        except Exception as e:
+            logging.error(f"Error loading uploaded image for {name}: {e}")
+
+    if lsuc is CAPTURE_UNCHANGED:
+        # the camera says we already have this frame, and it was linked in again: nothing to decode or caption
+        logging.debug(f"{name} unchanged since the last capture")
+        return False
 
     if lsuc is True:
-        directory = os.path.join(SCREENSHOT_DIRECTORY, name)
-        png_files = [
-            f
-            for f in os.listdir(directory)
-            if f.endswith(".png") and os.path.isfile(os.path.join(directory, f))
-        ]
-        if not png_files:
+        index = get_frame_index(directory)
+        latest = index.latest()
+        if latest is None:
             return None  # camera is out
-
-        png_files = sorted(
-            png_files, key=lambda x: os.path.getctime(os.path.join(directory, x))
-        )
+        frame_name = latest["filename"]
+        frame_target = os.path.abspath(os.path.join("data/screenshots", name, frame_name))
 
         # link for other processes to use
-        lpath = os.path.join(SCREENSHOT_DIRECTORY, "latest_camera.png")
-
         try:
-            if os.path.exists(lpath + ".tmp"):
-                os.unlink(os.path.abspath(lpath + ".tmp"))
-            os.symlink(
-                os.path.abspath(os.path.join("data/screenshots", name, png_files[-1])),
-                os.path.abspath(lpath + ".tmp"),
-            )
-            os.rename(os.path.abspath(lpath + ".tmp"), os.path.abspath(lpath))
-
-            lpath = os.path.join(SCREENSHOT_DIRECTORY, name, "latest_camera.png")
-            if os.path.exists(lpath + ".tmp"):
-                os.unlink(os.path.abspath(lpath + ".tmp"))
-            os.symlink(
-                os.path.abspath(os.path.join("data/screenshots", name, png_files[-1])),
-                os.path.abspath(lpath + ".tmp"),
-            )
-            os.rename(os.path.abspath(lpath + ".tmp"), os.path.abspath(lpath))
+            link_frame(frame_target, os.path.abspath(os.path.join(SCREENSHOT_DIRECTORY, "latest_camera.png")))
+            link_frame(frame_target, os.path.abspath(os.path.join(directory, "latest_camera.png")))
 
             # Create symlinks for each group
             if "groups" in template:
@@ -233,41 +325,57 @@ def update_camera(name, template, image_file=None):
                     group_lpath = os.path.join(
                         SCREENSHOT_DIRECTORY, f"{trimmed_group_name}_latest_camera.png"
                     )
-                    if os.path.exists(group_lpath + ".tmp"):
-                        os.unlink(os.path.abspath(group_lpath + ".tmp"))
-                    os.symlink(
-                        os.path.abspath(
-                            os.path.join("data/screenshots", name, png_files[-1])
-                        ),
-                        os.path.abspath(group_lpath + ".tmp"),
-                    )
-                    os.rename(
-                        os.path.abspath(group_lpath + ".tmp"),
-                        os.path.abspath(group_lpath),
-                    )
+                    link_frame(frame_target, os.path.abspath(group_lpath))
 
         except Exception:
             pass
 
-        motion_config = template.get("motion", 1)
-        if (
-            motion_config in [1, None]
-            and (template.get("last_caption", "") or "") != ""
-        ):
-            return
+        frame_path = os.path.join(directory, frame_name)
+        if latest.get("repeat_of"):
+            # the camera sent the picture behind the previous frame again and finish_frame
+            # linked that frame in: it has no motion and nothing new to caption
+            previous_path = os.path.join(directory, latest["repeat_of"])
+            try:
+                save_thumbnail(frame_path, load_thumbnail(previous_path))
+                value = get_frame_hashes(directory).hash_of(latest["repeat_of"])
+                if value is not None:
+                    record_frame_hash(frame_path, value)
+            except Exception as e:
+                logging.error(f"Error indexing repeated frame {frame_path}: {e}")
+            return False
 
-        lsum = False
-        percentage_difference = 0
-        if len(png_files) > 1:
-            percentage_difference = calculate_difference_fast(
-                os.path.join(directory, png_files[-2]),
-                os.path.join(directory, png_files[-1]),
-            )
-            if (percentage_difference or 0) >= float(template.get("motion", 0)):
-                lsum = True
+        try:
+            thumbnail = state.get("thumbnail")
+            if thumbnail is not None:
+                save_thumbnail(frame_path, thumbnail)
+            else:
+                thumbnail = load_thumbnail(frame_path)
+            record_frame_hash(frame_path, dhash(thumbnail))
+        except Exception as e:
+            logging.error(f"Error hashing {frame_path}: {e}")
+            thumbnail = None
 
-        elif png_files == 1:
-            lsum = True
+        if skip_motion(template):
+            return None
+
+        if "lsum" in state:
+            lsum = state["lsum"]
+        else:
+            # the capture path never ran the overlay; fall back to the (still clean) file
+            lsum = False
+            regions = []
+            previous = index.previous(frame_name)
+            if previous is not None:
+                percentage_difference, regions = measure_motion(
+                    template, os.path.join(directory, previous["filename"]),
+                    load_thumbnail(frame_path) if thumbnail is None else thumbnail,
+                )
+                if (percentage_difference or 0) >= float(template.get("motion", 0)):
+                    lsum = True
+            lcap = template.get(
+                "last_caption", template.get("last_motion_caption", None)
+            )
+            add_motion_and_caption(frame_path, caption=lcap, motion=lsum, regions=regions if lsum else None)
 
         prev_motion = os.path.join(directory, "last_motion.png")
         # print(" detected motion", lsum, name, template.get('last_caption'))
@@ -351,68 +459,20 @@ def update_camera(name, template, image_file=None):
 
         # run the object detect AFTER the motion detetor
         if allow is True and object_filter and object_confidence is not None:
-
-            global clip_model, clip_processor
-
-            if clip_model is None:
-                clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")  # TODO: make these models configurable
-
-            if clip_processor is None:
-                clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-
-            # Load the latest image
-            latest_image_path = os.path.join(directory, png_files[-1])
-            image = Image.open(latest_image_path)
-
-            # Process the image and text
-            inputs = clip_processor(
-                text=[object_filter], images=image, return_tensors="pt", padding=True
-            )
-
-            # Get the logits from the model
-            outputs = clip_model(**inputs)
-            logits_per_image = (
-                outputs.logits_per_image
-            )  # this is the image-text similarity score
-            probs = logits_per_image.softmax(
-                dim=1
-            )  # we can take the softmax to get probabilities
-
-            # Check if the object is detected with confidence higher than the threshold
-            if probs[0, 0] >= object_confidence:
-                allow = True
-                # print(f"Object '{object_filter}' detected in {name} with confidence {probs[0, 0]}")
+            # scored by the host's shared CLIP service, batched with the other cameras
+            score = object_filter_score(frame_path, object_filter)
+            if score is None:
+                logging.warning(f"Object filter for {name} skipped; no CLIP score")
+            elif score < object_confidence:
+                allow = False
+            # else: print(f"Object '{object_filter}' detected in {name} with confidence {score}")
 
         if allow:
 
             # allow this to run one time if we have no detection
             #  generate the symlink. if there is a data/screenshots/<camera>/last_motion.png, please rename the move the symlink to prev_motion.png
-            #    then, create the symlink for last_motion.png to point to the new png_files[-1]
-            image_paths = []
-            # add reference image if exists
-            if os.path.exists(
-                os.path.join(directory, "reference.png")
-            ):  # if doesnt exist, consider taking the oldest?
-                image_paths.append(os.path.join(directory, "reference.png"))
-
-            # Find the image that closest matches the last_caption_time
-            if "last_caption_time" in template and template["last_caption_time"] != "":
-                try:
-                    last_caption_time = parser.parse(template["last_caption_time"])
-                    closest_image_filename = find_closest_image(
-                        directory, last_caption_time
-                    )
-                    if closest_image_filename:
-                        closest_image_path = os.path.join(
-                            directory, closest_image_filename
-                        )
-                        print("last caption....", closest_image_path)
-                        image_paths.append(closest_image_path)
-                except Exception as e:
-                    print(" warning caption parsing error", e)
-                    pass
-
-            image_paths.append(os.path.join(directory, png_files[-1]))
+            #    then, create the symlink for last_motion.png to point to the new frame
+            image_paths = comparison_images(template, directory, frame_path)
 
             lctime = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -427,12 +487,11 @@ def update_camera(name, template, image_file=None):
             #      send llava the reference image (if available in data/screenshots/<camera>/reference.png), the last motion image (if available in data/screenshots/<camera>/last_motion.png)
             # TODO: be more targetted about this
 
-            lret = None
+            updates = {}
             if last_motion_trigger:
-                template["last_motion_time"] = lctime
+                updates["last_motion_time"] = lctime
 
-            lret = None
-            # just ignore the old
+            # just ignore the old (from the template cache, so this is not a query)
             template = get_template(name)
 
             if last_caption_trigger or template.get("last_caption") is None:
@@ -445,101 +504,39 @@ def update_camera(name, template, image_file=None):
                 # print("  oldgpt:", name, template.get('last_caption'))
                 # print("  newgpt:", name, gret)
                 if gret and re.findall(r"(?:sorry|cannot|can not)", gret):
-                    template["last_ret"] = gret + "*"
+                    updates["last_ret"] = gret + "*"
                 elif gret:
-                    template["last_caption"] = gret
-                template["last_caption_time"] = lctime
-                add_motion_and_caption(lpath, caption=gret, motion=lsum)
-            elif lret is not None:
-                add_motion_and_caption(lpath, caption=lret, motion=lsum)
-            else:
-                lcap = template.get(
-                    "last_caption", template.get("last_motion_caption", None)
-                )
-                add_motion_and_caption(lpath, caption=lcap, motion=lsum)
+                    updates["last_caption"] = gret
+                updates["last_caption_time"] = lctime
+                if gret and gret != state.get("caption") and "clean" in state:
+                    # a new caption: redraw it on the clean frame, the only second encode
+                    write_frame(
+                        draw_motion_and_caption(state["clean"], caption=gret, motion=lsum),
+                        frame_path,
+                    )
 
-            save_template(name, template)
+            queue_template_status(name, **updates)
 
             if last_motion_trigger or lsum:
-                if os.path.exists(
-                    os.path.join(directory, "last_motion_caption.png.tmp")
-                ):
-                    os.remove(os.path.join(directory, "last_motion_caption.png.tmp"))
-                os.symlink(
-                    png_files[-1],
-                    os.path.join(directory, "last_motion_caption.png.tmp"),
-                )
-                os.rename(
-                    os.path.join(directory, "last_motion_caption.png.tmp"),
-                    os.path.join(directory, "last_motion_caption.png"),
-                )
+                link_frame(frame_name, os.path.join(directory, "last_motion_caption.png"))
 
             if last_caption_trigger:
-                if os.path.exists(os.path.join(directory, "last_caption.png.tmp")):
-                    os.remove(os.path.join(directory, "last_caption.png.tmp"))
-                os.symlink(
-                    png_files[-1], os.path.join(directory, "last_caption.png.tmp")
-                )
-                os.rename(
-                    os.path.join(directory, "last_caption.png.tmp"),
-                    os.path.join(directory, "last_caption.png"),
-                )
+                link_frame(frame_name, os.path.join(directory, "last_caption.png"))
 
             if os.path.exists(prev_motion):
-                destination = os.readlink(prev_motion)
-                if os.path.exists(os.path.join(directory, "prev_motion.png.tmp")):
-                    os.remove(os.path.join(directory, "prev_motion.png.tmp"))
-                os.symlink(destination, os.path.join(directory, "prev_motion.png.tmp"))
-                os.rename(
-                    os.path.join(directory, "prev_motion.png.tmp"),
-                    os.path.join(directory, "prev_motion.png"),
-                )
+                link_frame(os.readlink(prev_motion), os.path.join(directory, "prev_motion.png"))
                 image_paths.append(os.path.join(directory, "prev_motion.png"))
-            if os.path.exists(os.path.join(directory, "last_motion.png.tmp")):
-                os.remove(os.path.join(directory, "last_motion.png.tmp"))
-            os.symlink(png_files[-1], os.path.join(directory, "last_motion.png.tmp"))
-            os.rename(
-                os.path.join(directory, "last_motion.png.tmp"),
-                os.path.join(directory, "last_motion.png"),
-            )
+            link_frame(frame_name, os.path.join(directory, "last_motion.png"))
 
         elif lsum is True:
-            # just ignore the old
-            template = get_template(name)
-
-            lcap = template.get(
-                "last_caption", template.get("last_motion_caption", None)
-            )
-            add_motion_and_caption(lpath, caption=lcap, motion=lsum)
             lctime = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-            template["last_motion_time"] = lctime
-            save_template(name, template)
+            queue_template_status(name, last_motion_time=lctime)
 
             if os.path.exists(prev_motion):
-                destination = os.readlink(prev_motion)
-                if os.path.exists(os.path.join(directory, "prev_motion.png.tmp")):
-                    os.remove(os.path.join(directory, "prev_motion.png.tmp"))
-                os.symlink(destination, os.path.join(directory, "prev_motion.png.tmp"))
-                os.rename(
-                    os.path.join(directory, "prev_motion.png.tmp"),
-                    os.path.join(directory, "prev_motion.png"),
-                )
-            if os.path.exists(os.path.join(directory, "last_motion.png.tmp")):
-                os.remove(os.path.join(directory, "last_motion.png.tmp"))
-            os.symlink(png_files[-1], os.path.join(directory, "last_motion.png.tmp"))
-            os.rename(
-                os.path.join(directory, "last_motion.png.tmp"),
-                os.path.join(directory, "last_motion.png"),
-            )
-
-        else:
-            # just ignore the old
-            template = get_template(name)
+                link_frame(os.readlink(prev_motion), os.path.join(directory, "prev_motion.png"))
+            link_frame(frame_name, os.path.join(directory, "last_motion.png"))
 
-            lcap = template.get(
-                "last_caption", template.get("last_motion_caption", None)
-            )
-            add_motion_and_caption(lpath, caption=lcap, motion=lsum)
+        return lsum
 
 
 def init_crawl():
@@ -548,6 +545,30 @@ def init_crawl():
         update_camera(name, template)
 
 
+def capture_slots():
+    return {
+        "browser": config.CAPTURE_SLOTS_BROWSER,
+        "stream": config.CAPTURE_SLOTS_STREAM,
+        "image": config.CAPTURE_SLOTS_IMAGE,
+        "pdf": config.CAPTURE_SLOTS_PDF,
+    }
+
+
+# camera captures run here rather than as APScheduler jobs; see capture_scheduler.py
+capture_scheduler = CaptureScheduler(
+    update_camera,
+    slots=capture_slots(),
+    max_workers=int(MAX_WORKERS),
+    refresh=get_template,
+)
+
+
+@subscribe
+def apply_settings(changes):
+    if any(name.startswith("CAPTURE_SLOTS_") for name in changes):
+        capture_scheduler.set_slots(capture_slots())
+
+
 def update_summary():
 
     # summarize all of htis together
@@ -701,9 +722,11 @@ def schedule_summarization():
 
 def schedule_crawlers():
     """
-    Fetch templates and schedule them according to their frequency, and schedule init_crawl.
-    Each job will be offset by an additional delay to avoid overloading the system.
+    Fetch templates and queue them on the capture scheduler according to their frequency.
+    Each camera's first capture is offset by an additional delay to avoid overloading the system.
     """
+    start_clip_service()  # the model itself only loads once a camera has an object_filter
+    capture_scheduler.start()
     templates = get_templates()
     total_crawlers = len(templates)
     base_delay = 60  # Base delay of 1 minute in seconds
@@ -723,13 +746,7 @@ def schedule_crawlers():
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
         # Convert frequency from minutes to seconds
-        try:
-            seconds = 60 * int(
-                template.get("frequency", 30)
-            )  # Default value is now dynamically retrieved
-        except Exception as e:
-            logging.error(f"Error determining frequency for {name}: {e}")
-            seconds = 60 * 30  # Fallback to default value if there's an issue
+        seconds = base_interval(template)
 
         # Calculate the delay increment dynamically based on the total number of crawlers
         lbase_delay = base_delay
@@ -752,31 +769,11 @@ def schedule_crawlers():
 
         # Apply the incremental delay to space out job scheduling
         try:
-            scheduler.add_job(
-                func=update_camera,
-                trigger="interval",
-                seconds=seconds,
-                start_date=datetime.datetime.now()
-                + datetime.timedelta(seconds=offset_delay_seconds),
-                args=[name, template],
-                id=name,
-                replace_existing=True,
-            )
+            capture_scheduler.schedule(name, template, seconds, delay=offset_delay_seconds)
         except Exception as e:
             print("job schedule error:", e)
             logging.error(f"Error scheduling job for {name}: {e}")
 
-    # Schedule init_crawl to run once, slightly offset as well
-    try:
-        scheduler.add_job(
-            func=init_crawl,
-            trigger="date",
-            run_date=datetime.datetime.now() + datetime.timedelta(minutes=3),
-            id="init_crawl",
-        )
-    except Exception as e:
-        logging.error(f"Error scheduling initial crawl: {e}")
-
 
 system_metrics = {
     'cpu_usage': 0.0,
@@ -808,7 +805,8 @@ def get_system_metrics():
         'disk_usage': round(disk_usage, 1),
         'open_files': open_files,
         'thread_count': system_metrics['thread_count'],
-        'uptime': f"{int(uptime // 3600)}h {int((uptime % 3600) // 60)}m {int(uptime % 60)}s"
+        'uptime': f"{int(uptime // 3600)}h {int((uptime % 3600) // 60)}m {int(uptime % 60)}s",
+        'capture_queue': capture_scheduler.stats(),
     }
 
 log_cache = deque(maxlen=10000)  # Store last 10000 log entries
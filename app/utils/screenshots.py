@@ -1,6 +1,7 @@
 # utils/screenshots.py
 
 import datetime
+import functools
 import io
 import ipaddress
 import json
@@ -13,38 +14,48 @@ import socket
 import subprocess
 import tempfile
 import time
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
 import glob
 
 import numpy as np
-import requests
-import undetected_chromedriver as uc
 import urllib3
-import yt_dlp as youtube_dl
-from pdf2image import convert_from_path
 from PIL import (
     Image,
+    ImageChops,
     ImageDraw,
-    ImageFont,
     ImageOps,
     ImageStat,
 )
-from pyvirtualdisplay import Display
-from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
+
+from app.utils.lazy_import import lazy_module
+
+# the browser, pdf and yt-dlp backends take most of a second to import, so they are
+# imported when first used (capture workers) instead of by everything that imports this
+webdriver = lazy_module("selenium.webdriver")
+youtube_dl = lazy_module("yt_dlp")
 
 logging.getLogger("webdriver_manager").setLevel(logging.WARNING)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-from app.config import (
-    DEBUG, LANG, SCREENSHOT_DIRECTORY, UA, FFMPEG_PATH,
-    NUM_FRAMES, CAPTURE_TIMEOUT, PROBE_SIZE_DEFAULT,
-    PROBE_SIZE_RTSP, PROBE_SIZE_OTHER
+import app.config as config
+from app.config import DEBUG, SCREENSHOT_DIRECTORY, subscribe
+from app.utils import http_client
+from app.utils.frames import (
+    content_digest,
+    frame_extension,
+    load_font,
+    paste_label_background,
+    remember_content,
+    repeat_frame,
+    repeat_last_frame,
+    write_frame,
 )
+from app.utils.template_manager import save_template
+from app.utils.browser_pool import BrowserPool, BrowserSession
+from app.utils.stream_reader import get_stream_reader, release_stream_reader, stream_input_args
+
+# returned instead of True when the source reports the frame we already stored (HTTP 304)
+CAPTURE_UNCHANGED = "unchanged"
 
 last_camera_test = {}
 last_camera_test_time = {}
@@ -67,29 +78,45 @@ def remove_background(image, background_color=(14, 14, 14, 255), threshold=10):
 
 
 def find_bounding_box(image, background_color=(14, 14, 14, 255), threshold=10):
-    """Find the bounding box of the non-background area."""
-    pixels = image.load()
+    """
+    Find the bounding box of the non-background area.
+
+    The is_similar_color tolerance is applied to the whole pixel array at once and
+    the bounds come from row/column reductions of the mask.  Like the per-pixel
+    scan it replaces, an image with no foreground returns (width, height, 0, 0).
+    """
     width, height = image.size
-    left = width
-    top = height
-    right = 0
-    bottom = 0
-
-    # Go through all pixels and find the bounds of the non-background area
-    for x in range(width):
-        for y in range(height):
-            if not is_similar_color(pixels[x, y], background_color, threshold):
-                # Update the bounding box dimensions
-                if x < left:
-                    left = x
-                if y < top:
-                    top = y
-                if x > right:
-                    right = x
-                if y > bottom:
-                    bottom = y
-
-    return (left, top, right, bottom)
+    pixels = np.asarray(image)
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, np.newaxis]
+
+    # zip() in is_similar_color only compares the channels both colors have
+    channels = min(pixels.shape[2], len(background_color))
+    if channels < pixels.shape[2]:
+        pixels = pixels[:, :, :channels]
+    background = np.array(background_color[:channels], dtype=np.int64)
+    lower = np.clip(background - threshold, 0, 255)
+    upper = np.clip(background + threshold, 0, 255)
+
+    # lay each row out flat (width * channels) so the reductions run over
+    # contiguous memory instead of a 3-wide trailing axis
+    pixels = np.ascontiguousarray(pixels).reshape(height, width * channels)
+    if pixels.dtype == np.uint8:
+        # with uint8 wraparound, (value - lower) > (upper - lower) is exactly
+        # "value outside [lower, upper]" in a single pass
+        lower = np.tile(lower.astype(np.uint8), width)
+        span = np.tile((upper - lower[:channels]).astype(np.uint8), width)
+        foreground = (pixels - lower) > span
+    else:
+        foreground = (pixels < np.tile(lower, width)) | (pixels > np.tile(upper, width))
+
+    rows = np.flatnonzero(foreground.any(axis=1))
+    if rows.size == 0:
+        return (width, height, 0, 0)
+    columns = foreground[rows[0] : rows[-1] + 1].any(axis=0)
+    columns = np.flatnonzero(columns.reshape(width, channels).any(axis=1))
+
+    return (int(columns[0]), int(rows[0]), int(columns[-1]), int(rows[-1]))
 
 
 def adjust_bbox_to_aspect_ratio(bbox, image_size, aspect_ratio=(16, 9)):
@@ -164,7 +191,58 @@ def is_mostly_blank(image, threshold=0.92, blank_color=(255, 255, 255)):
     return False
 
 
+def draw_timestamp(image, name="unknown", invert=False):
+    """Overlay the camera name and the capture time; returns the RGB frame to keep using."""
+    image = image.convert("RGB")
+
+    # if the image has the "invert" flag, then inverse this image for better readability
+    if invert:
+        image = ImageOps.invert(image)
+
+    # Create an ImageDraw object
+    draw = ImageDraw.Draw(image)
+
+    # Define the timestamp format
+    timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Define font size as 5% of the screen height
+    max_height = min(image.height, image.width * 9 // 16)
+    font_size = int(max_height * 0.05)
+    if font_size < 5:  # anything less than a font size of 5 is goign to fail
+        return image
+
+    top_offset = (image.height - max_height) / 2
+
+    # Define font (cached per size; see FONT_NAMES in frames.py)
+    font = load_font(font_size)
+
+    # Calculate text size and position
+    text_w = int(draw.textlength(name, font=font))
+    text_h = font_size
+    x, y = int(10), int(10 + top_offset)
+    # Paste a black transparent rectangle as the background
+    paste_label_background(image, text_w, text_h, x, y)
+    # Draw the timestamp in white text on the black transparent box
+    draw.text((x, y), name, font=font, fill=(255, 255, 255, 255))  # White tex
+
+    # Calculate text size and position
+    text_w = int(draw.textlength(timestamp, font=font))
+    text_h = font_size
+    x, y = int(image.width - text_w - 10), int(
+        image.height - top_offset - font_size * 2
+    )
+    # Paste a black transparent rectangle as the background
+    paste_label_background(image, text_w, text_h, x, y)
+
+    # Draw the timestamp in white text on the black transparent box
+    draw.text(
+        (x, y), timestamp, font=font, fill=(255, 255, 255, 255)
+    )  # White text
+    return image
+
+
 def add_timestamp(image_path, name="unknown", invert=False):
+    """Stamp a frame that is already on disk.  Captures use finish_frame instead."""
     if os.path.exists(image_path):
         with Image.open(
             image_path
@@ -175,7 +253,7 @@ def add_timestamp(image_path, name="unknown", invert=False):
             except Exception as e:
                 # for debugging only, otherwise unlink the file
                 if DEBUG:
-                    os.rename(image_path, image_path.replace(".png", ".broken"))
+                    os.rename(image_path, os.path.splitext(image_path)[0] + ".broken")
                 else:
                     # unlink the offending image
                     os.unlink(image_path)
@@ -183,110 +261,68 @@ def add_timestamp(image_path, name="unknown", invert=False):
                 logging.error(f"Error saving image: {image_path} {e}")
                 return
 
-            # Create an ImageDraw object
-            draw = ImageDraw.Draw(image)
-            # if the image has the "invert" flag, then inverse this image for better readability
-            if invert:
-                image = ImageOps.invert(image)
-
-            # Define the timestamp format
-            timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-
-            # Define font size as 5% of the screen height
-            max_height = min(image.height, image.width * 9 // 16)
-            font_size = int(max_height * 0.05)
-            if font_size < 5:  # anything less than a font size of 5 is goign to fail
-                return
-
-            top_offset = (image.height - max_height) / 2
+            write_frame(draw_timestamp(image, name, invert), image_path)
 
-            # Define font (you may need to specify a full path to a .ttf file on your system)
-            try:
-                font = ImageFont.truetype("Arial.ttf", font_size)
-            except IOError:
-                try:
-                    font = ImageFont.truetype("LiberationSans-Regular.ttf", font_size)
-                except IOError:
-                    font = ImageFont.load_default()
-
-            # Calculate text size and position
-            text_w = int(draw.textlength(name, font=font))
-            text_h = font_size
-            x, y = int(10), int(10 + top_offset)
-            # Create a black transparent rectangle as the background
-            background = Image.new(
-                "RGBA", (text_w + 20, text_h + 10), (0, 0, 0, 64)
-            )  # 50% transparent black
-            image.paste(background, (x - 10, y - 5), background)
-            # Draw the timestamp in white text on the black transparent box
-            draw.text((x, y), name, font=font, fill=(255, 255, 255, 255))  # White tex
-
-            # Calculate text size and position
-            text_w = int(draw.textlength(timestamp, font=font))
-            text_h = font_size
-            x, y = int(image.width - text_w - 10), int(
-                image.height - top_offset - font_size * 2
-            )
-            # Create a black transparent rectangle as the background
-            background = Image.new(
-                "RGBA", (text_w + 20, text_h + 10), (0, 0, 0, 64)
-            )  # 50% transparent black
-            image.paste(background, (x - 10, y - 5), background)
 
-            # Draw the timestamp in white text on the black transparent box
-            draw.text(
-                (x, y), timestamp, font=font, fill=(255, 255, 255, 255)
-            )  # White text
+def finish_frame(image, output_path, name="unknown", invert=False, dark=False, crop=True, overlay=None):
+    """
+    Run a decoded frame through the in-memory stages and encode it exactly once.
 
-            # Save the image
-            image.save(image_path, "PNG")
+    Stages: crop the background, apply dark mode, stamp the name and time, then the
+    caller's overlay (update_camera draws motion and captions there), and finally
+    an atomic write to output_path.  When the source image is the same as the one
+    behind the camera's previous frame, that frame is linked in instead and the
+    stamp, overlay and encode are skipped (see repeat_frame).
+    """
+    image = image.convert("RGB")
+    if crop:
+        image = remove_background(image)
+    if dark:
+        image = apply_dark_mode(image)
+    digest = content_digest(image)
+    if repeat_frame(output_path, digest):
+        return True
+    image = draw_timestamp(image, name, invert)
+    if overlay is not None:
+        image = overlay(image)
+    write_frame(image, output_path)
+    remember_content(output_path, digest)
+    return True
 
 
 def download_image(
-    url, output_path, timeout=30, name="unknown", invert=False, dark=False
+    url, output_path, timeout=30, name="unknown", invert=False, dark=False, overlay=None, conditional=True
 ):
-    """Attempt to download an image directly from the URL and convert it to PNG format."""
+    """
+    Attempt to download an image directly from the URL and convert it to PNG format.
+
+    Returns CAPTURE_UNCHANGED, without decoding anything, when the camera answers
+    304 Not Modified to the validators of the last image we stored; the previous
+    frame is linked in at output_path (see repeat_last_frame).  With
+    conditional=False (probes outside the camera directory) validators are
+    neither sent nor recorded.
+    """
 
     response = None
+    frame_path = output_path if conditional else None
     try:
-        headers = {"user-agent": UA}
         # TODO: apply proxy here
+        response = http_client.conditional_get(url, timeout=timeout, frame_path=frame_path, stream=True)
 
-        auth = None
-        for leach in re.findall(r"\/\/([^\:]+?)\:([^\@]+?)\@", url):
-            auth = requests.auth.HTTPBasicAuth(leach[0], leach[1])
-        response = requests.get(
-            url, stream=True, timeout=timeout, verify=False, headers=headers, auth=auth
-        )
-        if (
-            response.status_code == 401 and auth is not None
-        ):  # Unauthorized, try Digest Authentication
-            for leach in re.findall(r"\/\/([^\:]+?)\:([^\@]+?)\@", url):
-                auth = requests.auth.HTTPDigestAuth(leach[0], leach[1])
-            response = requests.get(
-                url,
-                stream=True,
-                timeout=timeout,
-                verify=False,
-                headers=headers,
-                auth=auth,
-            )
+        if response.status_code == 304:
+            logging.debug(f"Image not modified {url}")
+            repeat_last_frame(output_path)
+            return CAPTURE_UNCHANGED
 
         if response.status_code == 200:
             # Open the image directly from the response bytes
             image = Image.open(io.BytesIO(response.content))
             response.close()
 
-            # Convert the image to RGBA mode in case it's a format that doesn't support transparency
-            image = image.convert("RGB")
-            image = remove_background(image)
-            if dark:
-                apply_dark_mode(image)
-            # Save the image in PNG format
-            image.save(output_path, "PNG")
-            if os.path.exists(output_path):
-                add_timestamp(output_path, name=name, invert=invert)
-                return True
+            finish_frame(image, output_path, name, invert=invert, dark=dark, overlay=overlay)
+            if conditional:
+                http_client.remember_validators(url, response, output_path)
+            return True
         else:
             response.close()
             logging.warn(
@@ -298,46 +334,26 @@ def download_image(
         if response is not None:
             response.close()  # Ensure the connection is closed
 
+    if conditional:
+        http_client.forget_validators(url, output_path)
     return False
 
 
 def download_pdf(
-    url, output_path, timeout=30, name="unknown", invert=False, dark=False
+    url, output_path, timeout=30, name="unknown", invert=False, dark=False, overlay=None, conditional=True
 ):
     """Attempt to download the first page of a PDF from the URL and convert it to PNG format."""
 
     try:
         # Download the PDF file
-        headers = {"user-agent": UA}
-
         # TODO: apply proxy
+        frame_path = output_path if conditional else None
+        response = http_client.conditional_get(url, timeout=timeout, frame_path=frame_path, stream=True)
 
-        auth = None
-        for leach in re.findall(r"\/\/([^\:]+?)\:([^\@]+?)\@", url):
-            auth = requests.auth.HTTPBasicAuth(leach[0], leach[1])
-        response = requests.get(
-            url,
-            stream=True,
-            timeout=timeout,
-            verify=False,
-            headers=headers,
-            auth=auth,
-            allow_redirects=True,
-        )
-        if (
-            response.status_code == 401 and auth is not None
-        ):  # Unauthorized, try Digest Authentication
-            for leach in re.findall(r"\/\/([^\:]+?)\:([^\@]+?)\@", url):
-                auth = requests.auth.HTTPDigestAuth(leach[0], leach[1])
-            response = requests.get(
-                url,
-                stream=True,
-                timeout=timeout,
-                verify=False,
-                headers=headers,
-                auth=auth,
-                allow_redirects=True,
-            )
+        if response.status_code == 304:
+            logging.debug(f"PDF not modified {url}")
+            repeat_last_frame(output_path)
+            return CAPTURE_UNCHANGED
 
         if response.status_code == 200:
             # Save the PDF to a temporary file
@@ -346,21 +362,15 @@ def download_pdf(
                 tmp.write(response.content)
                 tmp_name = tmp.name
             # Convert the first page of the PDF to an image
+            from pdf2image import convert_from_path
             pages = convert_from_path(tmp_name, first_page=1, last_page=1)
             if pages:
-                image = pages[0]
-                # Convert the image to RGBA mode in case it's a format that doesn't support transparency
-                image = image.convert("RGB")
-                image = remove_background(image)
-                if dark:
-                    apply_dark_mode(image)
-                # Save the image in PNG format
-                image.save(output_path, "PNG")
-                if os.path.exists(output_path):
-                    add_timestamp(output_path, name=name, invert=invert)
-                    # Remove the temporary PDF file
-                    os.remove(tmp_name)
-                    return True
+                finish_frame(pages[0], output_path, name, invert=invert, dark=dark, overlay=overlay)
+                # Remove the temporary PDF file
+                os.remove(tmp_name)
+                if conditional:
+                    http_client.remember_validators(url, response, output_path)
+                return True
             else:
                 logging.error("Error converting PDF to image: No pages found")
                 if tmp_name and os.path.exists(tmp_name):
@@ -376,10 +386,23 @@ def download_pdf(
         return False
 
 
+enhanced_extractors = None
+
+
+def get_enhanced_extractors():
+    """yt-dlp extractor classes, minus the catch-all generic one; built once per process."""
+    global enhanced_extractors
+    if enhanced_extractors is None:
+        enhanced_extractors = tuple(
+            e for e in youtube_dl.extractor.gen_extractor_classes() if e.IE_NAME != "generic"
+        )
+    return enhanced_extractors
+
+
+@functools.lru_cache(maxsize=1024)
 def is_enhanced(url):
-    extractors = youtube_dl.extractor.gen_extractors()
-    for e in extractors:
-        if e.suitable(url) and e.IE_NAME != "generic":
+    for e in get_enhanced_extractors():
+        if e.suitable(url):
             return True
     return False
 
@@ -456,7 +479,119 @@ def parse_url(url):
     return domain, port
 
 
-def capture_or_download(name: str, template: str) -> bool:
+# capture methods, cheapest first
+CAPTURE_METHODS = ["image", "pdf", "stream", "ytdlp", "light", "browser"]
+
+
+def capture_flags(template):
+    """Normalize the template's capture options."""
+    flags = {
+        "invert": template.get("invert", "") not in ["", "false", False],
+        "headless": template.get("headless", "") not in ["", "false", False],
+        "dark": template.get("dark", "") not in ["", "false", False],
+        "stealth": template.get("stealth", "") not in ["", "false", False],
+        "danger": template.get("danger", "") not in ["", "false", False],
+    }
+    flags["browser"] = template.get("browser", "") not in ["", "false", False] or flags["stealth"]
+
+    if flags["danger"]:
+        flags["browser"] = True
+        flags["headless"] = True
+    if not flags["headless"]:
+        flags["browser"] = True
+    return flags
+
+
+def choose_capture_method(template, content_type):
+    """Pick the capture method for a template from its url, probed content type and flags."""
+    url = template.get("url")
+    flags = capture_flags(template)
+    danger = flags["danger"]
+
+    if is_image_url(url, content_type) and not danger:
+        return "image"
+    if is_pdf_url(url, content_type) and not danger:
+        return "pdf"
+    if is_video_stream_url(url, content_type) and not danger:
+        return "stream"
+    if is_enhanced(url) and not danger:
+        return "ytdlp"
+    if should_use_lightweight_browser(
+        url, template.get("dedicated_xpath"), template.get("popup_xpath"),
+        flags["headless"], flags["stealth"], flags["browser"], danger,
+    ):
+        return "light"
+    if re.findall(r"^https?://", url, flags=re.I):
+        return "browser"
+    return None
+
+
+def capture_with_method(method, name, template, output_path, overlay=None, conditional=True):
+    """
+    Run one capture method for a template, writing the frame to output_path.
+
+    conditional=False is for trial captures that are not stored as the camera's
+    frames (capture planning): they must not send or record HTTP validators, or
+    the next real capture could get a 304 for a frame that was never kept.
+    """
+    url = template.get("url")
+    timeout = int(template.get("timeout", 30) or 30)
+    flags = capture_flags(template)
+    invert = flags["invert"]
+
+    if method == "image":
+        return download_image(url, output_path, timeout, name, invert, overlay=overlay, conditional=conditional)
+
+    if method == "pdf":
+        return download_pdf(url, output_path, timeout, name, invert, overlay=overlay, conditional=conditional)
+
+    if method == "stream":
+        if template.get("persistent_stream"):
+            frequency = int(template.get("frequency", 30) or 30) * 60
+            if capture_frame_from_persistent_stream(
+                url, output_path, name, invert, timeout, frequency, overlay=overlay
+            ):
+                return True
+        return capture_frame_from_stream(url, output_path, name=name, invert=invert, overlay=overlay)
+
+    if method == "ytdlp":
+        return capture_frame_with_ytdlp(url, output_path, name, invert, overlay=overlay)
+
+    if method == "light":
+        return capture_screenshot_and_har_light(
+            url, output_path, timeout, name, invert, template.get("proxy"), flags["dark"], overlay=overlay
+        )
+
+    if method == "browser":
+        return capture_screenshot_and_har(
+            url, output_path, template.get("popup_xpath"), template.get("dedicated_xpath"), timeout, name, invert,
+            template.get("proxy"), stealth=flags["stealth"], dark=flags["dark"], headless=flags["headless"],
+            danger=flags["danger"], overlay=overlay,
+        )
+
+    logging.error(f"Unknown capture method {method} for {name}")
+    return False
+
+
+def get_capture_plan(template):
+    """The template's stored capture method, or None if it has not been planned yet."""
+    method = template.get("capture_method") or ""
+    if method not in CAPTURE_METHODS:
+        return None
+    return method
+
+
+def save_capture_plan(name, template, method, content_type=""):
+    plan = {
+        "capture_method": method or "",
+        "capture_content_type": content_type or "",
+        "capture_plan_time": datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S") if method else "",
+    }
+    template.update(plan)
+    save_template(name, plan)
+
+
+def capture_or_download(name: str, template: str, overlay=None) -> bool:
     """
     Decides whether to download the image directly or capture a screenshot based on the given template.
 
@@ -464,9 +599,16 @@ def capture_or_download(name: str, template: str) -> bool:
     various types of content (images, PDFs, video streams, web pages) and uses different methods to
     obtain the content based on the URL and content type.
 
+    The chosen method is stored on the template as its capture plan, and later captures
+    skip the reachability and content type probes and go straight to that method.  A
+    failed capture or an edit to the template clears the plan so the next capture probes
+    again; capture_plan.replan_templates may swap in a cheaper equivalent method.
+
     Args:
         name (str): The name to be used for the output file.
         template (str): A dictionary containing configuration parameters for the capture/download.
+        overlay (callable): Optional last in-memory stage, given the stamped frame and
+            returning the frame to write (see finish_frame).
 
     Returns:
         bool: True if the capture/download was successful, False otherwise.
@@ -474,65 +616,43 @@ def capture_or_download(name: str, template: str) -> bool:
     if name is None or template is None:
         return False
 
-    # Extract parameters from the template
     url = template.get("url")
-    popup_xpath = template.get("popup_xpath")
-    dedicated_selector = template.get("dedicated_xpath")
-    timeout = int(template.get("timeout", 30) or 30)
-
-    # Set flags based on template parameters
-    invert = template.get("invert", "") not in ["", "false", False]
-    headless = template.get("headless", "") not in ["", "false", False]
-    dark = template.get("dark", "") not in ["", "false", False]
-    stealth = template.get("stealth", "") not in ["", "false", False]
-    browser = template.get("browser", "") not in ["", "false", False] or stealth
-    danger = template.get("danger", "") not in ["", "false", False]
-
-    if danger:
-        browser = True
-        headless = True
-    if not headless:
-        browser = True
-
-    # Check if the host is reachable
-    domain, port = parse_url(url)
-    if not is_address_reachable(domain, port=port):
-        logging.error(f"Could not reach host: {name} {url}")
-        return False
+    danger = capture_flags(template)["danger"]
 
     # Prepare output path
     timestamp = datetime.datetime.utcnow().strftime("%Y%m%d%H%M%S")
-    output_path = os.path.join(SCREENSHOT_DIRECTORY, f"{name}/{name}_{timestamp}.png")
+    output_path = os.path.join(
+        SCREENSHOT_DIRECTORY, f"{name}/{name}_{timestamp}.{frame_extension(template)}"
+    )
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    # Determine content type
-    content_type = get_content_type(url, danger)
-
-    # Attempt to download or capture based on content type and URL
-    if is_image_url(url, content_type) and not danger:
-        return download_image(url, output_path, timeout, name, invert)
-
-    if is_pdf_url(url, content_type) and not danger:
-        return download_pdf(url, output_path, timeout, name, invert)
-
-    if is_video_stream_url(url, content_type) and not danger:
-        return capture_frame_from_stream(url, output_path, timeout, name, invert)
-
-    if is_enhanced(url) and not danger:
-        return capture_frame_with_ytdlp(url, output_path, name, invert)
+    method = get_capture_plan(template)
+    if method is None:
+        # Check if the host is reachable
+        domain, port = parse_url(url)
+        if not is_address_reachable(domain, port=port):
+            logging.error(f"Could not reach host: {name} {url}")
+            return False
 
-    # Attempt lightweight browser capture for simple web pages
-    if should_use_lightweight_browser(url, dedicated_selector, popup_xpath, headless, stealth, browser, danger):
-        return capture_screenshot_and_har_light(url, output_path, timeout, name, invert, template.get("proxy"), dark)
+        # Determine content type; a url that already names an image needs no header lookup
+        content_type = ""
+        if danger or not is_image_url(url, content_type):
+            content_type = get_content_type(url, danger)
 
-    # Fall back to full browser capture
-    if re.findall(r"^https?://", url, flags=re.I):
-        if not browser:
-            headless = True
-        return capture_screenshot_and_har(url, output_path, popup_xpath, dedicated_selector, timeout, name, invert, template.get("proxy"), headless, dark, stealth, danger)
+        method = choose_capture_method(template, content_type)
+        if method is None:
+            logging.error(f"Failed to capture or download content from {url}")
+            return False
+        save_capture_plan(name, template, method, content_type)
+        planned = False
+    else:
+        planned = True
 
-    logging.error(f"Failed to capture or download content from {url}")
-    return False
+    result = capture_with_method(method, name, template, output_path, overlay=overlay)
+    if result is False and planned:
+        logging.info(f"Capture plan {method} failed for {name}, probing again next time")
+        save_capture_plan(name, template, None)
+    return result
 
 def get_content_type(url, danger):
     """
@@ -559,35 +679,14 @@ def get_content_type(url, danger):
         return ""
 
     content_type = ""
-    methods = [requests.head, requests.get]
-
-    for method in methods:
+    for method in ["HEAD", "GET"]:
         try:
-            headers = {"user-agent": UA}
-            if method == requests.get:
+            headers = {}
+            if method == "GET":
                 headers["Range"] = "bytes=0-1024"
 
-            auth = get_auth(url)
-            response = method(
-                url,
-                stream=True,
-                timeout=5,
-                verify=False,
-                headers=headers,
-                auth=auth,
-                allow_redirects=True,
-            )
-
-            if response.status_code == 401 and auth:
-                auth = get_digest_auth(url)
-                response = method(
-                    url,
-                    timeout=5,
-                    verify=False,
-                    headers=headers,
-                    auth=auth,
-                    allow_redirects=True,
-                )
+            response = http_client.request(method, url, timeout=5, headers=headers, stream=True)
+            response.close()
 
             if response.status_code == 404:
                 logging.info(f"Missing {url}")
@@ -597,7 +696,7 @@ def get_content_type(url, danger):
             content_type = response.headers.get("Content-Type", "").lower()
             break  # Exit the loop if successful
         except Exception as e:
-            logging.info(f"Error {method.__name__.upper()} {url}: {e}")
+            logging.info(f"Error {method} {url}: {e}")
 
     # Cache the result
     if content_type:
@@ -606,16 +705,6 @@ def get_content_type(url, danger):
 
     return content_type
 
-def get_auth(url):
-    """Extract and return BasicAuth from URL if present."""
-    auth_match = re.findall(r"\/\/([^\:]+?)\:([^\@]+?)\@", url)
-    return requests.auth.HTTPBasicAuth(*auth_match[0]) if auth_match else None
-
-def get_digest_auth(url):
-    """Extract and return DigestAuth from URL if present."""
-    auth_match = re.findall(r"\/\/([^\:]+?)\:([^\@]+?)\@", url)
-    return requests.auth.HTTPDigestAuth(*auth_match[0]) if auth_match else None
-
 def is_image_url(url, content_type):
     """Check if the URL is likely to be an image."""
     image_extensions = [".jpg", ".jpeg", ".png", ".bmp", ".tif", ".gif", "/picture"]
@@ -646,65 +735,123 @@ def should_use_lightweight_browser(url, dedicated_selector, popup_xpath, headles
 # should be implemented as before, with appropriate error handling and logging.
 
 
-def capture_frame_with_ytdlp(url, output_path, name="unknown", invert=False):
-    """Use yt-dlp to get the video URL and ffmpeg to capture a single frame from the video stream."""
+resolved_urls = {}
 
-    if shutil.which("yt-dlp") is None:
-        print("yt-dlp is not installed or not in the system path.")
-        return False
 
+def media_url_expiry(video_url, ttl=None):
+    """
+    When a resolved media url stops working.  Signed urls carry their own expiry
+    (YouTube's expire, CloudFront's Expires, S3's X-Amz-Date + X-Amz-Expires);
+    otherwise, or if that is later, fall back to ttl (YTDLP_URL_TTL) seconds from now.
+    """
+    if ttl is None:
+        ttl = config.YTDLP_URL_TTL
+    now = time.time()
+    expiry = now + ttl
+    parsed = urlparse(video_url)
+    query = {k.lower(): v[0] for k, v in parse_qs(parsed.query).items()}
     try:
-        # Use yt-dlp to get the direct video URL
-        output_path + ".%(ext)s"
-        ytdlp_command = [
-            "yt-dlp",  # TODO make this path a config
-            "--get-url",
-            "--format",
-            "bestvideo",  # Adjust the format as needed
-            url,
-        ]
-        result = subprocess.run(
-            ytdlp_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        video_url = result.stdout.decode().strip()  # Get the actual video URL
-
-        # Use ffmpeg to capture a frame from the video URL
-        ffmpeg_command = [
-            "ffmpeg", # TODO: make this a config
-            "-analyzeduration",
-            "20M",
-            "-probesize",
-            "20M",
-            "-ec",
-            "15",  # todo: add -safe option
-            "-i",
-            video_url,  # Input stream URL from yt-dlp
-            "-sn",
-            "-an",
-            "-movflags",
-            "+faststart",
-            "-pix_fmt",
-            "rgb24",
-            "-frames:v",
-            "1",  # Capture only one frame
-            #'-fflags', '+discardcorrupt',
-            "-fflags",
-            "+igndts+ignidx+genpts+fastseek+discardcorrupt",
-            "-q:v",
-            "0",  # Output quality (lower is better)
-            #'-vf', 'fps=fps=1',
-            "-f",
-            "image2",  # Force image2 muxer
-            "-y",
-            output_path,  # Output file path
-        ]
-        subprocess.run(
-            ffmpeg_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        if os.path.exists(output_path):
+        if "expire" in query:
+            expiry = min(expiry, int(query["expire"]))
+        if "expires" in query:
+            expiry = min(expiry, int(query["expires"]))
+        if "x-amz-date" in query and "x-amz-expires" in query:
+            signed = datetime.datetime.strptime(query["x-amz-date"], "%Y%m%dT%H%M%SZ")
+            signed = signed.replace(tzinfo=datetime.timezone.utc).timestamp()
+            expiry = min(expiry, signed + int(query["x-amz-expires"]))
+        # YouTube manifest urls keep their parameters in the path: .../expire/1700000000/...
+        match = re.search(r"/expire/(\d+)", parsed.path)
+        if match:
+            expiry = min(expiry, int(match.group(1)))
+    except ValueError:
+        pass
+    # leave a minute for the frame grab itself
+    return expiry - 60
+
+
+def cached_media_url(url):
+    """The media url resolved for url earlier, if it has not expired yet."""
+    cached = resolved_urls.get(url)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
+    return None
+
+
+def resolve_media_url(url):
+    """Resolve a page url to its direct media url with yt-dlp, reusing it until it expires."""
+    cached = cached_media_url(url)
+    if cached is not None:
+        return cached
+
+    options = {"format": "bestvideo", "quiet": True, "no_warnings": True, "noplaylist": True}
+    with youtube_dl.YoutubeDL(options) as ydl:
+        info = ydl.extract_info(url, download=False)
+    video_url = info.get("url")
+    if not video_url and info.get("requested_formats"):
+        video_url = info["requested_formats"][0].get("url")
+    if not video_url:
+        raise ValueError(f"yt-dlp found no media url for {url}")
+
+    resolved_urls[url] = (video_url, media_url_expiry(video_url))
+    return video_url
+
+
+def capture_frame_with_ytdlp(url, output_path, name="unknown", invert=False, overlay=None):
+    """Use yt-dlp to get the video URL and ffmpeg to capture a single frame from the video stream."""
+
+    try:
+        # a cached url may have been revoked early; if ffmpeg fails on it, resolve again once
+        for attempt in range(2):
+            cached = cached_media_url(url) is not None
+            video_url = resolve_media_url(url)
+
+            # Use ffmpeg to capture a frame from the video URL
+            ffmpeg_command = [
+                config.FFMPEG_PATH,
+                "-analyzeduration",
+                "20M",
+                "-probesize",
+                "20M",
+                "-ec",
+                "15",  # todo: add -safe option
+                "-i",
+                video_url,  # Input stream URL from yt-dlp
+                "-sn",
+                "-an",
+                "-movflags",
+                "+faststart",
+                "-pix_fmt",
+                "rgb24",
+                "-frames:v",
+                "1",  # Capture only one frame
+                #'-fflags', '+discardcorrupt',
+                "-fflags",
+                "+igndts+ignidx+genpts+fastseek+discardcorrupt",
+                "-q:v",
+                "0",  # Output quality (lower is better)
+                #'-vf', 'fps=fps=1',
+                "-c:v",
+                "bmp",  # uncompressed; the frame is only encoded once, by finish_frame
+                "-f",
+                "image2pipe",
+                "-",
+            ]
+            try:
+                result = subprocess.run(
+                    ffmpeg_command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+                break
+            except subprocess.CalledProcessError:
+                resolved_urls.pop(url, None)
+                if not cached or attempt:
+                    raise
+                logging.info(f"Cached media url for {url} failed, resolving again")
+
+        if result.stdout:
             # if dark: # TODO
             #    image = apply_dark_mode(image)
-            add_timestamp(output_path, name=name, invert=invert)
+            image = Image.open(io.BytesIO(result.stdout))
+            finish_frame(image, output_path, name, invert=invert, crop=False, overlay=overlay)
             # logging.info(f"Successfully captured frame from video stream {url}")
             return True
         logging.info(f"Unsuccessfully captured frame from video stream {url}")
@@ -714,66 +861,31 @@ def capture_frame_with_ytdlp(url, output_path, name="unknown", invert=False):
 
 
 def capture_frame_from_stream(
-    url, output_path, name="unknown", invert=False
+    url, output_path, name="unknown", invert=False, overlay=None
 ):
     """Use ffmpeg to capture multiple frames from a video stream and save the last one."""
-    if shutil.which(FFMPEG_PATH) is None:
-        print(f"{FFMPEG_PATH} is not installed or not in the system path.")
+    if shutil.which(config.FFMPEG_PATH) is None:
+        print(f"{config.FFMPEG_PATH} is not installed or not in the system path.")
         return False
 
     with tempfile.TemporaryDirectory() as tmpdirname:  # todo make sure this gets dleted
         # Capture multiple frames into the temporary directory
         temp_output_pattern = os.path.join(tmpdirname, "frame_%03d.png")
         command = [
-            FFMPEG_PATH,  # Use the configurable FFMPEG_PATH
+            config.FFMPEG_PATH,  # Use the configurable FFMPEG_PATH
             "-hide_banner",
             #'-hwaccel', 'auto',  #TODO add support
         ]
 
-        probe_size = PROBE_SIZE_DEFAULT
-        if "http:" in url or "https:" in url:
-            parsed_url = urlparse(url)
-            base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-
-            command.extend(["-headers", "User-Agent: %s\r\n" % UA])
-            command.extend(["-headers", f"referer: {base_url}\r\n"])
-            command.extend(["-headers", f"origin: {base_url}\r\n"])
-            command.extend(["-seekable", "0"])
-            # command.extend(['-timeout', str(CAPTURE_TIMEOUT-1)])  # not sure why, but this causes us a lot of issues, dont set a timetout
-            probe_size = PROBE_SIZE_DEFAULT
-        elif "rtsp:" in url:
-            command.extend(["-rtsp_transport", "tcp"])
-            probe_size = PROBE_SIZE_RTSP
-            if "/streaming/" in url.lower():  # alittle bit of a hack
-                command.extend(["-c:v", "h264"])
-                command.extend(["-r", "1"])
-                probe_size = PROBE_SIZE_OTHER
-        else:
-            probe_size = PROBE_SIZE_OTHER
-
-        # todo: make this configurable instead
-        command.extend(["-analyzeduration", probe_size])
-        command.extend(["-probesize", probe_size])
+        command.extend(stream_input_args(url))
         command.extend(
             [
-                "-use_wallclock_as_timestamps",
-                "1",
-                #'-ec', '15',
-                "-threads",
-                "1",
-                "-skip_frame",
-                "nokey",
-                "-sn",
-                "-an",
-                #'-err_detect','aggressive',
-                "-i",
-                url,  # Input stream URL
                 "-movflags",
                 "+faststart",
                 "-pix_fmt",
                 "rgb24",
                 "-frames:v",
-                str(NUM_FRAMES),  # Capture 'NUM_FRAMES' frames
+                str(config.NUM_FRAMES),  # Capture 'NUM_FRAMES' frames
                 "-fflags",
                 "+igndts+ignidx+genpts+fastseek+discardcorrupt",
                 "-q:v",
@@ -792,7 +904,7 @@ def capture_frame_from_stream(
                     check=True,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
-                    timeout=CAPTURE_TIMEOUT,
+                    timeout=config.CAPTURE_TIMEOUT,
                 )
                 # print("mmm", ' '.join(command))
                 # subprocess.run(command, check=True, timeout=CAPTURE_TIMEOUT)
@@ -807,18 +919,45 @@ def capture_frame_from_stream(
             )
             if frames:
                 last_frame_path = os.path.join(tmpdirname, frames[-1])
-                # Move the last frame to the output path
-                shutil.move(last_frame_path, output_path)
-                if os.path.exists(output_path):
-                    add_timestamp(output_path, name=name, invert=invert)
-                    logging.info(f"Successfully captured frame from stream {url}")
-                    return True
+                with Image.open(last_frame_path) as image:
+                    finish_frame(image, output_path, name, invert=invert, crop=False, overlay=overlay)
+                logging.info(f"Successfully captured frame from stream {url}")
+                return True
             else:
                 logging.error(f"No frames captured from stream {url}")
         except Exception as e:
             logging.error(f"Error capturing frames from stream: {e}")
 
-    logging.error(f"Error capturing frame with {FFMPEG_PATH}: {url}")
+    logging.error(f"Error capturing frame with {config.FFMPEG_PATH}: {url}")
+    return False
+
+
+def capture_frame_from_persistent_stream(
+    url, output_path, name="unknown", invert=False, timeout=None, frequency=0, overlay=None
+):
+    """Save the latest frame held by the camera's persistent stream reader, waiting up to timeout (CAPTURE_TIMEOUT)."""
+    if shutil.which(config.FFMPEG_PATH) is None:
+        print(f"{config.FFMPEG_PATH} is not installed or not in the system path.")
+        return False
+
+    reader = get_stream_reader(url)
+    frame = reader.latest_frame(config.CAPTURE_TIMEOUT if timeout is None else timeout)
+
+    # no point holding the connection open until the next capture
+    if frequency > reader.idle_timeout:
+        release_stream_reader(url)
+
+    if frame is None:
+        logging.warning(f"No frame from persistent stream {url}, falling back")
+        return False
+
+    try:
+        image = Image.open(io.BytesIO(frame))
+        finish_frame(image, output_path, name, invert=invert, crop=False, overlay=overlay)
+        logging.info(f"Successfully captured frame from persistent stream {url}")
+        return True
+    except Exception as e:
+        logging.error(f"Error saving frame from persistent stream: {e}")
     return False
 
 
@@ -935,7 +1074,7 @@ def add_options(options, uc=False):
 
     # TODO: make configurable
     options.add_argument("--window-size=1920,1080")
-    options.add_argument("--accept-lang=%s" % LANG)
+    options.add_argument("--accept-lang=%s" % config.LANG)
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_argument("--disable-features=WebRtcHideLocalIpsWithMdns")
 
@@ -1046,34 +1185,45 @@ def network_idle_condition(driver, url, timeout=30, idle_time=0.25, stealth=Fals
     return False, lstatus
 
 
-def apply_dark_mode(img, range_value=30, text_range_value=120):
-    pixels = img.load()  # Get the pixel map of the image
+def dark_mode_tables(text_range_value=120):
+    """Per-channel lookup tables for apply_dark_mode, 768 entries each (R, G, B)."""
     text_upper_bound = 255 - text_range_value
+    dark = [255 if value <= text_range_value else 0 for value in range(256)]
+    light = [255 if value >= text_upper_bound else 0 for value in range(256)]
+    invert = [255 - value for value in range(256)]
+    return dark * 3, light * 3, invert * 3
 
-    for y in range(img.size[1]):  # Iterate over the height of the image
-        for x in range(img.size[0]):  # Iterate over the width of the image
-            pixel = pixels[x, y]
 
-            if (
-                0 <= pixel[0] <= text_range_value
-                and 0 <= pixel[1] <= text_range_value
-                and 0 <= pixel[2] <= text_range_value
-            ):
-                pixels[x, y] = (255 - pixel[0], 255 - pixel[1], 255 - pixel[2])
-            elif (
-                text_upper_bound <= pixel[0] <= 255
-                and text_upper_bound <= pixel[1] <= 255
-                and text_upper_bound <= pixel[2] <= 255
-            ):
-                pixels[x, y] = (255 - pixel[0], 255 - pixel[1], 255 - pixel[2])
+def apply_dark_mode(img, range_value=30, text_range_value=120):
+    """
+    Invert the near-black and near-white pixels of an RGB(A) image.
 
-    return img
+    A pixel is inverted when all three color channels are <= text_range_value or
+    all three are >= 255 - text_range_value.  Masks and the inversion are
+    Image.point lookups, so the whole image is processed in C.  Returns a new
+    image; callers must use the return value.
+    """
+    rgb = img if img.mode == "RGB" else img.convert("RGB")
+    dark_table, light_table, invert_table = dark_mode_tables(text_range_value)
+
+    # a channel-wise minimum turns "each channel in range" into "all channels in range"
+    red, green, blue = rgb.point(dark_table).split()
+    dark = ImageChops.darker(ImageChops.darker(red, green), blue)
+    red, green, blue = rgb.point(light_table).split()
+    light = ImageChops.darker(ImageChops.darker(red, green), blue)
+    mask = ImageChops.lighter(dark, light)
+
+    inverted = rgb.point(invert_table)
+    if img.mode != "RGB":
+        # inverted pixels come out opaque, as the old per-pixel assignment did
+        inverted = inverted.convert(img.mode)
+    return Image.composite(inverted, img, mask)
 
 
 import shlex
 
 def capture_screenshot_and_har_light(
-    url, output_path, timeout=30, name="unknown", invert=False, proxy=None, dark=True
+    url, output_path, timeout=30, name="unknown", invert=False, proxy=None, dark=True, overlay=None
 ):
     """
     Capture a screenshot of a URL using wkhtmltoimage (WebKit).
@@ -1086,7 +1236,7 @@ def capture_screenshot_and_har_light(
         print("wkhtmltoimage is not installed or not in the system path.")
         return False
 
-    output_path = output_path.replace(".png", ".tmp.png")
+    render_path = os.path.splitext(output_path)[0] + ".tmp.png"
 
     lsuccess = False
 
@@ -1109,13 +1259,13 @@ def capture_screenshot_and_har_light(
         "--enable-javascript",
         "--custom-header",
         "User-Agent",
-        UA,
+        config.UA,
         "--custom-header-propagation",
     ]
 
     # Safely add the URL to the command
     command.append(shlex.quote(url))
-    command.append(shlex.quote(output_path))
+    command.append(shlex.quote(render_path))
 
     # Execute the command
     try:
@@ -1132,34 +1282,20 @@ def capture_screenshot_and_har_light(
             print(" subprocess issue...", e)
         return False
 
-    if os.path.exists(output_path):
-        image = Image.open(output_path)
+    if os.path.exists(render_path):
         try:
-            image = image.convert("RGB")
+            with Image.open(render_path) as image:
+                image = image.convert("RGB")
         except Exception:
             print(" .. image exception")
             return False
+        finally:
+            os.unlink(render_path)
 
         if is_mostly_blank(image):
-            os.unlink(output_path)
             return False
 
-        # Convert the image to RGBA mode in case it's a format that doesn't support transparency
-        image = image.convert("RGB")
-        image = remove_background(image)
-
-        if dark:
-            image = apply_dark_mode(image)
-        image.save(output_path, "PNG")
-
-        if os.path.exists(output_path):
-            # TODO: add error mark from lerror
-            add_timestamp(output_path, name, invert=invert)
-            lsuccess = True
-            os.rename(output_path, output_path.replace(".tmp.png", ".png"))
-        else:
-            os.unlink(output_path)
-            lsuccess = False
+        lsuccess = finish_frame(image, output_path, name, invert=invert, dark=dark, overlay=overlay)
 
     # Here you would also capture HAR data, but let's focus on the screenshot for simplicity
     # Mock HAR Data (for demonstration)
@@ -1219,6 +1355,120 @@ def is_port_open(host, port, timeout=5):
             return False
 
 
+chrome_service_path = None
+chrome_service_path_time = 0
+
+
+def get_chrome_service():
+    """ChromeDriverManager().install() checks for updates on every call; only do that hourly."""
+    global chrome_service_path, chrome_service_path_time
+    from selenium.webdriver.chrome.service import Service
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    if chrome_service_path is None or chrome_service_path_time < time.time() - 60 * 60:
+        chrome_service_path = ChromeDriverManager().install()
+        chrome_service_path_time = time.time()
+    return Service(chrome_service_path)
+
+
+def browser_kind(stealth=False, headless=True):
+    """Pool key for a capture: vanilla or undetected chromedriver, optionally windowed."""
+    kind = "undetected" if stealth else "vanilla"
+    if not headless:
+        kind += "_windowed"
+    return kind
+
+
+def create_browser_session(kind):
+    """Start a fresh Chrome for the browser pool."""
+    import undetected_chromedriver as uc
+    from pyvirtualdisplay import Display
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_service = get_chrome_service()
+    main_version = extract_version(chrome_service.path)
+
+    # Note - if you're getting a lot of weird errors about the wrong chromedriver version, sometimes its best to
+    #  clear your ~/.wdm cache.
+
+    display = None
+    if kind.endswith("_windowed"):
+        display = Display(visible=0, size=(1920, 1080))
+        display.start()
+
+    try:
+        if kind.startswith("undetected"):
+            options = webdriver.ChromeOptions()
+            options.set_capability(
+                "goog:loggingPrefs", {"browser": "ALL", "performance": "ALL"}
+            )
+            if display is None:
+                driver = uc.Chrome(
+                    version_main=main_version,
+                    service=chrome_service,
+                    use_subprocess=False,
+                    headless=True,
+                    options=options,
+                )
+            else:
+                driver = uc.Chrome(
+                    version_main=main_version,
+                    service=chrome_service,
+                    use_subprocess=False,
+                    options=options,
+                )
+        else:
+            chrome_options = add_options(Options())
+            if display is None:  # try not to do this... user agent leaks and hard to unwind
+                chrome_options.add_argument("--headless")
+            chrome_options.add_argument("--user-agent=%s" % config.UA)
+            driver = webdriver.Chrome(service=chrome_service, options=chrome_options)
+    except Exception:
+        if display is not None:
+            display.stop()
+        raise
+
+    return BrowserSession(kind, driver, display)
+
+
+def cleanup_chrome_temp_dirs(session=None):
+    """Remove stale Chrome temp directories; run whenever a pooled browser is closed."""
+    try:
+        temp_chrome_dirs = glob.glob('/tmp/.com.google.Chrome.*') # TODO: make this more portable, its kind of linux specific
+        current_time = time.time()
+        cleaned_dirs = 0
+        for temp_dir in temp_chrome_dirs:
+            # Check if the directory hasn't been modified in the last hour
+            if os.path.isdir(temp_dir) and current_time - os.path.getmtime(temp_dir) > 3600:  # 3600 seconds = 1 hour
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                cleaned_dirs += 1
+        logging.debug(f"Cleaned up {cleaned_dirs} temporary Chrome directories")
+    except Exception as e:
+        logging.error(f"Error cleaning up temporary Chrome files: {e}")
+
+
+# warm browsers, one pool per process
+browser_pool = BrowserPool(
+    create_browser_session,
+    max_size=config.BROWSER_POOL_SIZE,
+    max_pages=config.BROWSER_POOL_MAX_PAGES,
+    max_age=config.BROWSER_POOL_MAX_AGE,
+    idle_timeout=config.BROWSER_POOL_IDLE_TIMEOUT,
+    on_close=cleanup_chrome_temp_dirs,
+)
+
+
+@subscribe
+def apply_settings(changes):
+    """New pool limits apply from the next checkout or return of a browser."""
+    if not any(name.startswith("BROWSER_POOL_") for name in changes):
+        return
+    browser_pool.max_size = config.BROWSER_POOL_SIZE
+    browser_pool.max_pages = config.BROWSER_POOL_MAX_PAGES
+    browser_pool.max_age = config.BROWSER_POOL_MAX_AGE
+    browser_pool.idle_timeout = config.BROWSER_POOL_IDLE_TIMEOUT
+
+
 def capture_screenshot_and_har(
     url,
     output_path,
@@ -1232,6 +1482,7 @@ def capture_screenshot_and_har(
     dark=True,
     headless=True,
     danger=False,
+    overlay=None,
 ):
     """
     Capture a screenshot of a URL using headless Chrome, optionally removing a popup before taking the screenshot.
@@ -1240,6 +1491,9 @@ def capture_screenshot_and_har(
     :param output_path: Name of the screenshot.
     :param popup_xpath: Optional XPath for a popup element to remove.
     """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+
     lsuccess = False
     ltime = time.time()
 
@@ -1252,10 +1506,8 @@ def capture_screenshot_and_har(
 
     # TODO: handle the use case of opening up a stream with the browser. We want it to cancel right away when that happens. I've noticed junk files get created in the root when this happens
 
-    display = None
+    session = None
     driver = None
-    chrome_service = None
-    main_version = None
     current_window_handle = None
     new_window_handle = None
     try:
@@ -1295,51 +1547,8 @@ def capture_screenshot_and_har(
 
             # TODO: should we consider a different display?()
         else:
-            chrome_service = Service(ChromeDriverManager().install())
-            driver_path = chrome_service.path
-            main_version = extract_version(driver_path)
-
-            # Note - if you're getting a lot of weird errors about the wrong chromedriver version, sometimes its best to
-            #  clear your ~/.wdm cache.
-
-            if stealth:
-                options = webdriver.ChromeOptions()
-                # options.set_capability("goog:loggingPrefs", {"browser": "ALL"})
-                # options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
-                options.set_capability(
-                    "goog:loggingPrefs", {"browser": "ALL", "performance": "ALL"}
-                )
-
-                if headless:
-                    driver = uc.Chrome(
-                        version_main=main_version,
-                        service=chrome_service,
-                        use_subprocess=False,
-                        headless=True,
-                        options=options,
-                    )
-                else:
-                    display = Display(visible=0, size=(1920, 1080))
-                    display.start()
-                    driver = uc.Chrome(
-                        version_main=main_version,
-                        service=chrome_service,
-                        use_subprocess=False,
-                        options=options,
-                    )
-            else:
-                chrome_options = add_options(Options())
-                if (
-                    headless
-                ):  # try not to do this... user agent leaks and hard to unwind
-                    chrome_options.add_argument("--headless")
-                else:
-                    display = Display(visible=0, size=(1920, 1080))
-                    display.start()
-                chrome_options.add_argument("--user-agent=%s" % UA)
-                driver = webdriver.Chrome(
-                    service=chrome_service, options=chrome_options
-                )
+            session = browser_pool.acquire(browser_kind(stealth, headless), timeout=timeout)
+            driver = session.driver
 
         if danger:
 
@@ -1483,6 +1692,8 @@ def capture_screenshot_and_har(
             current_window_handle = driver.current_window_handle
             driver.switch_to.window(new_window_handle)
 
+        # screenshots stay in memory as png bytes until finish_frame writes the final frame
+        png = None
         if dedicated_selector:
             try:
                 element = driver.find_element(By.XPATH, dedicated_selector)
@@ -1493,17 +1704,17 @@ def capture_screenshot_and_har(
                     driver.switch_to.frame(element)
                     try:
                         element = driver.find_element(By.XPATH, "//video")
-                        element.screenshot(output_path)
+                        png = element.screenshot_as_png
                     except Exception:
-                        driver.save_screenshot(output_path)
+                        png = driver.get_screenshot_as_png()
 
-                if not os.path.exists(output_path):
-                    element.screenshot(output_path)
+                if png is None:
+                    png = element.screenshot_as_png
             except Exception:
-                chrome_service = Service(ChromeDriverManager().install())
+                pass
 
-        if not os.path.exists(output_path):
-            driver.save_screenshot(output_path)
+        if png is None:
+            png = driver.get_screenshot_as_png()
 
         #####  screenshot
         if danger:
@@ -1511,20 +1722,14 @@ def capture_screenshot_and_har(
             new_window_handle = None
             driver.switch_to.window(current_window_handle)
 
-        if os.path.exists(output_path):
-            image = Image.open(output_path)
-            image = image.convert("RGB")
-            image = remove_background(image)
-            image.save(output_path, "PNG")
-            if os.path.exists(output_path):
-                add_timestamp(output_path, name, invert=invert)
+        finish_frame(Image.open(io.BytesIO(png)), output_path, name, invert=invert, overlay=overlay)
 
         logging.info(f"Successfully captured screenshot for {url} at {output_path}")
         lsuccess = True
     except TimeoutException:
         logging.warn(f"Timed out waiting for network to be idle for {url}")
     except Exception as e:
-        print(f"Error capturing screenshot for {url}", e, main_version)
+        print(f"Error capturing screenshot for {url}", e, session.kind if session else None)
 
         logging.error(
             f"Error capturing screenshot for {url}: {e} stealth: %s headless: %s"
@@ -1567,23 +1772,7 @@ def capture_screenshot_and_har(
                 except Exception as e:
                     print(">>>2", e)
                     pass
-        if driver and not danger:
-            driver.quit()
-        if display:
-            display.stop()
-
-        # Clean up temporary Chrome files
-        try:
-            temp_chrome_dirs = glob.glob('/tmp/.com.google.Chrome.*') # TODO: make this more portable, its kind of linux specific
-            current_time = time.time()
-            cleaned_dirs = 0
-            for temp_dir in temp_chrome_dirs:
-                # Check if the directory hasn't been modified in the last hour
-                if os.path.isdir(temp_dir) and current_time - os.path.getmtime(temp_dir) > 3600:  # 3600 seconds = 1 hour
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-                    cleaned_dirs += 1
-            logging.debug(f"Cleaned up {cleaned_dirs} temporary Chrome directories")
-        except Exception as e:
-            logging.error(f"Error cleaning up temporary Chrome files: {e}")
+        if session is not None:
+            browser_pool.release(session)
 
     return lsuccess
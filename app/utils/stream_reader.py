@@ -0,0 +1,265 @@
+# app/utils/stream_reader.py
+
+import atexit
+import logging
+import struct
+import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+import app.config as config
+from app.config import subscribe
+
+
+def stream_input_args(url):
+    """ffmpeg input options for a camera stream, shared by one-shot and persistent capture."""
+    command = []
+    probe_size = config.PROBE_SIZE_DEFAULT
+    if "http:" in url or "https:" in url:
+        parsed_url = urlparse(url)
+        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+        command.extend(["-headers", "User-Agent: %s\r\n" % config.UA])
+        command.extend(["-headers", f"referer: {base_url}\r\n"])
+        command.extend(["-headers", f"origin: {base_url}\r\n"])
+        command.extend(["-seekable", "0"])
+        # command.extend(['-timeout', str(CAPTURE_TIMEOUT-1)])  # not sure why, but this causes us a lot of issues, dont set a timetout
+        probe_size = config.PROBE_SIZE_DEFAULT
+    elif "rtsp:" in url:
+        command.extend(["-rtsp_transport", "tcp"])
+        probe_size = config.PROBE_SIZE_RTSP
+        if "/streaming/" in url.lower():  # alittle bit of a hack
+            command.extend(["-c:v", "h264"])
+            command.extend(["-r", "1"])
+            probe_size = config.PROBE_SIZE_OTHER
+    else:
+        probe_size = config.PROBE_SIZE_OTHER
+
+    # todo: make this configurable instead
+    command.extend(["-analyzeduration", probe_size])
+    command.extend(["-probesize", probe_size])
+    command.extend(
+        [
+            "-use_wallclock_as_timestamps",
+            "1",
+            #'-ec', '15',
+            "-threads",
+            "1",
+            "-skip_frame",
+            "nokey",
+            "-sn",
+            "-an",
+            #'-err_detect','aggressive',
+            "-i",
+            url,  # Input stream URL
+        ]
+    )
+    return command
+
+
+def read_bmp_frames(pipe):
+    """Yield whole BMP images from an ffmpeg image2pipe stream; the header carries each file's size."""
+    while True:
+        header = pipe.read(6)
+        if len(header) < 6 or header[:2] != b"BM":
+            return
+        size = struct.unpack("<I", header[2:6])[0]
+        body = pipe.read(size - 6)
+        if len(body) < size - 6:
+            return
+        yield header + body
+
+
+class StreamReader:
+    """
+    Keeps one ffmpeg decoder connected to a camera and holds its most recent frame.
+
+    ffmpeg only decodes keyframes, capped at STREAM_READER_FPS, and writes them
+    uncompressed to a pipe so nothing is encoded until a capture asks for a frame.
+    Dropped connections are retried with exponential backoff.  The reader shuts
+    itself down once nobody has asked for a frame in idle_timeout seconds, so
+    cameras with a long frequency reconnect per capture instead of idling on the NVR.
+    A watchdog enforces both the idle timeout and stall_timeout (no frame from a
+    connected ffmpeg) even while the pipe read is blocked and nobody is asking.
+    """
+
+    def __init__(self, url, idle_timeout=None, fps=None, max_backoff=None, stall_timeout=None):
+        self.url = url
+        self.idle_timeout = config.STREAM_READER_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.fps = config.STREAM_READER_FPS if fps is None else fps
+        self.max_backoff = config.STREAM_READER_MAX_BACKOFF if max_backoff is None else max_backoff
+        self.stall_timeout = config.STREAM_READER_MAX_FRAME_AGE if stall_timeout is None else stall_timeout
+        self.frame = None
+        self.frame_time = 0
+        self.connected_at = 0
+        self.last_request = time.time()
+        self.connects = 0
+        self.stalls = 0
+        self.process = None
+        self._stop = threading.Event()
+        self._new_frame = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._watchdog = threading.Thread(target=self._watch, daemon=True)
+
+    def command(self):
+        return (
+            [config.FFMPEG_PATH, "-hide_banner", "-loglevel", "error"]
+            + stream_input_args(self.url)
+            + [
+                "-vf",
+                f"select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{1 / self.fps})'",
+                "-vsync",
+                "vfr",
+                "-pix_fmt",
+                "bgr24",
+                "-c:v",
+                "bmp",
+                "-f",
+                "image2pipe",
+                "-",
+            ]
+        )
+
+    def start(self):
+        self._thread.start()
+        self._watchdog.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def is_alive(self):
+        return self._thread.is_alive() and not self._stop.is_set()
+
+    def idle(self):
+        return time.time() - self.last_request > self.idle_timeout
+
+    def stalled(self):
+        process = self.process
+        return (
+            process is not None and process.poll() is None
+            and time.time() - max(self.frame_time, self.connected_at) > self.stall_timeout
+        )
+
+    def _watch(self):
+        """Kill ffmpeg when the reader goes idle or stalls; _run blocks on the pipe and cannot tell."""
+        while not self._stop.wait(max(min(self.idle_timeout, self.stall_timeout, 5) / 2, 0.05)):
+            if self.idle():
+                self.stop()
+            elif self.stalled():
+                self.stalls += 1
+                logging.warning(f"Stream reader for {self.url} stalled, reconnecting")
+                self.process.kill()
+            elif not self._thread.is_alive():
+                return
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set() and not self.idle():
+            got_frame = False
+            try:
+                self.connects += 1
+                self.connected_at = time.time()
+                self.process = subprocess.Popen(
+                    self.command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+                )
+                for frame in read_bmp_frames(self.process.stdout):
+                    with self._new_frame:
+                        self.frame = frame
+                        self.frame_time = time.time()
+                        self._new_frame.notify_all()
+                    got_frame = True
+                    if self._stop.is_set() or self.idle():
+                        break
+            except Exception as e:
+                logging.error(f"Stream reader error for {self.url}: {e}")
+            finally:
+                if self.process is not None:
+                    if self.process.poll() is None:
+                        self.process.kill()
+                    self.process.wait()
+
+            if got_frame:
+                backoff = 1
+            elif not self._stop.is_set() and not self.idle():
+                logging.warning(f"Stream reader for {self.url} disconnected, retrying in {backoff}s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        self._stop.set()
+        with self._new_frame:
+            self._new_frame.notify_all()
+
+    def latest_frame(self, timeout, max_age=None):
+        """Return the newest frame no older than max_age (STREAM_READER_MAX_FRAME_AGE), waiting up to timeout for one."""
+        if max_age is None:
+            max_age = config.STREAM_READER_MAX_FRAME_AGE
+        self.last_request = time.time()
+        deadline = self.last_request + timeout
+        with self._new_frame:
+            while True:
+                if self.frame is not None and time.time() - self.frame_time <= max_age:
+                    return self.frame
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.is_alive():
+                    break
+                self._new_frame.wait(remaining)
+
+        # connected but stalled: drop the connection so the reader reconnects
+        process = self.process
+        if process is not None and process.poll() is None and time.time() - self.frame_time > max_age:
+            logging.warning(f"Stream reader for {self.url} stalled, reconnecting")
+            process.kill()
+        return None
+
+
+stream_readers = {}
+stream_readers_lock = threading.Lock()
+
+
+def get_stream_reader(url, idle_timeout=None):
+    """Return the running reader for a url, starting one if needed."""
+    with stream_readers_lock:
+        reader = stream_readers.get(url)
+        if reader is None or not reader.is_alive():
+            reader = StreamReader(url, idle_timeout=idle_timeout or None).start()
+            stream_readers[url] = reader
+        reader.last_request = time.time()
+        return reader
+
+
+@subscribe
+def apply_settings(changes):
+    """Running readers take changed settings on their next (re)connect or idle check."""
+    if not any(name.startswith("STREAM_READER_") for name in changes):
+        return
+    with stream_readers_lock:
+        for reader in stream_readers.values():
+            reader.idle_timeout = config.STREAM_READER_IDLE_TIMEOUT
+            reader.fps = config.STREAM_READER_FPS
+            reader.max_backoff = config.STREAM_READER_MAX_BACKOFF
+            reader.stall_timeout = config.STREAM_READER_MAX_FRAME_AGE
+
+
+def release_stream_reader(url):
+    """Stop and forget a url's reader, e.g. when its camera captures less often than the idle timeout."""
+    with stream_readers_lock:
+        reader = stream_readers.pop(url, None)
+    if reader is not None:
+        reader.stop()
+
+
+def stop_stream_readers():
+    with stream_readers_lock:
+        for reader in stream_readers.values():
+            reader.stop()
+        stream_readers.clear()
+
+
+atexit.register(stop_stream_readers)
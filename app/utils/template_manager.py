@@ -1,21 +1,43 @@
 # app/utils/template_manager.py
 
+import logging
+import multiprocessing.util
 import os
 import re
 import shutil
 import random
+import threading
+import time
 from datetime import datetime
 
 from sqlalchemy import Boolean, Column, Float, Integer, String, Text
 from werkzeug.utils import secure_filename
 
-from app.config import SCREENSHOT_DIRECTORY, VIDEO_DIRECTORY
+import app.config as config
+from app.config import DATABASE_PATH, SCREENSHOT_DIRECTORY, VIDEO_DIRECTORY
 
 from .db import Base, SessionLocal, init_db
+from .detect import MOTION_DETECTORS, parse_motion_mask
+from .frames import is_frame_file
 from .video_details import get_latest_screenshot_date, get_latest_video_date
 
 from sqlalchemy.orm import validates
 
+# template fields that decide how a template is captured (see screenshots.capture_or_download)
+CAPTURE_PLAN_INPUTS = [
+    "url", "popup_xpath", "dedicated_xpath", "headless", "stealth", "browser", "danger", "persistent_stream",
+]
+
+# columns update_camera writes on nearly every capture; saved with narrow UPDATEs (see StatusWriter)
+HOT_FIELDS = [
+    "last_caption", "last_caption_time", "last_motion_caption", "last_motion_time", "last_screenshot_time",
+    "last_ret",
+]
+
+# every write to a template appends a byte here; its size and mtime version the template cache
+TEMPLATE_VERSION_PATH = f"{DATABASE_PATH}.templates"
+
+
 class Template(Base):
     __tablename__ = "templates"
 
@@ -49,7 +71,17 @@ class Template(Base):
     danger = Column(Boolean, default=False)
     motion = Column(Float, default=0.2)
     rollback_frames = Column(Integer, default=0)
-    last_ret = None
+    persistent_stream = Column(Boolean, default=False)
+    frame_format = Column(String, default="")  # empty: use FRAME_FORMAT
+    adaptive = Column(Boolean, default=False)  # let motion history move the interval
+    min_frequency = Column(Integer, default=0)  # adaptive bounds in minutes; 0 picks a default
+    max_frequency = Column(Integer, default=0)
+    motion_detector = Column(String, default="")  # "" whole-frame SSIM, "grid" block grid
+    motion_mask = Column(Text, default="")  # rectangles motion detection ignores or watches
+    capture_method = Column(String, default="")
+    capture_content_type = Column(String, default="")
+    capture_plan_time = Column(String, default="")
+    last_ret = Column(Text, default="")  # the last caption reply that was refused
 
     @validates('frequency')
     def validate_frequency(self, key, frequency):
@@ -114,6 +146,10 @@ class TemplateManager:
                     try:
                         if key == "rollback_frames":
                             value = int(value)
+                        elif key in ["min_frequency", "max_frequency"]:
+                            value = int(value or 0)
+                            if value < 0 or value > 525600:
+                                raise ValueError(f"{key} must be between 0 and 525600 (1 year)")
                         elif key in ["frequency", "timeout"]:
                             if value == "":
                                 value = 30
@@ -130,10 +166,17 @@ class TemplateManager:
                             value = float(value)
                             if details.get("object_filter", template.object_filter) and (value < 0 or value > 1):
                                 raise ValueError("Object confidence must be between 0 and 1")
+                        elif key == "motion_detector":
+                            value = value or ""
+                            if value not in MOTION_DETECTORS:
+                                raise ValueError(f"motion_detector must be one of {MOTION_DETECTORS}")
+                        elif key == "motion_mask":
+                            value = (value or "").strip()
+                            parse_motion_mask(value)
                         elif key in ["popup_xpath", "dedicated_xpath"]:
                             if value and not value.startswith('//'):
                                 raise ValueError(f"{key} must start with '//'")
-                        elif key in ["stealth", "headless", "dark", "invert"]:
+                        elif key in ["stealth", "headless", "dark", "invert", "persistent_stream", "adaptive"]:
                             if value == "on":
                                 value = True
                             elif value == "off":
@@ -152,6 +195,10 @@ class TemplateManager:
                     if getattr(template, key) != value:
                         setattr(template, key, value)
                         ldelta = True
+                        if key in CAPTURE_PLAN_INPUTS and "capture_method" not in details:
+                            # how the template is captured changed; make the next capture probe again
+                            template.capture_method = ""
+                            template.capture_plan_time = ""
             if ldelta is True:
                 session.commit()
             return True
@@ -203,9 +250,210 @@ class TemplateManager:
             session.close()
 
 
+TEMPLATE_COLUMNS = [column.name for column in Template.__table__.columns]
+
+
+class TemplateCache:
+    """
+    This process's copy of every template, kept by get_template and get_templates.
+
+    save_template and update_template_fields write through the database to here.
+    Each write also appends a byte to TEMPLATE_VERSION_PATH; a read that finds its
+    size or mtime changed by someone else reloads all templates with one query, so
+    edits made in the web app reach the capture worker processes on their next read.
+    Without a version file (no data directory) every read goes to the database.
+    """
+
+    def __init__(self, path=TEMPLATE_VERSION_PATH):
+        self.path = path
+        self.templates = None
+        self.version = None
+        self.lock = threading.RLock()
+
+    def _version(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            try:
+                os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644))
+                stat = os.stat(self.path)
+            except OSError:
+                return None
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def current(self):
+        """name -> template dict, reloaded first if the templates changed anywhere."""
+        with self.lock:
+            version = self._version()
+            if self.templates is None or version is None or version != self.version:
+                self.templates = TemplateManager().get_templates()
+                self.version = version
+                # status writes this process has queued but not yet flushed
+                for name, fields in status_writer.queued().items():
+                    if name in self.templates:
+                        self.templates[name].update(fields)
+            return self.templates
+
+    def get(self, name):
+        template = self.current().get(name)
+        return dict(template) if template is not None else {}
+
+    def apply(self, name, fields):
+        """Show fields on the cached template without writing anything."""
+        with self.lock:
+            if self.templates is not None and name in self.templates:
+                self.templates[name].update(fields)
+
+    def changed(self, name, fields=None):
+        """
+        Record a write this process made: fields applied to the cached template, or
+        with fields None the template dropped so the next read reloads it.
+        """
+        with self.lock:
+            if fields is None:
+                self.templates = None
+            else:
+                self.apply(name, fields)
+            self.bump()
+
+    def bump(self):
+        """Tell the other processes the templates changed, keeping our copy if nobody else wrote."""
+        with self.lock:
+            seen = self.version
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, b".")
+                    stat = os.fstat(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                self.version = None
+                return
+            if stat.st_size > 1 << 20:
+                # nobody can have seen this size and mtime yet, so starting over is safe
+                os.truncate(self.path, 0)
+                self.version = None
+            elif seen is not None and stat.st_size == seen[0] + 1:
+                # only our own byte since we last looked: our copy is current
+                self.version = (stat.st_size, stat.st_mtime_ns)
+            else:
+                self.version = None
+
+
+class StatusWriter:
+    """
+    Queues this process's status writes (HOT_FIELDS) and writes them in the background.
+
+    Every STATUS_FLUSH_INTERVAL ms whatever has been queued, for any number of
+    cameras, goes to the database in one transaction: one UPDATE per template,
+    however many times its fields were set in between.  Queued values show in
+    this process's template cache at once, and in other processes' after the flush.
+
+    Whatever is still queued when the process exits is flushed then.  Capture pool
+    workers leave through multiprocessing, which skips atexit handlers, so this is
+    a multiprocessing finalizer: those run at a worker's exit and at the main
+    process's atexit alike.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval  # seconds; None follows STATUS_FLUSH_INTERVAL
+        self.pending = {}
+        self.inflight = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.metrics = {"queued": 0, "coalesced": 0, "flushes": 0, "updates": 0, "failed": 0}
+
+    def put(self, name, fields):
+        with self.lock:
+            if self.pid != os.getpid():
+                # a forked child: the parent flushes what it had queued itself
+                self.pending = {}
+                self.start()
+            queued = self.pending.setdefault(name, {})
+            self.metrics["queued"] += 1
+            self.metrics["coalesced"] += len(queued.keys() & fields.keys())
+            queued.update(fields)
+        template_cache.apply(name, fields)
+
+    def queued(self):
+        """Everything queued and not yet committed, name -> fields."""
+        with self.lock:
+            queued = {name: dict(fields) for name, fields in self.inflight.items()}
+            for name, fields in self.pending.items():
+                queued.setdefault(name, {}).update(fields)
+            return queued
+
+    def start(self):
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.run, name="status-writer", daemon=True)
+        self.thread.start()
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+    def run(self):
+        pid = self.pid
+        while self.pid == pid:
+            time.sleep(config.STATUS_FLUSH_INTERVAL / 1000 if self.interval is None else self.interval)
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far in one transaction; returns how many templates were updated."""
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                self.inflight = batch
+            if not batch:
+                return 0
+            init_db()
+            session = SessionLocal()
+            try:
+                for name, fields in batch.items():
+                    session.query(Template).filter_by(name=name).update(fields, synchronize_session=False)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                with self.lock:
+                    # put it back under anything queued since, which is newer
+                    for name, fields in batch.items():
+                        self.pending[name] = {**fields, **self.pending.get(name, {})}
+                    self.inflight = {}
+                    self.metrics["failed"] += 1
+                logging.warning(f"Could not write template status, will retry: {e}")
+                return 0
+            finally:
+                session.close()
+            template_cache.bump()
+            with self.lock:
+                self.inflight = {}
+                self.metrics["flushes"] += 1
+                self.metrics["updates"] += len(batch)
+            return len(batch)
+
+
+template_cache = TemplateCache()
+status_writer = StatusWriter()
+
+
+def queue_template_status(name: str, **fields):
+    """
+    Set status fields (HOT_FIELDS) of a template through the background StatusWriter.
+
+    For update_camera and anything else that writes status on every capture; use
+    update_template_fields when the write must be in the database on return.
+    """
+    unknown = [key for key in fields if key not in HOT_FIELDS]
+    if unknown:
+        raise ValueError(f"not template status fields: {unknown}")
+    if fields:
+        status_writer.put(name, fields)
+
+
 def get_templates():
-    manager = TemplateManager()
-    templates = manager.get_templates()
+    templates = {name: dict(details) for name, details in template_cache.current().items()}
     for template_name, details in templates.items():
         if template_name is None or template_name == "":
             continue
@@ -220,16 +468,35 @@ def get_template(name):
     if not re.findall(r"^[a-zA-Z0-9_\-\.]{1,32}$", name):
         return None
 
-    manager = TemplateManager()
-    return manager.get_template(name)
+    return template_cache.get(name)
 
 
 def save_template(name: str, template_data) -> bool:
+    """
+    Save the fields of template_data that differ from the stored template.
+
+    When only HOT_FIELDS changed this is a single UPDATE (update_template_fields);
+    anything else goes through TemplateManager.save_template and its validation.
+    """
     if not re.findall(r"^[a-zA-Z0-9_\-\.]{1,32}$", name):
         return False
 
-    manager = TemplateManager()
-    manager.save_template(name, template_data)
+    current = template_cache.current().get(name)
+    if current is None:
+        TemplateManager().save_template(name, {"name": name, **template_data})
+        template_cache.changed(name)
+    else:
+        changes = {
+            key: value for key, value in template_data.items()
+            if key in TEMPLATE_COLUMNS and current.get(key) != value
+        }
+        if changes and set(changes) <= set(HOT_FIELDS):
+            update_template_fields(name, **changes)
+        elif changes:
+            if "capture_method" in template_data and any(key in CAPTURE_PLAN_INPUTS for key in changes):
+                changes["capture_method"] = template_data["capture_method"]  # keep the plan, as before
+            TemplateManager().save_template(name, changes)
+            template_cache.changed(name)
     screenshot_full_path = os.path.join(SCREENSHOT_DIRECTORY, secure_filename(name))
     os.makedirs(screenshot_full_path, exist_ok=True)
     video_full_path = os.path.join(VIDEO_DIRECTORY, secure_filename(name))
@@ -245,6 +512,7 @@ def delete_template(name: str) -> bool:
     manager = TemplateManager()
     success = manager.delete_template(name)
     if success:
+        template_cache.changed(name)
         screenshot_full_path = os.path.join(SCREENSHOT_DIRECTORY, secure_filename(name))
         if os.path.exists(screenshot_full_path) and os.path.isdir(screenshot_full_path):
             shutil.rmtree(screenshot_full_path)
@@ -254,6 +522,43 @@ def delete_template(name: str) -> bool:
     return success
 
 
+def update_template_fields(name: str, **fields) -> bool:
+    """
+    Set a few columns of one template with a single UPDATE, without loading it first.
+
+    Meant for HOT_FIELDS, which need no validation; returns False if there is no
+    such template.
+    """
+    if not re.findall(r"^[a-zA-Z0-9_\-\.]{1,32}$", name):
+        return False
+    unknown = [key for key in fields if key not in TEMPLATE_COLUMNS]
+    if unknown:
+        raise ValueError(f"not template columns: {unknown}")
+    if not fields:
+        return True
+
+    init_db()
+    session = SessionLocal()
+    try:
+        updated = session.query(Template).filter_by(name=name).update(fields, synchronize_session=False)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        print(f"Error updating template: {str(e)}")
+        return False
+    finally:
+        session.close()
+    if updated:
+        template_cache.changed(name, fields)
+    return bool(updated)
+
+
+def update_last_screenshot_time(name: str) -> bool:
+    return update_template_fields(
+        name, last_screenshot_time=datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    )
+
+
 def get_template_by_id(template_id: int):
     manager = TemplateManager()
     return manager.get_template_by_id(template_id)
@@ -267,11 +572,11 @@ def get_screenshots_for_template(name: str) -> list:
     screenshots = [
         f
         for f in os.listdir(os.path.join(SCREENSHOT_DIRECTORY, name))
-        if f.startswith(name) and f.endswith(".png") and ".tmp" not in f
+        if f.startswith(name) and is_frame_file(f)
     ]
     sorted_screenshots = sorted(
         screenshots,
-        key=lambda x: datetime.strptime(x[len(name) + 1 : -4], "%Y%m%d%H%M%S"),
+        key=lambda x: datetime.strptime(os.path.splitext(x)[0][len(name) + 1 :], "%Y%m%d%H%M%S"),
         reverse=True,
     )
     return sorted_screenshots[:10]
@@ -299,7 +604,7 @@ def get_screenshot_count(name: str) -> int:
     screenshot_path = os.path.join(SCREENSHOT_DIRECTORY, name)
     if not os.path.exists(screenshot_path):
         return 0
-    return len([f for f in os.listdir(screenshot_path) if f.endswith('.png')])
+    return len([f for f in os.listdir(screenshot_path) if is_frame_file(f)])
 
 def get_video_count(name: str) -> int:
     if not re.findall(r"^[a-zA-Z0-9_\-\.]{1,32}$", name):
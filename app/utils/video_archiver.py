@@ -10,17 +10,19 @@ import time
 
 from werkzeug.utils import secure_filename
 
+import app.config as config
 from app.config import (
-    MAX_COMPRESSED_VIDEO_AGE,
-    MAX_IN_PROCESS_VIDEO_SIZE,
     NAME,
     SCREENSHOT_DIRECTORY,
-    VERSION,
     VIDEO_DIRECTORY,
 )
 
+from .frames import frame_time, list_frames
 from .template_manager import get_templates
 
+# ffmpeg decoder for each frame storage format (see frames.FRAME_FORMATS)
+FRAME_DECODERS = {".png": "png", ".webp": "webp", ".jpg": "mjpeg"}
+
 
 # TODO: move this to utils so it is not duplicated in routes.py
 def validate_template_name(template_name: str):
@@ -294,75 +296,20 @@ def handle_concat_error(e, temp_video, in_process_video) -> bool:
             os.rename(temp_video, in_process_video)
 
 
-def compile_to_video(camera_path, video_path) -> bool:
-
-    os.makedirs(video_path, exist_ok=True)
-    os.makedirs(camera_path, exist_ok=True)
+def frame_format_runs(files):
+    """Split sorted frame paths into (extension, frames) runs, oldest first; FRAME_FORMAT changes start a new run."""
+    runs = []
+    for f in files:
+        ext = os.path.splitext(f)[1]
+        if runs and runs[-1][0] == ext:
+            runs[-1][1].append(f)
+        else:
+            runs.append((ext, [f]))
+    return runs
 
-    if not os.path.isdir(video_path):
-        return False
-    if not os.path.isdir(camera_path):
-        return False
-
-    in_process_video = os.path.join(video_path, "in_process.mp4")
-
-    # Check if there is an "in-process" video and its size
-    # TODO: check the creation_time and if it exceeds the alotment, then alos roll over
-    if os.path.isfile(in_process_video):
-        file_size_exceeded = (
-            os.path.getsize(in_process_video) > MAX_IN_PROCESS_VIDEO_SIZE
-        )
-        file_age_exceeded = (
-            datetime.datetime.utcnow()
-            - datetime.datetime.fromtimestamp(os.path.getctime(in_process_video))
-        ).total_seconds() > MAX_COMPRESSED_VIDEO_AGE * 60 * 60 * 24 * 7
-
-        # condsider when the length is 2x300 frames as well.  so we always have perfect overlap at 2x
-
-        if file_size_exceeded or file_age_exceeded:
-            # Rename the "in-process" video to a "final" video with a timestamp
-            final_video_name = f"final_{int(os.path.getmtime(in_process_video))}.mp4"
-            # TODO: should we optimize the timing better?
-            final_video_path = os.path.join(video_path, final_video_name)
-            os.rename(in_process_video, final_video_path)
-            # print(f'Video finalized: {final_video_path}')
-            # this is going to generate overlapping segments, which is OK for now .
-
-    # Get the modification time of the in-process video
-    video_mod_time = 0
-    ldur = 0
-    if os.path.exists(in_process_video):
-        video_mod_time = os.path.getmtime(in_process_video)
-        ldur = get_video_duration(in_process_video)
-        if (
-            ldur < 10 and time.time() - video_mod_time > 60 * 60
-        ):  # could be a waste of 300 frames...
-            # print("  skipping ", in_process_video, ldur, time.time() - video_mod_time)
-            video_mod_time = 0
-            # go bigger...
-
-    if os.path.exists(in_process_video) and ldur >= int(300 / 25 * 2):  # rotate!
-        # Rename the "in-process" video to a "final" video with a timestamp
-        final_video_name = f"final_{int(os.path.getmtime(in_process_video))}.mp4"
-        # TODO: should we optimize the timing better?
-        final_video_path = os.path.join(video_path, final_video_name)
-        os.rename(in_process_video, final_video_path)
-        # we should finalize at the END of the encode , right?
-        # print(f'Video finalized: {final_video_path}')  #log instead
-        # this is going to generate overlapping segments, which is OK for now .
-
-    #print("OK", glob.glob(camera_path + "/*.png"))
-
-    # Filter the list of image files to include only those that are newer than the video
-    new_files = [
-        f
-        for f in glob.glob(camera_path + "/*.png")
-        if os.path.getctime(f) > video_mod_time
-    ]
-    new_files = sorted(new_files)
-
-    #print("compile", time.time(), video_mod_time, len(new_files))
 
+def encode_frames(new_files, frame_ext, in_process_video, video_path, video_mod_time):
+    """Encode frames of one format and add them to the in-process video."""
     if len(new_files) > 0:
         # Create a temporary file with the list of new frames
         lcount = 0
@@ -392,7 +339,7 @@ def compile_to_video(camera_path, video_path) -> bool:
             "-r",
             "25",  # for some reason the standard for png?
             "-c:v",
-            "png",
+            FRAME_DECODERS.get(frame_ext, "png"),
             "-use_wallclock_as_timestamps",
             "1",
             "-err_detect",
@@ -418,7 +365,7 @@ def compile_to_video(camera_path, video_path) -> bool:
             ["-metadata", "creation_time=%sZ" % datetime.datetime.utcnow()]
         )
         create_command.extend(["-metadata", "encoded_by=%s" % NAME])
-        create_command.extend(["-metadata", "version=%s" % VERSION])
+        create_command.extend(["-metadata", "version=%s" % config.VERSION])
         create_command.extend(
             ["-y", os.path.abspath(temp_video)]
         )  # Overwrite if exists
@@ -467,6 +414,87 @@ def compile_to_video(camera_path, video_path) -> bool:
                     # yeah concatenate anyway
                     ltest = concatenate_videos(in_process_video, temp_video, video_path)
 
+
+def compile_to_video(camera_path, video_path) -> bool:
+
+    os.makedirs(video_path, exist_ok=True)
+    os.makedirs(camera_path, exist_ok=True)
+
+    if not os.path.isdir(video_path):
+        return False
+    if not os.path.isdir(camera_path):
+        return False
+
+    in_process_video = os.path.join(video_path, "in_process.mp4")
+
+    # Check if there is an "in-process" video and its size
+    # TODO: check the creation_time and if it exceeds the alotment, then alos roll over
+    if os.path.isfile(in_process_video):
+        file_size_exceeded = (
+            os.path.getsize(in_process_video) > config.MAX_IN_PROCESS_VIDEO_SIZE
+        )
+        file_age_exceeded = (
+            datetime.datetime.utcnow()
+            - datetime.datetime.fromtimestamp(os.path.getctime(in_process_video))
+        ).total_seconds() > config.MAX_COMPRESSED_VIDEO_AGE * 60 * 60 * 24 * 7
+
+        # condsider when the length is 2x300 frames as well.  so we always have perfect overlap at 2x
+
+        if file_size_exceeded or file_age_exceeded:
+            # Rename the "in-process" video to a "final" video with a timestamp
+            final_video_name = f"final_{int(os.path.getmtime(in_process_video))}.mp4"
+            # TODO: should we optimize the timing better?
+            final_video_path = os.path.join(video_path, final_video_name)
+            os.rename(in_process_video, final_video_path)
+            # print(f'Video finalized: {final_video_path}')
+            # this is going to generate overlapping segments, which is OK for now .
+
+    # Get the modification time of the in-process video
+    video_mod_time = 0
+    ldur = 0
+    if os.path.exists(in_process_video):
+        video_mod_time = os.path.getmtime(in_process_video)
+        ldur = get_video_duration(in_process_video)
+        if (
+            ldur < 10 and time.time() - video_mod_time > 60 * 60
+        ):  # could be a waste of 300 frames...
+            # print("  skipping ", in_process_video, ldur, time.time() - video_mod_time)
+            video_mod_time = 0
+            # go bigger...
+
+    if os.path.exists(in_process_video) and ldur >= int(300 / 25 * 2):  # rotate!
+        # Rename the "in-process" video to a "final" video with a timestamp
+        final_video_name = f"final_{int(os.path.getmtime(in_process_video))}.mp4"
+        # TODO: should we optimize the timing better?
+        final_video_path = os.path.join(video_path, final_video_name)
+        os.rename(in_process_video, final_video_path)
+        # we should finalize at the END of the encode , right?
+        # print(f'Video finalized: {final_video_path}')  #log instead
+        # this is going to generate overlapping segments, which is OK for now .
+
+    # Filter the list of image files to include only those that are newer than the video
+    new_files = [
+        f
+        for f in (os.path.join(camera_path, frame) for frame in list_frames(camera_path))
+        if frame_time(f) > video_mod_time
+    ]
+    new_files = sorted(new_files)
+
+    # the concat demuxer needs one codec: after a FRAME_FORMAT change the frames in the
+    # old format go out as a segment of their own before the new format starts
+    runs = frame_format_runs(new_files)
+    for frame_ext, run in runs[:-1]:
+        encode_frames(run, frame_ext, in_process_video, video_path, video_mod_time)
+        if os.path.exists(in_process_video):
+            final_video_name = f"final_{int(os.path.getmtime(in_process_video))}.mp4"
+            os.rename(in_process_video, os.path.join(video_path, final_video_name))
+        video_mod_time = 0
+    frame_ext, new_files = runs[-1] if runs else (".png", [])
+
+    #print("compile", time.time(), video_mod_time, len(new_files))
+
+    encode_frames(new_files, frame_ext, in_process_video, video_path, video_mod_time)
+
     # Add new screenshots to the "in-process" video
     # Assuming screenshots are added at a regular interval, they can be appended in order
     # Here, you would add logic to append new screenshots to the "in-process" video using ffmpeg
@@ -0,0 +1,115 @@
+# benchmarks/bench_clip.py
+#
+# Latency and accuracy of the CLIP object filter's precision/resolution modes
+# (CLIP_QUANTIZE, CLIP_IMAGE_SIZE) against the fp32, full resolution model.
+#
+#   python benchmarks/bench_clip.py [frames_dir] [prompt ...]
+#
+# frames_dir is a camera directory to use as the fixture set; without one a set
+# of synthetic scenes is used.  Without the pretrained weights (offline) the
+# benchmark falls back to a randomly initialised ViT-B/32, which still gives
+# representative latency but only embedding-level agreement.
+#
+# Accuracy is compared on raw image-text cosine similarities, and on the
+# probabilities the object filter actually uses: each prompt against
+# OBJECT_FILTER_BACKGROUND.  A softmax over a single prompt is always 1.0, so
+# probabilities are never taken over fewer than two prompts.
+
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.config import OBJECT_FILTER_BACKGROUND
+from app.utils.clip_service import ClipModel, softmax
+from app.utils.frames import list_frames
+
+MODES = [("fp32", False, 0), ("int8", True, 0), ("fp32 160px", False, 160), ("int8 160px", True, 160)]
+PROMPTS = ["a person", "a car", "a dog", "an empty street", "a snowy road"]
+BATCH = 8
+
+
+def synthetic_scenes(count=16, size=(640, 360)):
+    """Noisy backgrounds with a few bright shapes, roughly like a camera frame."""
+    rng = np.random.default_rng(0)
+    scenes = []
+    for _ in range(count):
+        pixels = rng.integers(0, 80, size=(size[1], size[0], 3), dtype=np.uint8)
+        image = Image.fromarray(pixels, "RGB")
+        draw = ImageDraw.Draw(image)
+        for _ in range(rng.integers(1, 5)):
+            x, y = rng.integers(0, size[0] - 80), rng.integers(0, size[1] - 80)
+            w, h = rng.integers(20, 80, size=2)
+            draw.rectangle([x, y, x + w, y + h], fill=tuple(int(c) for c in rng.integers(0, 256, 3)))
+        scenes.append(image)
+    return scenes
+
+
+def load_fixtures(directory=None):
+    if directory:
+        return [Image.open(os.path.join(directory, f)).convert("RGB") for f in list_frames(directory)[-32:]]
+    return synthetic_scenes()
+
+
+def load_base():
+    """The pretrained model and processors, or a random ViT-B/32 when offline."""
+    from transformers import CLIPConfig, CLIPImageProcessor, CLIPModel, CLIPProcessor
+
+    try:
+        processor = CLIPProcessor.from_pretrained(ClipModel().model_name)
+        model = CLIPModel.from_pretrained(ClipModel().model_name)
+        return model, processor.image_processor, processor.tokenizer
+    except Exception as e:
+        print(f"pretrained weights unavailable ({type(e).__name__}); using random weights, no text scores")
+        return CLIPModel(CLIPConfig()), CLIPImageProcessor(), None
+
+
+def timeit(func, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_modes(images, prompts):
+    base, image_processor, tokenizer = load_base()
+    reference = None
+    for label, quantize, image_size in MODES:
+        clip = ClipModel(quantize=quantize, image_size=image_size)
+        clip.prepare(copy.deepcopy(base), image_processor, tokenizer)
+        batch = images[:BATCH]
+        clip.image_embeddings(batch)  # warm up
+        latency = timeit(clip.image_embeddings, batch) / len(batch)
+        embeddings = np.concatenate([clip.image_embeddings(images[i:i + BATCH])
+                                     for i in range(0, len(images), BATCH)])
+        similarities = filter_probs = None
+        if tokenizer is not None:
+            similarities = embeddings @ clip.text_embeddings(prompts).T
+            background = embeddings @ clip.text_embeddings([OBJECT_FILTER_BACKGROUND]).T
+            # as the object filter scores: each prompt against the background prompt
+            filter_probs = np.array([[softmax(clip.logit_scale * np.array([s, b]))[0] for s in row]
+                                     for row, (b,) in zip(similarities, background)])
+        if reference is None:
+            reference = (embeddings, similarities, filter_probs)
+        line = "%-11s %7.1f ms/frame" % (label, latency * 1000)
+        line += "   embedding cosine vs fp32 %.4f" % np.mean(np.sum(embeddings * reference[0], axis=1))
+        if similarities is not None:
+            line += "   max similarity diff %.4f   max filter prob diff %.3f" % (
+                np.abs(similarities - reference[1]).max(), np.abs(filter_probs - reference[2]).max())
+            if len(prompts) > 1:
+                agree = np.mean(similarities.argmax(axis=1) == reference[1].argmax(axis=1))
+                line += "   top prompt agrees %5.1f%%" % (agree * 100)
+        print(line)
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else None
+    bench_modes(load_fixtures(directory), sys.argv[2:] or PROMPTS)
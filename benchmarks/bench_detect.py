@@ -0,0 +1,119 @@
+# benchmarks/bench_detect.py
+#
+# Motion check cost in app/utils/detect.py: decoding both frames versus the
+# cached thumbnails, and scoring many cameras in one batch.  Also the cost of
+# a "frames like this one" search over the perceptual hash index.
+#
+#   python benchmarks/bench_detect.py
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+from skimage.metrics import structural_similarity
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.utils.detect as detect
+from app.utils.detect import (
+    batch_differences,
+    frame_difference,
+    grid_motion,
+    motion_mask,
+    motion_thumbnail,
+    save_thumbnail,
+    tile_changes,
+)
+
+import app.utils.frame_hashes as frame_hashes
+from app.utils.frame_hashes import dhash, hamming
+
+from bench_screenshots import RESOLUTIONS, make_capture, timeit
+
+CAMERAS = 64
+
+
+def decode_both(path_a, path_b):
+    """The previous check: decode both full frames from disk, then skimage SSIM."""
+    a = np.array(Image.open(path_a).resize((100, 100)).convert("L"))
+    b = np.array(Image.open(path_b).resize((100, 100)).convert("L"))
+    return 1 - structural_similarity(a, b, full=True)[0]
+
+
+def bench_motion_check():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        for label, size in RESOLUTIONS.items():
+            previous, current = make_capture(size, seed=1), make_capture(size, seed=2)
+            path_a = os.path.join(tmpdirname, f"cam_{label}_a.png")
+            path_b = os.path.join(tmpdirname, f"cam_{label}_b.png")
+            previous.save(path_a)
+            current.save(path_b)
+            save_thumbnail(path_a, motion_thumbnail(previous))
+            thumbnail = motion_thumbnail(current)
+
+            def from_sidecar():
+                detect.last_thumbnails.clear()
+                frame_difference(path_a, thumbnail)
+
+            print("motion check       %-6s decode both %8.2f ms   sidecar %6.3f ms   in memory %6.3f ms" % (
+                label, timeit(decode_both, path_a, path_b) * 1000,
+                timeit(from_sidecar) * 1000,
+                timeit(frame_difference, path_a, thumbnail) * 1000,
+            ))
+
+
+def bench_batch():
+    rng = np.random.default_rng(0)
+    previous = rng.integers(0, 256, size=(CAMERAS, 100, 100), dtype=np.uint8)
+    current = rng.integers(0, 256, size=(CAMERAS, 100, 100), dtype=np.uint8)
+
+    def one_by_one():
+        for a, b in zip(previous, current):
+            1 - structural_similarity(a, b)
+
+    print("%d cameras          skimage loop %8.2f ms   batch %8.2f ms" % (
+        CAMERAS, timeit(one_by_one) * 1000, timeit(batch_differences, previous, current) * 1000))
+
+
+def bench_grid():
+    rng = np.random.default_rng(0)
+    previous = rng.integers(0, 256, size=(CAMERAS, 100, 100), dtype=np.uint8)
+    current = rng.integers(0, 256, size=(CAMERAS, 100, 100), dtype=np.uint8)
+    mask = motion_mask("90,0,100,8")
+    walking = previous[0].copy()
+    walking[50:80, 20:32] = 255  # someone walking through an otherwise still scene
+    print("one camera         ssim %8.3f ms   grid %8.3f ms   grid+mask %8.3f ms   all tiles moving %8.3f ms" % (
+        timeit(batch_differences, previous[0], walking) * 1000,
+        timeit(grid_motion, previous[0], walking) * 1000,
+        timeit(grid_motion, previous[0], walking, mask) * 1000,
+        timeit(grid_motion, previous[0], current[0]) * 1000))
+    print("%d cameras          grid tiles %8.2f ms" % (CAMERAS, timeit(tile_changes, previous, current) * 1000))
+
+
+def bench_hash_search(count=1_000_000):
+    hashes = np.random.default_rng(0).integers(0, 2 ** 63, size=count, dtype=np.uint64)
+    value = int(hashes[count // 2])
+
+    def lut_popcount():
+        bitwise_count, frame_hashes.BITWISE_COUNT = frame_hashes.BITWISE_COUNT, None
+        try:
+            hamming(hashes, value)
+        finally:
+            frame_hashes.BITWISE_COUNT = bitwise_count
+
+    def python_loop():
+        for h in hashes[:count // 100].tolist():
+            bin(h ^ value).count("1")
+
+    print("dhash of a thumbnail %6.3f ms" % (timeit(dhash, np.zeros((100, 100), dtype=np.uint8)) * 1000))
+    print("%d hashes       hamming %8.2f ms   byte lookup %8.2f ms   python loop (x100) %8.2f ms" % (
+        count, timeit(hamming, hashes, value) * 1000, timeit(lut_popcount) * 1000, timeit(python_loop) * 100 * 1000))
+
+
+if __name__ == "__main__":
+    bench_motion_check()
+    bench_batch()
+    bench_grid()
+    bench_hash_search()
@@ -0,0 +1,129 @@
+# benchmarks/bench_screenshots.py
+#
+# Micro-benchmarks for the per-frame image operations in app/utils/screenshots.py.
+#
+#   python benchmarks/bench_screenshots.py
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.scheduling import add_motion_and_caption, draw_motion_and_caption
+from app.utils.screenshots import (
+    add_timestamp,
+    apply_dark_mode,
+    finish_frame,
+    find_bounding_box,
+    is_similar_color,
+    remove_background,
+)
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4K": (3840, 2160),
+}
+
+
+def make_capture(size, seed=0):
+    """A dark page border around a noisy content area, similar to a browser capture."""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    pixels = np.full((height, width, 3), 14, dtype=np.uint8)
+    top, left = height // 8, width // 10
+    pixels[top:height - top, left:width - left] = rng.integers(
+        0, 256, size=(height - 2 * top, width - 2 * left, 3), dtype=np.uint8
+    )
+    return Image.fromarray(pixels, "RGB")
+
+
+def scan_bounding_box(image, background_color=(14, 14, 14, 255), threshold=10):
+    """The previous per-pixel implementation of find_bounding_box."""
+    pixels = image.load()
+    width, height = image.size
+    left, top, right, bottom = width, height, 0, 0
+    for x in range(width):
+        for y in range(height):
+            if not is_similar_color(pixels[x, y], background_color, threshold):
+                left, top = min(left, x), min(top, y)
+                right, bottom = max(right, x), max(bottom, y)
+    return (left, top, right, bottom)
+
+
+def loop_dark_mode(img, text_range_value=120):
+    """The previous per-pixel implementation of apply_dark_mode."""
+    pixels = img.load()
+    upper = 255 - text_range_value
+    for y in range(img.size[1]):
+        for x in range(img.size[0]):
+            pixel = pixels[x, y]
+            if all(c <= text_range_value for c in pixel) or all(c >= upper for c in pixel):
+                pixels[x, y] = (255 - pixel[0], 255 - pixel[1], 255 - pixel[2])
+    return img
+
+
+def timeit(func, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_bounding_box(include_scan=False):
+    for label, size in RESOLUTIONS.items():
+        image = make_capture(size)
+        line = "find_bounding_box  %-6s %8.2f ms" % (label, timeit(find_bounding_box, image) * 1000)
+        line += "   remove_background %8.2f ms" % (timeit(remove_background, image) * 1000)
+        if include_scan and label != "4K":
+            line += "   per-pixel scan %8.0f ms" % (timeit(scan_bounding_box, image, repeat=1) * 1000)
+        print(line)
+
+
+def bench_dark_mode(include_scan=False):
+    for label, size in RESOLUTIONS.items():
+        image = make_capture(size)
+        line = "apply_dark_mode    %-6s %8.2f ms" % (label, timeit(apply_dark_mode, image) * 1000)
+        if include_scan and label != "4K":
+            line += "   per-pixel loop %8.0f ms" % (
+                timeit(loop_dark_mode, image.copy(), repeat=1) * 1000
+            )
+        print(line)
+
+
+def encode_per_stage(image, path):
+    """The previous pipeline: save, then reopen and re-encode for each stage."""
+    image.save(path, "PNG")
+    remove_background(Image.open(path).convert("RGB")).save(path, "PNG")
+    add_timestamp(path, "cam")
+    add_motion_and_caption(path, caption="a quiet street", motion=True)
+
+
+def encode_once(image, path):
+    finish_frame(image, path, "cam",
+                 overlay=lambda frame: draw_motion_and_caption(frame, caption="a quiet street", motion=True))
+
+
+def bench_frame_pipeline():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        path = os.path.join(tmpdirname, "cam.png")
+        for label, size in RESOLUTIONS.items():
+            image = make_capture(size)
+            print("frame pipeline     %-6s %8.2f ms   per-stage encodes %8.2f ms" % (
+                label, timeit(encode_once, image, path, repeat=3) * 1000,
+                timeit(encode_per_stage, image, path, repeat=3) * 1000,
+            ))
+
+
+if __name__ == "__main__":
+    bench_bounding_box(include_scan="--scan" in sys.argv)
+    bench_dark_mode(include_scan="--scan" in sys.argv)
+    bench_frame_pipeline()
@@ -0,0 +1,87 @@
+# benchmarks/bench_startup.py
+#
+# Startup cost of the app package, as paid by every process pool worker and test
+# run: the time to "import app", which heavy dependencies that drags in, and the
+# time from a cold interpreter to the first answered request.
+#
+#   python benchmarks/bench_startup.py [repeat]
+#
+# Each measurement runs in a fresh interpreter, in a scratch directory with its
+# own database, so nothing here touches data/.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# loaded when first used (captures, the object filter), never at import
+HEAVY_MODULES = [
+    "torch",
+    "transformers",
+    "selenium",
+    "undetected_chromedriver",
+    "webdriver_manager",
+    "yt_dlp",
+    "pdf2image",
+    "pyvirtualdisplay",
+    "skimage",
+    "cv2",
+]
+
+IMPORT_APP = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"import": elapsed, "heavy": [m for m in %r if m in sys.modules], "modules": len(sys.modules)}))
+""" % (HEAVY_MODULES,)
+
+FIRST_REQUEST = """
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+application = create_app(watchdog=False, schedule=False)
+created = time.perf_counter()
+status = application.test_client().get("/login").status_code
+answered = time.perf_counter()
+print(json.dumps({"import": imported - start, "create_app": created - imported,
+                  "request": answered - created, "total": answered - start, "status": status}))
+"""
+
+
+def run(code, directory):
+    env = dict(os.environ, PYTHONPATH=ROOT, GLIMPSER_DATABASE_PATH=os.path.join(directory, "glimpser.db"))
+    output = subprocess.run([sys.executable, "-c", code], cwd=directory, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def best_of(code, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(os.path.join(directory, "data"))
+        run(code, directory)  # warm the bytecode and file caches
+        results = [run(code, directory) for _ in range(repeat)]
+    return min(results, key=lambda result: result.get("total", result["import"]))
+
+
+def bench_import(repeat=5):
+    result = best_of(IMPORT_APP, repeat)
+    print("import app            %8.1f ms   %d modules" % (result["import"] * 1000, result["modules"]))
+    print("heavy modules loaded  %s" % (", ".join(result["heavy"]) or "none"))
+
+
+def bench_first_request(repeat=5):
+    result = best_of(FIRST_REQUEST, repeat)
+    print("first request         %8.1f ms   (import %.1f, create_app %.1f, GET /login %.1f -> %d)" % (
+        result["total"] * 1000, result["import"] * 1000, result["create_app"] * 1000,
+        result["request"] * 1000, result["status"]))
+
+
+if __name__ == "__main__":
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    bench_import(repeat)
+    bench_first_request(repeat)
@@ -95,7 +95,7 @@ class TestAuthentication(unittest.TestCase):
     def test_login_required_with_api_key(self):
         login_attempts = {} # reset 
         mock_api_key = "mock_api_key_for_testing"
-        with patch("app.routes.API_KEY", mock_api_key):
+        with patch("app.config.API_KEY", mock_api_key):
             response = self.client.get("/protected", headers={"X-API-Key": mock_api_key})
             self.assertEqual(response.status_code, 200)
             self.assertIn(b"Protected Content", response.data)
@@ -128,7 +128,7 @@ class TestAuthentication(unittest.TestCase):
         login_attempts = {} # reset 
         # Test with both session and API key
         mock_api_key = "mock_api_key_for_testing"
-        with patch("app.routes.API_KEY", mock_api_key):
+        with patch("app.config.API_KEY", mock_api_key):
             with patch("app.routes.session", {"logged_in": True}):
                 response = self.client.get("/protected", headers={"X-API-Key": mock_api_key})
                 self.assertEqual(response.status_code, 200)
@@ -147,13 +147,13 @@ class TestAuthentication(unittest.TestCase):
         login_attempts = {} # reset 
         # Test with a replay attack scenario (using a previously valid API key)
         mock_api_key = "mock_api_key_for_testing"
-        with patch("app.routes.API_KEY", mock_api_key):
+        with patch("app.config.API_KEY", mock_api_key):
             response = self.client.get("/protected", headers={"X-API-Key": mock_api_key})
             self.assertEqual(response.status_code, 200)
             self.assertIn(b"Protected Content", response.data)
 
         # Assume API key should now be invalid (e.g., if it was a one-time-use key)
-        with patch("app.routes.API_KEY", "another_mock_api_key"):
+        with patch("app.config.API_KEY", "another_mock_api_key"):
             response = self.client.get("/protected", headers={"X-API-Key": mock_api_key})
             self.assertEqual(response.status_code, 401)
             self.assertIn(b"Invalid API key", response.data)
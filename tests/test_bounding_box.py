@@ -0,0 +1,91 @@
+# tests/test_bounding_box.py
+
+import unittest
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.screenshots import (
+    adjust_bbox_to_aspect_ratio,
+    find_bounding_box,
+    is_similar_color,
+    remove_background,
+)
+
+
+def reference_bounding_box(image, background_color=(14, 14, 14, 255), threshold=10):
+    """The original per-pixel scan, kept here to check the vectorized version against."""
+    pixels = image.load()
+    width, height = image.size
+    left, top, right, bottom = width, height, 0, 0
+    for x in range(width):
+        for y in range(height):
+            if not is_similar_color(pixels[x, y], background_color, threshold):
+                left, top = min(left, x), min(top, y)
+                right, bottom = max(right, x), max(bottom, y)
+    return (left, top, right, bottom)
+
+
+class TestBoundingBox(unittest.TestCase):
+
+    def test_parity_with_reference_scan(self):
+        rng = np.random.default_rng(1234)
+        for _ in range(25):
+            width, height = rng.integers(8, 64, size=2)
+            pixels = np.full((height, width, 3), 14, dtype=np.uint8)
+            # jitter inside the tolerance should still count as background
+            pixels += rng.integers(0, 11, size=pixels.shape, dtype=np.uint8)
+            for _ in range(rng.integers(0, 4)):
+                x, y = rng.integers(0, width), rng.integers(0, height)
+                pixels[y, x] = rng.integers(0, 256, size=3)
+            image = Image.fromarray(pixels, "RGB")
+
+            self.assertEqual(find_bounding_box(image), reference_bounding_box(image))
+
+    def test_parity_rgba(self):
+        image = Image.new("RGBA", (40, 30), color=(14, 14, 14, 255))
+        image.putpixel((5, 7), (14, 14, 14, 0))  # only the alpha channel differs
+        image.putpixel((30, 20), (200, 14, 14, 255))
+        self.assertEqual(find_bounding_box(image), reference_bounding_box(image))
+        self.assertEqual(find_bounding_box(image), (5, 7, 30, 20))
+
+    def test_parity_clipped_tolerance(self):
+        # background channels near 0 and 255 clip the tolerance window
+        background = (250, 3, 128, 255)
+        rng = np.random.default_rng(99)
+        pixels = rng.integers(0, 256, size=(24, 36, 3), dtype=np.uint8)
+        pixels[:, :10] = background[:3]
+        pixels[:4] = (255, 0, 120)
+        image = Image.fromarray(pixels, "RGB")
+        self.assertEqual(
+            find_bounding_box(image, background, 10),
+            reference_bounding_box(image, background, 10),
+        )
+
+    def test_blank_image(self):
+        image = Image.new("RGB", (32, 18), color=(14, 14, 14))
+        self.assertEqual(find_bounding_box(image), (32, 18, 0, 0))
+        self.assertEqual(find_bounding_box(image), reference_bounding_box(image))
+
+    def test_threshold_edges(self):
+        image = Image.new("RGB", (20, 20), color=(14, 14, 14))
+        image.putpixel((3, 4), (24, 4, 14))  # exactly at the tolerance
+        image.putpixel((10, 12), (25, 14, 14))  # just outside it
+        self.assertEqual(find_bounding_box(image), (10, 12, 10, 12))
+        self.assertEqual(find_bounding_box(image), reference_bounding_box(image))
+
+    def test_remove_background_crop(self):
+        image = Image.new("RGB", (320, 240), color=(14, 14, 14))
+        image.paste((255, 255, 255), (40, 60, 200, 150))
+        bbox = adjust_bbox_to_aspect_ratio(
+            reference_bounding_box(image), image.size, aspect_ratio=(16, 9)
+        )
+        self.assertEqual(remove_background(image).size, image.crop(bbox).size)
+
+
+if __name__ == '__main__':
+    unittest.main()
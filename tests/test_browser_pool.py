@@ -0,0 +1,175 @@
+# tests/test_browser_pool.py
+
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.browser_pool import BrowserPool, BrowserSession
+from app.utils.screenshots import browser_kind
+
+
+class FakeFactory:
+    def __init__(self):
+        self.sessions = []
+
+    def __call__(self, kind):
+        driver = MagicMock()
+        driver.window_handles = ["main"]
+        session = BrowserSession(kind, driver)
+        self.sessions.append(session)
+        return session
+
+
+class TestBrowserPool(unittest.TestCase):
+    def setUp(self):
+        self.factory = FakeFactory()
+        self.closed = []
+        self.pool = BrowserPool(self.factory, max_size=2, max_pages=3, max_age=600,
+                                idle_timeout=0, on_close=self.closed.append)
+
+    def test_session_is_reused(self):
+        first = self.pool.acquire("vanilla")
+        self.pool.release(first)
+        second = self.pool.acquire("vanilla")
+        self.assertIs(first, second)
+        self.assertEqual(len(self.factory.sessions), 1)
+
+    def test_release_resets_browser_state(self):
+        session = self.pool.acquire("vanilla")
+        session.driver.window_handles = ["main", "popup"]
+        self.pool.release(session)
+        driver = session.driver
+        driver.close.assert_called_once()
+        driver.delete_all_cookies.assert_called_once()
+        driver.switch_to.default_content.assert_called_once()
+        driver.execute_cdp_cmd.assert_called_with("Emulation.setAutoDarkModeOverride", {})
+        driver.get.assert_called_with("about:blank")
+        driver.get_log.assert_called_with("performance")
+
+    def test_recycled_after_max_pages(self):
+        first = self.pool.acquire("vanilla")
+        for _ in range(3):
+            self.pool.release(first)
+            session = self.pool.acquire("vanilla")
+        self.assertIsNot(first, session)
+        first.driver.quit.assert_called_once()
+        self.assertEqual(self.closed, [first])
+
+    def test_recycled_after_max_age(self):
+        first = self.pool.acquire("vanilla")
+        self.pool.release(first)
+        first.created -= 601
+        second = self.pool.acquire("vanilla")
+        self.assertIsNot(first, second)
+        first.driver.quit.assert_called_once()
+
+    def test_crashed_session_is_replaced(self):
+        first = self.pool.acquire("vanilla")
+        self.pool.release(first)
+        first.driver.execute_script.side_effect = Exception("chrome not reachable")
+        second = self.pool.acquire("vanilla")
+        self.assertIsNot(first, second)
+        self.assertEqual(self.pool.stats()["size"], 1)
+
+    def test_crash_during_lease_is_not_returned(self):
+        with self.assertRaises(RuntimeError):
+            with self.pool.lease("vanilla") as session:
+                session.driver.execute_script.side_effect = Exception("tab crashed")
+                raise RuntimeError("capture failed")
+        self.assertEqual(self.pool.stats(), {"size": 0, "max_size": 2, "idle": {}, "leased": 0})
+        self.assertEqual(self.closed, [session])
+
+    def test_kinds_are_kept_apart(self):
+        vanilla = self.pool.acquire("vanilla")
+        self.pool.release(vanilla)
+        stealth = self.pool.acquire("undetected")
+        self.assertIsNot(vanilla, stealth)
+        self.assertEqual(stealth.kind, "undetected")
+
+    def test_full_pool_evicts_idle_session_of_other_kind(self):
+        a = self.pool.acquire("vanilla")
+        b = self.pool.acquire("vanilla")
+        self.pool.release(a)
+        c = self.pool.acquire("undetected")
+        self.assertEqual(self.closed, [a])
+        self.assertEqual(self.pool.stats()["size"], 2)
+        self.pool.release(b)
+        self.pool.release(c)
+
+    def test_full_pool_waits_for_release(self):
+        a = self.pool.acquire("vanilla")
+        self.pool.acquire("vanilla")
+        with self.assertRaises(TimeoutError):
+            self.pool.acquire("vanilla", timeout=0.05)
+
+        threading.Timer(0.05, self.pool.release, args=(a,)).start()
+        start = time.time()
+        self.assertIs(self.pool.acquire("vanilla", timeout=5), a)
+        self.assertLess(time.time() - start, 5)
+
+    def test_factory_failure_frees_slot(self):
+        pool = BrowserPool(MagicMock(side_effect=Exception("no chrome")), max_size=1, idle_timeout=0)
+        for _ in range(3):
+            with self.assertRaises(Exception):
+                pool.acquire("vanilla", timeout=0.05)
+        self.assertEqual(pool.stats()["size"], 0)
+
+    def test_pool_disabled(self):
+        pool = BrowserPool(self.factory, max_size=0, idle_timeout=0)
+        first = pool.acquire("vanilla")
+        pool.release(first)
+        first.driver.quit.assert_called_once()
+        self.assertIsNot(pool.acquire("vanilla"), first)
+
+    def test_reap_and_shutdown(self):
+        pool = BrowserPool(self.factory, max_size=2, idle_timeout=60)
+        a = pool.acquire("vanilla")
+        b = pool.acquire("undetected")
+        pool.release(a)
+        pool.release(b)
+        a.last_used -= 120
+        self.assertEqual(pool.reap(), 1)
+        a.driver.quit.assert_called_once()
+        pool.shutdown()
+        b.driver.quit.assert_called_once()
+        self.assertEqual(pool.stats()["size"], 0)
+
+    def test_one_reaper_for_concurrent_acquires(self):
+        pool = BrowserPool(self.factory, max_size=8, idle_timeout=60)
+        started = []
+        real_thread = threading.Thread
+
+        def thread(*args, **kwargs):
+            started.append(1)
+            time.sleep(0.01)  # widen the window between the check and the start
+            return real_thread(*args, **kwargs)
+
+        barrier = threading.Barrier(8)
+
+        def acquire():
+            barrier.wait()
+            pool.release(pool.acquire("vanilla"))
+
+        with patch("app.utils.browser_pool.threading.Thread", side_effect=thread):
+            workers = [real_thread(target=acquire) for _ in range(8)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        self.assertEqual(len(started), 1)
+        pool.shutdown()
+
+    def test_browser_kind(self):
+        self.assertEqual(browser_kind(), "vanilla")
+        self.assertEqual(browser_kind(stealth=True), "undetected")
+        self.assertEqual(browser_kind(headless=False), "vanilla_windowed")
+        self.assertEqual(browser_kind(stealth=True, headless=False), "undetected_windowed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+# tests/test_capture_plan.py
+
+import unittest
+from unittest.mock import patch, MagicMock
+import datetime
+import io
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.capture_plan import equivalent_output, replan_template
+from app.utils.screenshots import capture_or_download, choose_capture_method
+from app.utils.template_manager import TemplateManager, Template
+
+
+def fake_capture(colors):
+    """capture_with_method stand-in that writes a solid frame per method, or fails if the method has none."""
+    def capture(method, name, template, output_path, conditional=True):
+        if method not in colors:
+            return False
+        Image.new("RGB", (64, 36), colors[method]).save(output_path)
+        return True
+    return capture
+
+
+class TestChooseCaptureMethod(unittest.TestCase):
+    def test_methods(self):
+        cases = [
+            ({"url": "http://cam.local/snap.jpg"}, "", "image"),
+            ({"url": "http://cam.local/cgi"}, "image/jpeg", "image"),
+            ({"url": "http://example.com/report.pdf"}, "", "pdf"),
+            ({"url": "rtsp://cam.local/stream"}, "", "stream"),
+            ({"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ"}, "text/html", "ytdlp"),
+            ({"url": "https://example.com/", "headless": True}, "text/html", "light"),
+            ({"url": "https://example.com/", "headless": True, "stealth": True}, "text/html", "browser"),
+            ({"url": "https://example.com/", "headless": False}, "text/html", "browser"),
+            ({"url": "http://cam.local/snap.jpg", "danger": True}, "", "browser"),
+            ({"url": "ftp://example.com/"}, "", None),
+        ]
+        for template, content_type, method in cases:
+            self.assertEqual(choose_capture_method(template, content_type), method, template)
+
+
+@patch("app.utils.screenshots.save_template")
+@patch("app.utils.screenshots.get_content_type", return_value="text/html")
+@patch("app.utils.screenshots.is_address_reachable", return_value=True)
+class TestCaptureOrDownloadPlan(unittest.TestCase):
+    def test_plan_is_stored_and_reused(self, mock_reachable, mock_content_type, mock_save):
+        template = {"url": "https://example.com/", "headless": True}
+        with patch("app.utils.screenshots.capture_with_method", return_value=True) as mock_capture:
+            self.assertTrue(capture_or_download("cam", template))
+            self.assertTrue(capture_or_download("cam", template))
+
+        self.assertEqual(mock_reachable.call_count, 1)
+        self.assertEqual(mock_content_type.call_count, 1)
+        self.assertEqual([c[0][0] for c in mock_capture.call_args_list], ["light", "light"])
+        self.assertEqual(template["capture_method"], "light")
+        self.assertEqual(template["capture_content_type"], "text/html")
+        mock_save.assert_called_once()
+
+    def test_failure_clears_plan(self, mock_reachable, mock_content_type, mock_save):
+        template = {"url": "https://example.com/", "headless": True, "capture_method": "light",
+                    "capture_plan_time": "2024-01-01 00:00:00"}
+        with patch("app.utils.screenshots.capture_with_method", return_value=False):
+            self.assertFalse(capture_or_download("cam", template))
+        mock_reachable.assert_not_called()
+        self.assertEqual(template["capture_method"], "")
+        mock_save.assert_called_once_with("cam", {"capture_method": "", "capture_content_type": "",
+                                                  "capture_plan_time": ""})
+
+
+@patch("app.utils.screenshots.save_template")
+class TestReplanTemplate(unittest.TestCase):
+    def template(self, **kwargs):
+        template = {"url": "https://example.com/", "headless": False, "capture_method": "browser",
+                    "capture_content_type": "text/html", "capture_plan_time": "2024-01-01 00:00:00"}
+        template.update(kwargs)
+        return template
+
+    def test_downgrades_to_equivalent_method(self, mock_save):
+        template = self.template()
+        with patch("app.utils.capture_plan.capture_with_method",
+                   side_effect=fake_capture({"browser": "navy", "light": "navy"})):
+            self.assertEqual(replan_template("cam", template), "light")
+        self.assertEqual(template["capture_method"], "light")
+
+    def test_keeps_method_when_output_differs(self, mock_save):
+        template = self.template()
+        with patch("app.utils.capture_plan.capture_with_method",
+                   side_effect=fake_capture({"browser": "navy", "image": "white", "light": "white"})):
+            self.assertEqual(replan_template("cam", template), "browser")
+        mock_save.assert_not_called()
+
+    def test_browser_only_templates_are_left_alone(self, mock_save):
+        template = self.template(popup_xpath="//div[@id='cookies']")
+        with patch("app.utils.capture_plan.capture_with_method") as mock_capture:
+            self.assertEqual(replan_template("cam", template), "browser")
+        mock_capture.assert_not_called()
+
+    def test_stale_downgrade_is_reverted(self, mock_save):
+        template = self.template(capture_method="light")
+        with patch("app.utils.capture_plan.capture_with_method",
+                   side_effect=fake_capture({"browser": "navy", "light": "white"})):
+            self.assertEqual(replan_template("cam", template), "browser")
+        self.assertEqual(template["capture_method"], "browser")
+
+    def test_recent_downgrade_is_trusted(self, mock_save):
+        now = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        template = self.template(capture_method="light", capture_plan_time=now)
+        with patch("app.utils.capture_plan.capture_with_method") as mock_capture:
+            self.assertEqual(replan_template("cam", template), "light")
+        mock_capture.assert_not_called()
+
+
+class TestPlanProbes(unittest.TestCase):
+    @patch("app.utils.screenshots.finish_frame")
+    @patch("app.utils.screenshots.http_client")
+    def test_probes_skip_validators(self, mock_http, mock_finish):
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8), "red").save(buffer, format="PNG")
+        mock_http.conditional_get.return_value = MagicMock(status_code=200, content=buffer.getvalue(),
+                                                           headers={"ETag": '"probe"'})
+        mock_finish.side_effect = lambda image, path, *args, **kwargs: image.save(path)
+        template = {"url": "https://example.com/cam.png"}
+        self.assertTrue(equivalent_output("cam", template, "image", "image"))
+        for call in mock_http.conditional_get.call_args_list:
+            self.assertIsNone(call.kwargs["frame_path"])
+        mock_http.remember_validators.assert_not_called()
+        mock_http.forget_validators.assert_not_called()
+
+
+class TestPlanInvalidation(unittest.TestCase):
+    @patch("app.utils.template_manager.SessionLocal")
+    def test_url_change_clears_plan(self, mock_session):
+        template = Template(name="cam", url="https://old.example.com/", capture_method="browser",
+                            capture_plan_time="2024-01-01 00:00:00")
+        mock_session.return_value.query.return_value.filter_by.return_value.first.return_value = template
+        TemplateManager().save_template("cam", {"url": "https://new.example.com/"})
+        self.assertEqual(template.capture_method, "")
+        self.assertEqual(template.capture_plan_time, "")
+
+    @patch("app.utils.template_manager.SessionLocal")
+    def test_unrelated_change_keeps_plan(self, mock_session):
+        template = Template(name="cam", url="https://example.com/", capture_method="light", notes="")
+        mock_session.return_value.query.return_value.filter_by.return_value.first.return_value = template
+        TemplateManager().save_template("cam", {"notes": "front door"})
+        self.assertEqual(template.capture_method, "light")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+# tests/test_capture_scheduler.py
+
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.capture_scheduler import CaptureScheduler, adaptive_interval, capture_pool, frequency_bounds
+
+SLOW = {"url": "https://example.com/", "headless": False}
+SNAPSHOT = {"url": "http://cam.local/snap.jpg"}
+
+
+class Recorder:
+    """update_camera stand-in that records start times and holds slow captures open."""
+
+    def __init__(self, hold=0.3):
+        self.hold = hold
+        self.lock = threading.Lock()
+        self.started = []
+        self.active = 0
+        self.peak = {}
+
+    def __call__(self, name, template):
+        pool = capture_pool(template)
+        with self.lock:
+            self.started.append((name, time.time()))
+            self.active += 1
+            self.peak[pool] = max(self.peak.get(pool, 0), sum(1 for n, _ in self.started if n == name))
+        time.sleep(self.hold if pool == "browser" else 0.01)
+        with self.lock:
+            self.active -= 1
+
+
+def crash_once(name, template):
+    """Process pool capture that kills its worker the first time, like an OOM kill."""
+    marker = os.path.join(template["directory"], "crashed")
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    open(os.path.join(template["directory"], "captured"), "w").close()
+
+
+class TestCapturePool(unittest.TestCase):
+    def test_pools(self):
+        self.assertEqual(capture_pool(SNAPSHOT), "image")
+        self.assertEqual(capture_pool(SLOW), "browser")
+        self.assertEqual(capture_pool({"url": "rtsp://cam.local/live"}), "stream")
+        self.assertEqual(capture_pool({"url": "http://cam.local/cgi", "capture_method": "image"}), "image")
+        self.assertEqual(capture_pool({"url": "ftp://cam.local/"}), "browser")
+
+
+class TestAdaptiveInterval(unittest.TestCase):
+    def test_fixed_templates_use_their_frequency(self):
+        template = {"frequency": 5}
+        self.assertEqual(adaptive_interval(template, 60, True), 300)
+        self.assertEqual(adaptive_interval(template, 60, False), 300)
+
+    def test_bounds(self):
+        self.assertEqual(frequency_bounds({"frequency": 10}), (60, 4800))
+        self.assertEqual(frequency_bounds({"frequency": 10, "min_frequency": 2, "max_frequency": 30}), (120, 1800))
+        # the configured frequency is always reachable
+        self.assertEqual(frequency_bounds({"frequency": 1, "min_frequency": 5, "max_frequency": 0}), (60, 480))
+
+    def test_stretch_and_burst(self):
+        template = {"frequency": 10, "adaptive": True, "min_frequency": 1, "max_frequency": 30}
+        interval = 600
+        for _ in range(10):
+            interval = adaptive_interval(template, interval, False)
+        self.assertEqual(interval, 1800)
+        self.assertEqual(adaptive_interval(template, interval, True), 60)
+        self.assertEqual(adaptive_interval(template, 90, None), 90)
+
+    def test_quiet_capture_stretches_the_live_schedule(self):
+        template = {"url": "http://cam.local/snap.jpg", "frequency": 2, "adaptive": True, "max_frequency": 4}
+        scheduler = CaptureScheduler(lambda name, template: False, {"image": 1},
+                                     use_processes=False, refresh=lambda name: template)
+        self.addCleanup(scheduler.shutdown, True)
+        scheduler.schedule("snapshot", template, interval=120)
+        started = time.time()
+        scheduler.start()
+        time.sleep(0.2)
+        with scheduler._condition:
+            job = scheduler._jobs["snapshot"]
+            self.assertEqual(job["interval"], 180)
+            self.assertAlmostEqual(job["due"], started + 180, delta=1)
+
+
+class TestCaptureScheduler(unittest.TestCase):
+    def make(self, run, **kwargs):
+        slots = {"browser": 1, "stream": 2, "image": 2, "pdf": 1}
+        scheduler = CaptureScheduler(run, slots, use_processes=False, **kwargs)
+        self.addCleanup(scheduler.shutdown, True)
+        return scheduler
+
+    def test_browser_captures_do_not_starve_snapshots(self):
+        recorder = Recorder(hold=0.5)
+        scheduler = self.make(recorder, max_workers=4)
+        for i in range(3):
+            scheduler.schedule(f"browser{i}", SLOW, interval=60)
+        scheduler.schedule("snapshot", SNAPSHOT, interval=60, delay=0.05)
+        scheduler.start()
+        time.sleep(0.3)
+
+        names = [name for name, _ in recorder.started]
+        # one browser slot: the other browser cameras wait, the snapshot does not
+        self.assertIn("snapshot", names)
+        self.assertEqual(len([n for n in names if n.startswith("browser")]), 1)
+        stats = scheduler.stats()
+        self.assertEqual(stats["pools"]["browser"]["running"], 1)
+        self.assertEqual(stats["pools"]["browser"]["utilization"], 1.0)
+        self.assertEqual(stats["pools"]["browser"]["queued"], 2)
+
+    def test_overdue_runs_are_coalesced(self):
+        recorder = Recorder(hold=0.45)
+        scheduler = self.make(recorder, max_workers=4)
+        scheduler.schedule("browser0", SLOW, interval=0.1)
+        scheduler.start()
+        time.sleep(1.2)
+
+        starts = [t for name, t in recorder.started if name == "browser0"]
+        # never more than one run at a time, and no backlog of missed runs afterwards
+        self.assertLessEqual(len(starts), 3)
+        self.assertTrue(all(b - a >= 0.4 for a, b in zip(starts, starts[1:])))
+        self.assertGreater(scheduler.stats()["coalesced"], 0)
+        self.assertEqual(recorder.peak["browser"], len(starts))
+
+    def test_deleted_template_is_dropped(self):
+        # get_template returns {} for a camera that is gone
+        for missing in (None, {}):
+            with self.subTest(missing=missing):
+                recorder = Recorder()
+                scheduler = self.make(recorder, refresh=lambda name: missing)
+                scheduler.schedule("snapshot", SNAPSHOT, interval=0.05)
+                scheduler.start()
+                time.sleep(0.3)
+                self.assertEqual(len(recorder.started), 1)
+                self.assertEqual(scheduler.stats()["cameras"], 0)
+
+    def test_rescheduling_replaces_the_pending_run(self):
+        recorder = Recorder()
+        scheduler = self.make(recorder)
+        scheduler.schedule("snapshot", SNAPSHOT, interval=60, delay=30)
+        scheduler.schedule("snapshot", SNAPSHOT, interval=60, delay=0)
+        scheduler.start()
+        time.sleep(0.2)
+        self.assertEqual([name for name, _ in recorder.started], ["snapshot"])
+        self.assertEqual(scheduler.stats()["pools"]["image"]["queued"], 1)
+
+    def test_broken_process_pool_is_replaced(self):
+        directory = tempfile.mkdtemp()
+        template = dict(SNAPSHOT, directory=directory)
+        scheduler = CaptureScheduler(crash_once, {"image": 1}, max_workers=1)
+        self.addCleanup(scheduler.shutdown, True)
+        scheduler.schedule("snapshot", template, interval=60)
+        scheduler.start()
+        deadline = time.time() + 20
+        while not os.path.exists(os.path.join(directory, "captured")) and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(os.path.exists(os.path.join(directory, "captured")))
+        stats = scheduler.stats()
+        self.assertEqual(stats["pool_restarts"], 1)
+        self.assertEqual(stats["failed"], 0)
+
+        # later captures run on the new pool
+        scheduler.run_now("snapshot")
+        time.sleep(0.5)
+        self.assertEqual(scheduler.stats()["pool_restarts"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
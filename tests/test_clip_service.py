@@ -0,0 +1,212 @@
+# tests/test_clip_service.py
+
+import unittest
+from unittest.mock import patch
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.utils.clip_service as clip_service_module
+from app.utils.clip_service import ClipModel, ClipService, SERVICE_ENV, clip_scores
+
+
+class FakeClipModel:
+    """Embeds a frame as its mean colour and a prompt as the colour it names."""
+
+    COLORS = {"red": [1, 0, 0], "green": [0, 1, 0], "blue": [0, 0, 1]}
+
+    def __init__(self):
+        self.logit_scale = 10.0
+        self.image_batches = []
+        self.text_calls = []
+
+    def image_embeddings(self, images):
+        self.image_batches.append(len(images))
+        means = np.array([np.asarray(image, dtype=np.float32).mean(axis=(0, 1)) for image in images])
+        return means / np.linalg.norm(means, axis=1, keepdims=True)
+
+    def text_embeddings(self, texts):
+        self.text_calls.append(list(texts))
+        return np.array([self.COLORS[text] for text in texts], dtype=np.float32)
+
+
+class TestClipService(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.paths = {}
+        for color in ["red", "green", "blue"]:
+            self.paths[color] = os.path.join(self.tmpdir.name, f"{color}.png")
+            Image.new("RGB", (32, 32), color).save(self.paths[color])
+        self.model = FakeClipModel()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_scores_and_text_cache(self):
+        service = ClipService(model=self.model, batch_wait=0)
+        service.start()
+        try:
+            probs = service.score(self.paths["green"], ["red", "green", "blue"])
+            self.assertEqual(int(np.argmax(probs)), 1)
+            self.assertAlmostEqual(sum(probs), 1.0, places=5)
+            service.score(self.paths["red"], ["red", "green"])
+        finally:
+            service.stop()
+        # each prompt is embedded once
+        self.assertEqual(self.model.text_calls, [["red", "green", "blue"]])
+        self.assertEqual(service.metrics["text_hits"], 2)
+
+    def test_requests_are_batched(self):
+        service = ClipService(model=self.model, batch_size=8)
+        requests = [service.submit(self.paths[color], ["red", "blue"]) for color in ["red", "green", "blue"]]
+        service.run_batch(service.next_batch())
+        self.assertEqual(self.model.image_batches, [3])
+        self.assertTrue(all(request["done"].is_set() for request in requests))
+        self.assertGreater(requests[0]["result"][0], 0.5)
+        self.assertGreater(requests[2]["result"][1], 0.5)
+
+    def test_stale_and_unreadable_requests_get_no_score(self):
+        service = ClipService(model=self.model, timeout=5)
+        stale = service.submit(self.paths["red"], ["red"])
+        stale["queued"] -= 60
+        missing = service.submit(os.path.join(self.tmpdir.name, "missing.png"), ["red"])
+        service.run_batch(service.next_batch())
+        self.assertIsNone(stale["result"])
+        self.assertIsNone(missing["result"])
+        self.assertEqual(self.model.image_batches, [])
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_worker_processes_use_the_socket(self):
+        # hosted here, as schedule_crawlers does before the capture workers are forked
+        service = ClipService(model=self.model, batch_wait=0)
+        host, port = service.start()
+        try:
+            with patch.dict(os.environ, {SERVICE_ENV: f"{host}:{port}"}), \
+                    patch.object(clip_service_module, "clip_service", service), \
+                    patch.object(clip_service_module.config, "CLIP_TIMEOUT", 5):
+                with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork")) as executor:
+                    started = time.time()
+                    futures = {c: executor.submit(clip_scores, self.paths[c], ["red", "green", "blue"])
+                               for c in self.paths}
+                    results = {c: future.result(timeout=30) for c, future in futures.items()}
+                    elapsed = time.time() - started
+        finally:
+            service.stop()
+        for color, probs in results.items():
+            self.assertIsNotNone(probs)
+            self.assertEqual(["red", "green", "blue"][int(np.argmax(probs))], color)
+        self.assertLess(elapsed, 5)  # answered, not timed out on the parent's dead queue
+        self.assertEqual(sum(self.model.image_batches), 3)  # scored by the parent's service
+
+    def test_threads_share_the_socket(self):
+        service = ClipService(model=self.model, batch_wait=0)
+        host, port = service.start()
+        results = []
+        try:
+            with patch.dict(os.environ, {SERVICE_ENV: f"{host}:{port}"}), \
+                    patch.object(clip_service_module, "clip_service", None):
+                threads = [threading.Thread(target=lambda c=c: results.append(
+                    (c, clip_scores(self.paths[c], ["red", "green", "blue"])))) for c in self.paths]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            service.stop()
+        for color, probs in results:
+            self.assertEqual(["red", "green", "blue"][int(np.argmax(probs))], color)
+        self.assertEqual(len(results), 3)
+
+    def test_no_service_skips_the_filter(self):
+        with patch.dict(os.environ, {SERVICE_ENV: ""}), \
+                patch.object(clip_service_module, "clip_service", None):
+            self.assertIsNone(clip_scores(self.paths["red"], ["red"]))
+
+
+def tiny_clip():
+    """A small randomly initialised CLIP; enough to exercise the real model code offline."""
+    import torch
+    from transformers import CLIPConfig, CLIPImageProcessor, CLIPModel
+
+    torch.manual_seed(0)
+    config = CLIPConfig(
+        text_config=dict(hidden_size=64, intermediate_size=128, num_hidden_layers=2, num_attention_heads=2,
+                         vocab_size=100, max_position_embeddings=16, bos_token_id=0, eos_token_id=1),
+        vision_config=dict(hidden_size=64, intermediate_size=128, num_hidden_layers=2, num_attention_heads=2,
+                           image_size=224, patch_size=32),
+        projection_dim=32,
+    )
+    return CLIPModel(config), CLIPImageProcessor()
+
+
+class FakeTokenizer:
+    def __call__(self, texts, return_tensors="pt", padding=True):
+        import torch
+
+        return {"input_ids": torch.tensor([[2 + ord(c) % 90 for c in text[:8].ljust(8)] for text in texts])}
+
+
+class TestClipModelModes(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.images = [Image.fromarray(rng.integers(0, 256, size=(90, 160, 3), dtype=np.uint8))
+                       for _ in range(6)]
+        self.prompts = ["a person", "a car", "a dog"]
+
+    def embeddings(self, quantize=False, image_size=0):
+        model, image_processor = tiny_clip()
+        clip = ClipModel(quantize=quantize, image_size=image_size)
+        clip.prepare(model, image_processor, FakeTokenizer())
+        return clip, clip.image_embeddings(self.images)
+
+    def test_int8_matches_fp32(self):
+        fp32, reference = self.embeddings()
+        int8, embeddings = self.embeddings(quantize=True)
+        self.assertGreater(np.sum(embeddings * reference, axis=1).min(), 0.99)
+        # the object filter keeps picking the same prompt
+        texts = fp32.text_embeddings(self.prompts)
+        self.assertEqual((reference @ texts.T).argmax(axis=1).tolist(),
+                         (embeddings @ int8.text_embeddings(self.prompts).T).argmax(axis=1).tolist())
+
+    def test_reduced_resolution(self):
+        _, reference = self.embeddings()
+        clip, embeddings = self.embeddings(image_size=160)
+        self.assertEqual(clip.image_options["crop_size"], {"height": 160, "width": 160})
+        self.assertEqual(embeddings.shape, reference.shape)
+        np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-5)
+        self.assertGreater(np.sum(embeddings * reference, axis=1).mean(), 0.9)
+
+    def test_older_transformers(self):
+        # before 4.45 get_image_features took no interpolate_pos_encoding
+        model, image_processor = tiny_clip()
+        features = model.get_image_features
+
+        def get_image_features(pixel_values=None, output_attentions=None, output_hidden_states=None,
+                               return_dict=None):
+            return features(pixel_values=pixel_values)
+
+        model.get_image_features = get_image_features
+        for image_size in [0, 160]:
+            clip = ClipModel(image_size=image_size)
+            with self.assertLogs(level="WARNING") if image_size else contextlib.nullcontext():
+                clip.prepare(model, image_processor, FakeTokenizer())
+            self.assertEqual(clip.image_options, {})  # CLIP_IMAGE_SIZE is refused, not passed on
+            self.assertEqual(clip.image_embeddings(self.images).shape, (6, 32))
+
+    def test_native_size_is_left_alone(self):
+        clip, _ = self.embeddings(image_size=224)
+        self.assertEqual(clip.image_options, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+# tests/test_dark_mode.py
+
+import unittest
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.screenshots import apply_dark_mode
+
+
+def reference_dark_mode(img, text_range_value=120):
+    """The original per-pixel implementation, kept here as the parity reference."""
+    img = img.copy()
+    pixels = img.load()
+    upper = 255 - text_range_value
+    for y in range(img.size[1]):
+        for x in range(img.size[0]):
+            pixel = pixels[x, y]
+            if all(0 <= c <= text_range_value for c in pixel[:3]) or all(
+                upper <= c <= 255 for c in pixel[:3]
+            ):
+                pixels[x, y] = (255 - pixel[0], 255 - pixel[1], 255 - pixel[2])
+    return img
+
+
+class TestDarkMode(unittest.TestCase):
+
+    def random_image(self, mode, size=(48, 27), seed=7):
+        rng = np.random.default_rng(seed)
+        bands = len(mode)
+        pixels = rng.integers(0, 256, size=(size[1], size[0], bands), dtype=np.uint8)
+        # make sure plenty of pixels land in the dark and light ranges
+        pixels[: size[1] // 3, :, :3] //= 3
+        pixels[-size[1] // 3 :, :, :3] = 255 - pixels[-size[1] // 3 :, :, :3] // 3
+        return Image.fromarray(pixels, mode)
+
+    def test_parity_rgb(self):
+        image = self.random_image("RGB")
+        expected = np.asarray(reference_dark_mode(image))
+        np.testing.assert_array_equal(np.asarray(apply_dark_mode(image)), expected)
+
+    def test_parity_rgba(self):
+        image = self.random_image("RGBA", seed=11)
+        result = apply_dark_mode(image)
+        self.assertEqual(result.mode, "RGBA")
+        np.testing.assert_array_equal(
+            np.asarray(result), np.asarray(reference_dark_mode(image))
+        )
+
+    def test_parity_other_ranges(self):
+        image = self.random_image("RGB", seed=3)
+        for text_range_value in (0, 30, 127, 200):
+            np.testing.assert_array_equal(
+                np.asarray(apply_dark_mode(image, text_range_value=text_range_value)),
+                np.asarray(reference_dark_mode(image, text_range_value)),
+            )
+
+    def test_returns_new_image(self):
+        image = Image.new("RGB", (4, 4), color=(0, 0, 0))
+        result = apply_dark_mode(image)
+        self.assertEqual(image.getpixel((0, 0)), (0, 0, 0))
+        self.assertEqual(result.getpixel((0, 0)), (255, 255, 255))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# tests/test_db.py
+
+import unittest
+from unittest.mock import patch
+import multiprocessing
+import os
+import sys
+import tempfile
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.config as config
+import app.utils.db as db
+import app.utils.template_manager as template_manager
+from app.utils.db import Base, make_engine
+from app.utils.template_manager import StatusWriter, TemplateCache, TemplateManager, update_template_fields
+
+CAMERAS = 4
+WORKERS = 6
+ROUNDS = 40
+
+
+def capture_worker(worker):
+    """What a capture process does to the database per frame: status writes and template reads."""
+    writer = StatusWriter(interval=60)
+    writer.pid = os.getpid()
+    failures = 0
+    with patch.object(template_manager, "status_writer", writer):
+        for i in range(ROUNDS):
+            camera = f"cam{(worker + i) % CAMERAS}"
+            template_manager.queue_template_status(camera, last_caption=f"{worker}:{i}", last_ret="*")
+            if writer.flush() != 1:
+                failures += 1
+            if not update_template_fields(camera, last_motion_time=f"2024-01-01 12:00:{i:02d}"):
+                failures += 1
+            if TemplateManager().get_template(camera) is None:
+                failures += 1
+    os._exit(min(failures, 100))
+
+
+class TestSharedEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = make_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'test.db')}", busy_timeout=30)
+        Base.metadata.create_all(bind=self.engine)
+        self.patches = [
+            patch.object(template_manager, "SessionLocal", sessionmaker(bind=self.engine)),
+            patch.object(template_manager, "init_db"),
+            patch.object(template_manager, "template_cache", TemplateCache(os.path.join(self.tmpdir.name, "test.db.templates"))),
+            patch.object(template_manager, "SCREENSHOT_DIRECTORY", os.path.join(self.tmpdir.name, "screenshots")),
+            patch.object(template_manager, "VIDEO_DIRECTORY", os.path.join(self.tmpdir.name, "videos")),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_settings_and_templates_share_one_engine(self):
+        self.assertIs(config.engine, db.engine)
+        self.assertIs(config.SessionLocal, db.SessionLocal)
+        self.assertEqual(config.DATABASE_PATH, db.DATABASE_PATH)
+
+    def test_pragmas(self):
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+            self.assertEqual(connection.execute(text("PRAGMA synchronous")).scalar(), 1)  # NORMAL
+            self.assertEqual(connection.execute(text("PRAGMA busy_timeout")).scalar(), db.BUSY_TIMEOUT * 1000)
+            self.assertEqual(connection.execute(text("PRAGMA cache_size")).scalar(), -db.CACHE_SIZE)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_parallel_capture_writes(self):
+        for i in range(CAMERAS):
+            TemplateManager().save_template(f"cam{i}", {
+                "name": f"cam{i}", "url": f"http://cam{i}.local/", "frequency": 30, "timeout": 10,
+            })
+        # the parent holds a pooled connection, as the web process would, when the workers fork
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=capture_worker, args=(w,)) for w in range(WORKERS)]
+        for worker in workers:
+            worker.start()
+        # the parent keeps reading throughout, which WAL allows alongside the writers
+        while any(worker.is_alive() for worker in workers):
+            self.assertEqual(len(TemplateManager().get_templates()), CAMERAS)
+        for worker in workers:
+            worker.join()
+        self.assertEqual([worker.exitcode for worker in workers], [0] * WORKERS)
+        for i in range(CAMERAS):
+            template = TemplateManager().get_template(f"cam{i}")
+            self.assertEqual(template["last_ret"], "*")
+            self.assertTrue(template["last_motion_time"].startswith("2024-01-01 12:00:"))
+
+
+if __name__ == "__main__":
+    unittest.main()
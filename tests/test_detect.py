@@ -0,0 +1,197 @@
+# tests/test_detect.py
+
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+from skimage.metrics import structural_similarity
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.utils.detect as detect
+from app.utils.detect import (
+    batch_differences,
+    calculate_difference_fast,
+    frame_difference,
+    grid_motion,
+    load_thumbnail,
+    measure_motion,
+    motion_mask,
+    motion_thumbnail,
+    parse_motion_mask,
+    save_thumbnail,
+    ssim_batch,
+    tile_changes,
+)
+from app.utils.frames import forget_frame, sidecar_path, write_frame
+from app.utils.scheduling import draw_motion_and_caption
+from app.utils.template_manager import Template, TemplateManager
+
+
+def scenes(count, seed=0, size=(100, 100)):
+    """Smooth gradients with noise and a moving block, so SSIM lands well inside (0, 1)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    frames = []
+    for i in range(count):
+        frame = (x + y) * 0.6 + rng.normal(0, 12, size=(size[1], size[0]))
+        frame[10 + i:40 + i, 20:50] += 80
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return np.stack(frames)
+
+
+class TestSsim(unittest.TestCase):
+    def test_matches_skimage(self):
+        a, b = scenes(4, seed=1), scenes(4, seed=2)
+        for i in range(4):
+            expected = structural_similarity(a[i], b[i], full=True)[0]
+            self.assertAlmostEqual(ssim_batch(a[i], b[i])[0], expected, places=6)
+
+    def test_non_square(self):
+        a, b = scenes(1, seed=3, size=(64, 36))[0], scenes(1, seed=4, size=(64, 36))[0]
+        self.assertAlmostEqual(ssim_batch(a, b)[0], structural_similarity(a, b), places=6)
+
+    def test_batch_matches_pairs(self):
+        a, b = scenes(6, seed=5), scenes(6, seed=6)
+        differences = batch_differences(a, b)
+        self.assertEqual(differences.shape, (6,))
+        for i in range(6):
+            self.assertAlmostEqual(differences[i], 1 - ssim_batch(a[i], b[i])[0], places=12)
+
+    def test_identical_frames(self):
+        a = scenes(1)[0]
+        self.assertAlmostEqual(batch_differences(a, a)[0], 0.0, places=9)
+
+    def test_calculate_difference_fast_accepts_images(self):
+        a, b = Image.fromarray(scenes(1, seed=7)[0]), Image.fromarray(scenes(1, seed=8)[0])
+        expected = 1 - structural_similarity(np.array(a), np.array(b))
+        self.assertAlmostEqual(calculate_difference_fast(a, b), expected, places=6)
+
+
+class TestThumbnails(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.frame_path = os.path.join(self.tmpdir.name, "cam_20240101120000.png")
+        self.image = Image.fromarray(scenes(1)[0]).resize((320, 180)).convert("RGB")
+        write_frame(self.image, self.frame_path)
+        detect.last_thumbnails.clear()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        detect.last_thumbnails.clear()
+
+    def test_sidecar_is_used_instead_of_the_frame(self):
+        thumbnail = motion_thumbnail(self.image)
+        save_thumbnail(self.frame_path, thumbnail)
+        self.assertTrue(os.path.exists(sidecar_path(self.frame_path, "npy")))
+        detect.last_thumbnails.clear()
+        with patch("app.utils.detect.Image.open") as mock_open:
+            np.testing.assert_array_equal(load_thumbnail(self.frame_path), thumbnail)
+            self.assertEqual(frame_difference(self.frame_path, thumbnail), 0.0)
+        mock_open.assert_not_called()
+
+    def test_last_thumbnail_stays_in_memory(self):
+        thumbnail = motion_thumbnail(self.image)
+        save_thumbnail(self.frame_path, thumbnail)
+        with patch("app.utils.detect.np.load") as mock_load:
+            self.assertIs(load_thumbnail(self.frame_path), thumbnail)
+        mock_load.assert_not_called()
+
+    def test_old_frames_get_a_sidecar(self):
+        thumbnail = load_thumbnail(self.frame_path)
+        np.testing.assert_array_equal(thumbnail, motion_thumbnail(self.frame_path))
+        self.assertTrue(os.path.exists(sidecar_path(self.frame_path, "npy")))
+
+    def test_sidecar_is_deleted_with_the_frame(self):
+        load_thumbnail(self.frame_path)
+        forget_frame(self.frame_path)
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+
+def dashboard(clock=0, person=None):
+    """A static 100x100 thumbnail with a clock in the top right and optionally a person walking by."""
+    frame = np.full((100, 100), 60, dtype=np.uint8)
+    frame[2:8, 90:98] = 100 + clock * 40  # the clock digits change every capture
+    if person is not None:
+        frame[50:80, person:person + 12] = 220
+    return frame
+
+
+class TestGridMotion(unittest.TestCase):
+    def test_parse_motion_mask(self):
+        self.assertEqual(parse_motion_mask("90,0,100,8; +0, 20, 100,100\n"),
+                         [(False, (0.9, 0.0, 1.0, 0.08)), (True, (0.0, 0.2, 1.0, 1.0))])
+        self.assertEqual(parse_motion_mask(""), [])
+        for bad in ["90,0,100", "50,0,40,10", "0,0,120,10", "clock"]:
+            with self.assertRaises(ValueError):
+                parse_motion_mask(bad)
+
+    def test_mask(self):
+        self.assertIsNone(motion_mask(""))
+        mask = motion_mask("90,0,100,8")
+        self.assertFalse(mask[:8, 90:].any())
+        self.assertTrue(mask[8:, :].all() and mask[:, :90].all())
+        watched = motion_mask("+0,50,100,100;0,90,100,100")
+        self.assertEqual(watched.sum(), 100 * 40)
+
+    def test_clock_is_ignored_once_masked(self):
+        previous, current = dashboard(clock=0), dashboard(clock=1)
+        fraction, regions = grid_motion(previous, current)
+        self.assertGreater(fraction, 0)
+        self.assertEqual(len(regions), 1)
+        self.assertEqual(grid_motion(previous, current, motion_mask("90,0,100,10")), (0.0, []))
+
+    def test_regions(self):
+        fraction, regions = grid_motion(dashboard(), dashboard(person=20), motion_mask("90,0,100,10"))
+        self.assertAlmostEqual(fraction, 6 / 99)  # 2x3 tiles of the 99 watched ones
+        self.assertEqual(regions, [{"box": (0.2, 0.5, 0.4, 0.8), "tiles": 6}])
+        # two people far apart are two regions
+        current = dashboard(person=5)
+        current[10:30, 70:85] = 220
+        self.assertEqual(len(grid_motion(dashboard(), current)[1]), 2)
+
+    def test_tile_changes_for_a_stack_of_cameras(self):
+        previous = np.stack([dashboard(), dashboard(), dashboard()])
+        current = np.stack([dashboard(), dashboard(person=20), dashboard(clock=1)])
+        changes, watched = tile_changes(previous, current)
+        self.assertEqual(changes.shape, (3, 10, 10))
+        self.assertTrue((watched == 1).all())
+        self.assertEqual([int((c >= 12).sum()) for c in changes], [0, 6, 1])
+
+    def test_measure_motion_uses_the_template(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            previous_path = os.path.join(tmpdirname, "cam_20240101120000.png")
+            save_thumbnail(previous_path, dashboard())
+            current = dashboard(clock=1)
+            detect.last_thumbnails.clear()
+            score, regions = measure_motion({}, previous_path, current)
+            self.assertGreater(score, 0)
+            self.assertEqual(measure_motion({"motion_mask": "88,0,100,10"}, previous_path, current), (0.0, []))
+            score, regions = measure_motion({"motion_detector": "grid"}, previous_path, dashboard(person=20))
+            self.assertEqual(len(regions), 1)
+            self.assertEqual(measure_motion({}, os.path.join(tmpdirname, "missing.png"), current), (None, []))
+        detect.last_thumbnails.clear()
+
+    def test_regions_are_outlined(self):
+        image = Image.new("RGB", (400, 200), "black")
+        draw_motion_and_caption(image, motion=True, regions=[{"box": (0.25, 0.5, 0.5, 1.0), "tiles": 1}])
+        self.assertEqual(image.getpixel((100, 120)), (255, 64, 64))
+        self.assertEqual(image.getpixel((150, 150)), (0, 0, 0))
+
+    @patch("app.utils.template_manager.init_db")
+    @patch("app.utils.template_manager.SessionLocal")
+    def test_template_settings_are_validated(self, mock_session, mock_init_db):
+        template = Template(name="cam", motion_detector="", motion_mask="")
+        mock_session.return_value.query.return_value.filter_by.return_value.first.return_value = template
+        self.assertFalse(TemplateManager().save_template("cam", {"motion_mask": "top right"}))
+        self.assertFalse(TemplateManager().save_template("cam", {"motion_detector": "optical"}))
+        TemplateManager().save_template("cam", {"motion_detector": "grid", "motion_mask": " 90,0,100,8 "})
+        self.assertEqual((template.motion_detector, template.motion_mask), ("grid", "90,0,100,8"))
+
+
+if __name__ == "__main__":
+    unittest.main()
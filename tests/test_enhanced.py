@@ -0,0 +1,50 @@
+# tests/test_enhanced.py
+
+import unittest
+import os
+import sys
+
+import yt_dlp
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.screenshots import is_enhanced, get_enhanced_extractors
+
+
+def reference_is_enhanced(url):
+    """The original implementation: instantiate every extractor on every call."""
+    for e in yt_dlp.extractor.gen_extractors():
+        if e.suitable(url) and e.IE_NAME != "generic":
+            return True
+    return False
+
+
+class TestIsEnhanced(unittest.TestCase):
+    URLS = [
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "https://www.twitch.tv/somechannel",
+        "https://vimeo.com/76979871",
+        "http://192.168.1.20/cgi-bin/snapshot.cgi",
+        "rtsp://192.168.1.20:554/Streaming/Channels/101",
+        "https://example.com/",
+        "https://example.com/live/index.m3u8",
+    ]
+
+    def test_matches_reference(self):
+        is_enhanced.cache_clear()
+        for url in self.URLS:
+            self.assertEqual(is_enhanced(url), reference_is_enhanced(url), url)
+
+    def test_generic_excluded(self):
+        self.assertNotIn("generic", [e.IE_NAME for e in get_enhanced_extractors()])
+        self.assertIs(get_enhanced_extractors(), get_enhanced_extractors())
+
+    def test_verdict_is_memoized(self):
+        is_enhanced.cache_clear()
+        is_enhanced("https://example.com/")
+        is_enhanced("https://example.com/")
+        self.assertEqual(is_enhanced.cache_info().hits, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+# tests/test_frame_hashes.py
+
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.utils.frame_hashes as frame_hashes
+from app.utils.frame_hashes import (
+    HASH_FILE,
+    FrameHashes,
+    dedupe_frames,
+    dhash,
+    duplicate_mask,
+    get_frame_hashes,
+    hamming,
+    popcount,
+    prune_frame_hashes,
+    record_frame_hash,
+    similar_frames,
+)
+from app.utils.frames import forget_frame, get_frame_index, write_frame
+from app.utils.retention_policy import get_files_sorted_by_creation_time
+
+
+def scene(seed, size=(160, 90)):
+    """A smooth random scene: blurred noise, so its dHash is stable under small changes."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(6, 8), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+class TestHashing(unittest.TestCase):
+    def test_dhash_is_stable_under_rescaling_and_noise(self):
+        image = scene(1)
+        value = dhash(image)
+        self.assertLess(value, 1 << 64)
+        self.assertEqual(dhash(np.asarray(image)), value)
+        noisy = np.clip(np.asarray(image, dtype=np.int16) + np.random.default_rng(0).integers(-3, 4, (90, 160)), 0, 255)
+        self.assertLessEqual(int(hamming([dhash(noisy)], value)[0]), 6)
+        self.assertLessEqual(int(hamming([dhash(image.resize((100, 100)))], value)[0]), 6)
+        self.assertGreater(int(hamming([dhash(scene(2))], value)[0]), 10)
+
+    def test_popcount_fallback_matches(self):
+        values = np.array([0, 1, 0xFF, 0xFFFFFFFFFFFFFFFF, 0x8000000000000001, 12345678901234567], dtype=np.uint64)
+        expected = [bin(int(v)).count("1") for v in values]
+        self.assertEqual(popcount(values).tolist(), expected)
+        with patch.object(frame_hashes, "BITWISE_COUNT", None):
+            self.assertEqual(popcount(values).tolist(), expected)
+
+    def test_duplicate_mask(self):
+        hashes = [0b0, 0b1, 0xFFFF, 0xFFFF, 0b1]
+        self.assertEqual(duplicate_mask(hashes, 1).tolist(), [False, True, False, True, False])
+        self.assertEqual(duplicate_mask([], 1).tolist(), [])
+
+
+class TestFrameHashes(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmpdir.name, "cam")
+        os.makedirs(self.directory)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+        frame_hashes.frame_hashes.clear()
+
+    def frame(self, second, value):
+        path = os.path.join(self.directory, f"cam_2024010112000{second}.png")
+        write_frame(Image.new("RGB", (8, 8)), path)
+        record_frame_hash(path, value)
+        return path
+
+    def test_similar(self):
+        self.frame(0, 0x0F)
+        self.frame(1, 0xFFFF0000)
+        self.frame(2, 0x0E)
+        self.frame(3, 0x0F)
+        hashes = get_frame_hashes(self.directory)
+        self.assertEqual(hashes.hash_of("cam_20240101120001.png"), 0xFFFF0000)
+        self.assertIsNone(hashes.hash_of("missing.png"))
+        self.assertEqual(hashes.similar(0x0F, max_distance=2), [
+            ("cam_20240101120003.png", 0), ("cam_20240101120000.png", 0), ("cam_20240101120002.png", 1)])
+        self.assertEqual(hashes.similar(0x0F, max_distance=2, limit=1), [("cam_20240101120003.png", 0)])
+
+    def test_other_processes_appends_are_picked_up(self):
+        self.frame(0, 1)
+        hashes = get_frame_hashes(self.directory)
+        with open(os.path.join(self.directory, HASH_FILE), "a") as f:
+            f.write("cam_20240101120001.png 0000000000000003\ncam_2024010112")  # second line half written
+        self.assertEqual(get_frame_hashes(self.directory).filenames, ["cam_20240101120000.png", "cam_20240101120001.png"])
+        with open(os.path.join(self.directory, HASH_FILE), "a") as f:
+            f.write("0002.png 0000000000000007\n")
+        self.assertEqual(hashes.refresh().hash_of("cam_20240101120002.png"), 7)
+        # a fresh reader sees the same thing
+        self.assertEqual(FrameHashes(self.directory).refresh().hashes.tolist(), [1, 3, 7])
+
+    def test_recording_does_not_force_an_index_rebuild(self):
+        index = get_frame_index(self.directory)
+        self.frame(0, 1)
+        with patch.object(index, "rebuild") as mock_rebuild:
+            get_frame_index(self.directory)
+        mock_rebuild.assert_not_called()
+        self.assertEqual(index.latest()["dhash"], 1)
+
+    def test_similar_frames_across_cameras(self):
+        self.frame(0, 0x0F)
+        other = os.path.join(self.tmpdir.name, "other")
+        os.makedirs(other)
+        record_frame_hash(os.path.join(other, "other_20240101120005.png"), 0x0B)
+        with patch.object(frame_hashes, "SCREENSHOT_DIRECTORY", self.tmpdir.name):
+            self.assertEqual(similar_frames(0x0F, max_distance=1), [
+                ("cam", "cam_20240101120000.png", 0), ("other", "other_20240101120005.png", 1)])
+            self.assertEqual(similar_frames(0x0F, ["other"], max_distance=1), [
+                ("other", "other_20240101120005.png", 1)])
+
+    def test_dedupe_frames(self):
+        paths = [self.frame(0, 0x0F), self.frame(1, 0x0F), self.frame(2, 0xF0), self.frame(3, 0xF1)]
+        unhashed = os.path.join(self.directory, "cam_20240101120004.png")
+        self.assertEqual(dedupe_frames(self.directory, paths + [unhashed], max_distance=1),
+                         [paths[0], paths[2], unhashed])
+
+    def test_prune_and_retention(self):
+        paths = [self.frame(i, i) for i in range(3)]
+        forget_frame(paths[0])
+        # the hash index and sidecars are never retention candidates themselves
+        self.assertEqual(get_files_sorted_by_creation_time(self.directory), paths[1:])
+        self.assertEqual(prune_frame_hashes(self.directory), 1)
+        self.assertEqual(prune_frame_hashes(self.directory), 0)
+        hashes = get_frame_hashes(self.directory)
+        self.assertEqual(hashes.filenames, [os.path.basename(p) for p in paths[1:]])
+        self.assertIsNone(hashes.hash_of(os.path.basename(paths[0])))
+        self.frame(5, 5)
+        self.assertEqual(FrameHashes(self.directory).refresh().hashes.tolist(), [1, 2, 5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,304 @@
+# tests/test_frames.py
+
+import unittest
+from unittest.mock import patch
+import datetime
+import multiprocessing
+import os
+import sys
+import tempfile
+
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.config as config
+import app.utils.frames as frames
+from app.utils.frames import (
+    forget_frame,
+    frame_extension,
+    frame_mimetype,
+    frame_time,
+    get_frame_index,
+    label_background,
+    link_frame,
+    list_frames,
+    load_font,
+    write_frame,
+)
+from app.utils.scheduling import draw_motion_and_caption, find_closest_image, motion_overlay
+from app.utils.retention_policy import delete_old_files
+from app.utils.screenshots import draw_timestamp, finish_frame
+
+
+class TestWriteFrame(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.temp_dir.name, "cam_20240101000000.png")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_replaces_atomically(self):
+        Image.new("RGB", (16, 9), "white").save(self.output_path)
+        write_frame(Image.new("RGB", (32, 18), "black"), self.output_path)
+        self.assertEqual(Image.open(self.output_path).size, (32, 18))
+        self.assertEqual(os.listdir(self.temp_dir.name), ["cam_20240101000000.png"])
+
+    def test_failed_encode_leaves_nothing_behind(self):
+        with self.assertRaises(Exception):
+            write_frame(Image.new("RGB", (16, 9)), self.output_path, format="NOPE")
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+    def test_format_follows_extension(self):
+        for extension, pil_format in [("png", "PNG"), ("webp", "WEBP"), ("jpg", "JPEG")]:
+            path = os.path.join(self.temp_dir.name, "cam_20240101000000." + extension)
+            write_frame(Image.new("RGB", (32, 18), "navy"), path)
+            with Image.open(path) as image:
+                self.assertEqual(image.format, pil_format)
+
+    def test_webp_is_lossless(self):
+        image = Image.effect_noise((64, 36), 64).convert("RGB")
+        path = os.path.join(self.temp_dir.name, "cam.webp")
+        write_frame(image, path)
+        with Image.open(path) as stored:
+            self.assertEqual(stored.convert("RGB").tobytes(), image.tobytes())
+
+
+class TestFrameLookup(unittest.TestCase):
+    def test_frame_extension(self):
+        self.assertEqual(frame_extension({"frame_format": "webp"}), "webp")
+        self.assertEqual(frame_extension({"frame_format": "JPEG"}), "jpg")
+        self.assertEqual(frame_extension({"frame_format": "tiff"}), "png")
+        with patch("app.config.FRAME_FORMAT", "jpg"):
+            self.assertEqual(frame_extension({"frame_format": ""}), "jpg")
+            self.assertEqual(frame_extension(), "jpg")
+
+    def test_list_frames_mixes_formats_and_skips_links(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            for i, filename in enumerate(["cam_20240101000000.png", "cam_20240101000100.webp",
+                                          "cam_20240101000200.jpg", "cam_20240101000300.tmp.png",
+                                          ".cam_20240101000400.png.1.tmp", "notes.txt"]):
+                path = os.path.join(tmpdirname, filename)
+                open(path, "wb").close()
+                os.utime(path, (1700000000 + i, 1700000000 + i))
+            os.symlink("cam_20240101000200.jpg", os.path.join(tmpdirname, "latest_camera.png"))
+
+            self.assertEqual(list_frames(tmpdirname), ["cam_20240101000000.png", "cam_20240101000100.webp",
+                                                       "cam_20240101000200.jpg"])
+            self.assertEqual(frame_mimetype(os.path.join(tmpdirname, "latest_camera.png")), "image/jpeg")
+        self.assertEqual(list_frames(os.path.join(tmpdirname, "missing")), [])
+
+
+class TestFinishFrame(unittest.TestCase):
+    def test_single_encode_with_overlay(self):
+        seen = []
+
+        def overlay(image):
+            seen.append(image.size)
+            return draw_motion_and_caption(image, caption="a cat", motion=True)
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            output_path = os.path.join(tmpdirname, "cam.png")
+            with patch("app.utils.screenshots.write_frame", wraps=write_frame) as mock_write:
+                self.assertTrue(finish_frame(Image.new("RGB", (640, 360), "navy"), output_path, "cam",
+                                             crop=False, overlay=overlay))
+            self.assertEqual(mock_write.call_count, 1)
+            self.assertEqual(seen, [(640, 360)])
+            self.assertTrue(os.path.exists(output_path))
+
+    def test_invert_keeps_the_stamp(self):
+        image = draw_timestamp(Image.new("RGB", (640, 360), "black"), "cam", invert=True)
+        # inverted to white, with the dark label box and its text drawn on top
+        self.assertEqual(image.getpixel((600, 300)), (255, 255, 255))
+        self.assertNotEqual(image.getpixel((5, 10)), (255, 255, 255))
+
+
+class TestOverlayAssets(unittest.TestCase):
+    def test_fonts_are_loaded_once_per_size(self):
+        load_font.cache_clear()
+        probes = []
+
+        def missing_font(font, size, *args, **kwargs):
+            probes.append((font, size))
+            raise IOError(font)
+
+        with patch("app.utils.frames.ImageFont.truetype", side_effect=missing_font), \
+                patch("app.utils.frames.ImageFont.load_default") as mock_default:
+            for _ in range(10):
+                load_font(18)
+            load_font(24)
+        # each size probes the fallback list once
+        self.assertEqual(len(probes), 4)
+        self.assertEqual(mock_default.call_count, 2)
+        load_font.cache_clear()
+
+    def test_label_backgrounds_are_shared(self):
+        self.assertIs(label_background(120, 18), label_background(120, 18))
+        self.assertEqual(label_background(120, 18).size, (140, 28))
+
+    def test_tiny_frames_skip_the_overlay(self):
+        image = Image.new("RGB", (40, 20), "white")
+        self.assertIs(draw_motion_and_caption(image, caption="a cat", motion=True), image)
+
+
+class TestMotionOverlay(unittest.TestCase):
+    def test_motion_against_previous_frame(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            previous_path = os.path.join(tmpdirname, "previous.png")
+            Image.new("RGB", (320, 180), "black").save(previous_path)
+            state = {}
+            template = {"motion": 0.1, "last_caption": "", "last_motion_caption": "a quiet street"}
+            overlay = motion_overlay(template, previous_path, state)
+            image = overlay(Image.new("RGB", (320, 180), "white"))
+        self.assertTrue(state["lsum"])
+        self.assertEqual(state["clean"].getpixel((300, 10)), (255, 255, 255))
+        self.assertNotEqual(image.tobytes(), state["clean"].tobytes())
+
+    def test_captioned_default_template_is_left_alone(self):
+        state = {}
+        overlay = motion_overlay({"motion": 1, "last_caption": "a cat"}, None, state)
+        image = Image.new("RGB", (320, 180), "white")
+        self.assertIs(overlay(image), image)
+        self.assertNotIn("lsum", state)
+
+
+class TestFrameIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.image = Image.new("RGB", (16, 9), "white")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def frame(self, stamp, ext="png"):
+        return write_frame(self.image, os.path.join(self.directory, f"cam_{stamp}.{ext}"))
+
+    def test_sorted_by_name_time_and_skips_links(self):
+        for stamp in ["20240101120500", "20240101120000", "20240101121000"]:
+            self.frame(stamp)
+        link_frame("cam_20240101121000.png", os.path.join(self.directory, "latest_camera.png"))
+        index = get_frame_index(self.directory)
+        self.assertEqual(index.filenames(), ["cam_20240101120000.png", "cam_20240101120500.png",
+                                             "cam_20240101121000.png"])
+        self.assertEqual(index.latest()["filename"], "cam_20240101121000.png")
+        self.assertEqual(index.previous()["filename"], "cam_20240101120500.png")
+        self.assertEqual(index.previous("cam_20240101120500.png")["filename"], "cam_20240101120000.png")
+        self.assertIsNone(index.previous("cam_20240101120000.png"))
+
+    def test_writes_and_deletes_keep_the_index_current(self):
+        index = get_frame_index(self.directory)
+        self.frame("20240101120000")
+        self.frame("20240101120500", ext="webp")
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.latest()["filename"], "cam_20240101120500.webp")
+        forget_frame(os.path.join(self.directory, "cam_20240101120500.webp"))
+        self.assertEqual(index.latest()["filename"], "cam_20240101120000.png")
+        with patch.object(index, "rebuild") as mock_rebuild:
+            get_frame_index(self.directory)
+        mock_rebuild.assert_not_called()
+
+    def test_other_processes_are_picked_up(self):
+        index = get_frame_index(self.directory)
+        self.frame("20240101120000")
+        # written behind the index's back, as another worker process would
+        self.image.save(os.path.join(self.directory, "cam_20240101130000.png"))
+        stamp = os.path.join(self.directory, frames.FRAMES_STAMP)
+        os.utime(stamp, ns=(0, os.stat(stamp).st_mtime_ns + 1000))
+        self.assertEqual(get_frame_index(self.directory).latest()["filename"], "cam_20240101130000.png")
+        os.remove(os.path.join(self.directory, "cam_20240101130000.png"))
+        # a vanished frame is dropped at lookup even before the next rebuild
+        self.assertEqual(index.latest()["filename"], "cam_20240101120000.png")
+
+    def test_other_files_do_not_rebuild(self):
+        index = get_frame_index(self.directory)
+        path = self.frame("20240101120000")
+        with patch.object(index, "rebuild") as mock_rebuild:
+            self.frame("20240101120500")
+            # sidecars, hash and validator files, symlinks: none of them are frames
+            for filename in [".cam_20240101120000.png.npy", ".hashes", ".validators"]:
+                with open(os.path.join(self.directory, filename), "w") as f:
+                    f.write("x")
+            link_frame(os.path.basename(path), os.path.join(self.directory, "latest_camera.png"))
+            os.utime(self.directory, ns=(0, os.stat(self.directory).st_mtime_ns + 1000))
+            self.assertEqual(get_frame_index(self.directory).latest()["filename"], "cam_20240101120500.png")
+        mock_rebuild.assert_not_called()
+
+    def test_closest(self):
+        for stamp in ["20240101120000", "20240101120500", "20240101121000"]:
+            self.frame(stamp)
+        index = get_frame_index(self.directory)
+        when = datetime.datetime(2024, 1, 1, 12, 9, 0)
+        self.assertEqual(index.closest(when)["filename"], "cam_20240101120500.png")
+        self.assertEqual(index.closest(when, before=False)["filename"], "cam_20240101121000.png")
+        self.assertIsNone(index.closest(datetime.datetime(2023, 1, 1)))
+        self.assertEqual(find_closest_image(self.directory, when), "cam_20240101120500.png")
+
+
+class TestRepeatFrame(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        self.overlays = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def capture(self, stamp, color="navy"):
+        path = os.path.join(self.directory, f"cam_{stamp}.png")
+        finish_frame(Image.new("RGB", (64, 36), color), path, "cam", crop=False,
+                     overlay=lambda image: self.overlays.append(stamp) or image)
+        return path
+
+    def test_unchanged_source_is_linked(self):
+        index = get_frame_index(self.directory)
+        first = self.capture("20240101120000")
+        os.utime(first, (0, 0))
+        with patch("app.utils.screenshots.write_frame", wraps=write_frame) as mock_write:
+            second = self.capture("20240101120100")
+            third = self.capture("20240101120200")
+        mock_write.assert_not_called()
+        self.assertEqual(self.overlays, ["20240101120000"])
+        self.assertTrue(os.path.samefile(first, third))
+        self.assertEqual(os.stat(first).st_nlink, 3)
+        self.assertGreater(os.path.getmtime(third), 0)  # last_screenshot_time follows the newest capture
+        self.assertEqual(index.latest(), {"filename": "cam_20240101120200.png", "size": os.path.getsize(first),
+                                          "repeat_of": "cam_20240101120100.png"})
+        self.assertEqual(list_frames(self.directory), [os.path.basename(p) for p in (first, second, third)])
+        # a new picture is encoded and stored as usual
+        changed = self.capture("20240101120300", color="red")
+        self.assertFalse(os.path.samefile(changed, third))
+        self.assertNotIn("repeat_of", index.latest())
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_repeats_are_seen_across_processes(self):
+        # another capture worker stores the first frame
+        child = multiprocessing.get_context("fork").Process(target=self.capture, args=("20240101120000",))
+        child.start()
+        child.join()
+        first = os.path.join(self.directory, "cam_20240101120000.png")
+        self.assertTrue(os.path.exists(first))
+        second = self.capture("20240101120100")
+        self.assertTrue(os.path.samefile(first, second))
+        self.assertEqual(self.overlays, [])  # this process never drew a frame
+
+    def test_falls_back_to_writing(self):
+        first = self.capture("20240101120000")
+        forget_frame(first)
+        self.assertEqual(os.stat(self.capture("20240101120100")).st_nlink, 1)
+        with patch.object(config, "SKIP_UNCHANGED_FRAMES", False):
+            self.assertEqual(os.stat(self.capture("20240101120200")).st_nlink, 1)
+        self.assertEqual(len(self.overlays), 3)
+
+    def test_links_are_counted_once_and_keep_their_capture_time(self):
+        paths = [self.capture(f"2024010112000{i}") for i in range(4)]
+        size = os.path.getsize(paths[0])
+        self.assertEqual(frame_time(paths[1]), datetime.datetime(2024, 1, 1, 12, 0, 1, tzinfo=datetime.timezone.utc).timestamp())
+        # four names, one file: it fits under a limit of twice its size
+        delete_old_files(paths, max_age=36500, max_size=size * 2, minimum=0)
+        self.assertTrue(all(os.path.exists(p) for p in paths))
+
+
+if __name__ == "__main__":
+    unittest.main()
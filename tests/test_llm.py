@@ -15,9 +15,9 @@ from app.utils.llm import summarize
 
 class TestLLM(unittest.TestCase):
     @patch("app.utils.llm.requests.post")
-    @patch("app.utils.llm.CHATGPT_KEY", "mock_api_key")
-    @patch("app.utils.llm.LLM_MODEL_VERSION", "mock_model_version")
-    @patch("app.utils.llm.LLM_SUMMARY_PROMPT", "Mock summary prompt")
+    @patch("app.config.CHATGPT_KEY", "mock_api_key")
+    @patch("app.config.LLM_MODEL_VERSION", "mock_model_version")
+    @patch("app.config.LLM_SUMMARY_PROMPT", "Mock summary prompt")
     def test_summarize_success(self, mock_post):
         # Mock the successful API response
         mock_response = MagicMock()
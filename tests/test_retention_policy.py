@@ -4,10 +4,11 @@ import unittest
 import tempfile
 import os
 import sys
+import time
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.utils.retention_policy import delete_old_files
+from app.utils.retention_policy import delete_old_files, get_files_sorted_by_creation_time
 
 class TestRetentionPolicy(unittest.TestCase):
 
@@ -28,6 +29,25 @@ class TestRetentionPolicy(unittest.TestCase):
             remaining_files = os.listdir(temp_dir)
             self.assertEqual(len(remaining_files), 2)
 
+    def test_repeated_frames_age_by_capture_time(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            first = os.path.join(temp_dir, "cam_20200101000000.png")
+            with open(first, 'wb') as f:
+                f.write(b"frame")
+            # a repeat links the old frame in again, which freshens the ctime of both names
+            repeat = os.path.join(temp_dir, "cam_20200101000100.png")
+            os.link(first, repeat)
+            recent = time.strftime("cam_%Y%m%d%H%M%S.png", time.gmtime())
+            with open(os.path.join(temp_dir, recent), 'wb') as f:
+                f.write(b"frame")
+
+            files = get_files_sorted_by_creation_time(temp_dir)
+            self.assertEqual([os.path.basename(f) for f in files],
+                             ["cam_20200101000000.png", "cam_20200101000100.png", recent])
+            delete_old_files(files, max_age=1, max_size=10 ** 9, minimum=0)
+
+            self.assertEqual(os.listdir(temp_dir), [recent])
+
 if __name__ == '__main__':
     unittest.main()
 
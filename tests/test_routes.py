@@ -26,7 +26,7 @@ class TestRoutes(unittest.TestCase):
         #self.assertEqual(response.json, {"status": "healthy"})
 
     @patch("app.routes.check_password_hash")
-    @patch("app.routes.USER_NAME", "testuser")
+    @patch("app.config.USER_NAME", "testuser")
     def test_login_success(self, mock_check_password):
         login_attempts = {} # reset
         mock_check_password.return_value = True
@@ -38,7 +38,7 @@ class TestRoutes(unittest.TestCase):
         #self.assertIn("/", response.headers["Location"])
 
     @patch("app.routes.check_password_hash")
-    @patch("app.routes.USER_NAME", "testuser")
+    @patch("app.config.USER_NAME", "testuser")
     def test_login_failure(self, mock_check_password):
         login_attempts = {} # reset
         mock_check_password.return_value = False
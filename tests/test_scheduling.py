@@ -5,10 +5,12 @@ from unittest.mock import patch, MagicMock
 import sys
 import os
 import logging
+import tempfile
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.utils.scheduling import scheduler, schedule_crawlers
+import app.config as config
+from app.utils.scheduling import comparison_images, object_filter_score, scheduler, schedule_crawlers
 
 class TestScheduler(unittest.TestCase):
 
@@ -123,6 +125,48 @@ class TestScheduler(unittest.TestCase):
             mock_add_job.assert_not_called()
     '''
 
+
+class TestObjectFilter(unittest.TestCase):
+    @patch('app.utils.scheduling.clip_scores')
+    def test_scored_against_the_background(self, mock_scores):
+        mock_scores.return_value = [0.1, 0.2, 0.7]
+        self.assertAlmostEqual(object_filter_score('frame.png', 'person, car'), 0.3)
+        texts = mock_scores.call_args[0][1]
+        self.assertEqual(texts[:2], ['person', 'car'])
+        self.assertEqual(len(texts), 3)  # never a single prompt, whose softmax is always 1.0
+
+    @patch('app.utils.scheduling.clip_scores', return_value=None)
+    def test_no_score(self, mock_scores):
+        self.assertIsNone(object_filter_score('frame.png', 'person'))
+        self.assertIsNone(object_filter_score('frame.png', ' , '))
+
+
+class TestComparisonImages(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+        for name in ['cam_20240101120000.png', 'cam_20240101120500.png']:
+            open(os.path.join(self.directory, name), 'wb').close()
+        self.frame = os.path.join(self.directory, 'cam_20240101120500.png')
+        self.template = {'last_caption_time': '2024-01-01 12:01:00'}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_only_the_new_frame_by_default(self):
+        self.assertEqual(comparison_images(self.template, self.directory, self.frame), [self.frame])
+
+    def test_reference_and_caption_frame_when_enabled(self):
+        reference = os.path.join(self.directory, 'reference.png')
+        open(reference, 'wb').close()
+        with patch.object(config, 'LLM_COMPARE_CAPTION_FRAME', True):
+            self.assertEqual(
+                comparison_images(self.template, self.directory, self.frame),
+                [reference, os.path.join(self.directory, 'cam_20240101120000.png'), self.frame],
+            )
+            self.assertEqual(comparison_images({}, self.directory, self.frame), [reference, self.frame])
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,140 @@
+# tests/test_settings.py
+
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.config as config
+import app.routes as routes
+import app.utils.frame_hashes as frame_hashes
+import app.utils.frames as frames
+import app.utils.scheduling as scheduling
+from app.config import get_setting, refresh_settings, reload_settings, settings_changed
+
+
+class TestSettings(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'test.db')}")
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE settings (id INTEGER PRIMARY KEY, name TEXT UNIQUE, value TEXT)"))
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+        self.changes = []
+        self.patches = [
+            patch.object(config, "SessionLocal", sessionmaker(bind=self.engine)),
+            patch.object(routes, "SessionLocal", sessionmaker(bind=self.engine)),
+            patch.object(config, "SETTINGS_VERSION_PATH", os.path.join(self.tmpdir.name, "test.db.settings")),
+            patch.object(config, "subscribers", config.subscribers + [self.changes.append]),
+            patch.object(routes, "restart_server"),
+        ]
+        for p in self.patches:
+            p.start()
+        self.addCleanup(self.restore)
+
+    def restore(self):
+        # back to the defaults everything was imported with
+        with self.engine.begin() as connection:
+            connection.execute(text("DELETE FROM settings"))
+        reload_settings()
+        for p in reversed(self.patches):
+            p.stop()
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def store(self, name, value):
+        with self.engine.begin() as connection:
+            connection.execute(text("INSERT OR REPLACE INTO settings (name, value) VALUES (:name, :value)"),
+                               {"name": name, "value": value})
+
+    def test_settings_are_read_with_one_query(self):
+        self.store("LANG", "de-DE")
+        self.store("PORT", "9000")
+        self.statements.clear()
+        with patch.object(config, "settings", {}), patch.object(config, "settings_loaded", False), \
+                patch.object(config, "setting_defaults", dict(config.setting_defaults)), \
+                patch.object(config, "settings_seen", config.settings_seen):
+            self.assertEqual(get_setting("LANG", "en-US"), "de-DE")
+            self.assertEqual(get_setting("PORT", 8082), "9000")
+            self.assertEqual(get_setting("NAME", "glimpser"), "glimpser")
+            self.assertEqual(get_setting("O'BRIEN", "quoted"), "quoted")
+        self.assertEqual(self.statements, ["SELECT name, value FROM settings"])
+
+    def test_reload_applies_changes_everywhere(self):
+        hashes = [0, 0b111]  # three bits apart
+        self.assertTrue(frame_hashes.duplicate_mask(hashes)[1])
+        frame = os.path.join(self.tmpdir.name, "cam_20240101000000.png")
+        frames.write_frame(Image.new("RGB", (16, 9)), frame)
+        frames.remember_content(frame, "digest")
+        self.assertTrue(frames.repeat_frame(os.path.join(self.tmpdir.name, "cam_20240101000100.png"), "digest"))
+        self.store("FRAME_HASH_DISTANCE", "2")
+        self.store("SKIP_UNCHANGED_FRAMES", "False")
+        self.store("CAPTURE_SLOTS_BROWSER", "5")
+        self.store("STATUS_FLUSH_INTERVAL", "1000")
+        changes = reload_settings()
+        self.assertEqual(changes, {"FRAME_HASH_DISTANCE": 2, "SKIP_UNCHANGED_FRAMES": False,
+                                   "CAPTURE_SLOTS_BROWSER": 5, "STATUS_FLUSH_INTERVAL": 1000})
+        self.assertEqual(self.changes, [changes])
+        self.assertEqual(config.FRAME_HASH_DISTANCE, 2)
+        self.assertIs(config.SKIP_UNCHANGED_FRAMES, False)
+        # code reading config.NAME follows at once
+        self.assertFalse(frame_hashes.duplicate_mask(hashes)[1])
+        self.assertFalse(frames.repeat_frame(os.path.join(self.tmpdir.name, "cam_20240101000200.png"), "digest"))
+        # and the subscribers applied the rest
+        self.assertEqual(scheduling.capture_scheduler.slots["browser"], 5)
+
+        self.assertEqual(reload_settings(), {})
+        with self.engine.begin() as connection:
+            connection.execute(text("DELETE FROM settings WHERE name = 'FRAME_HASH_DISTANCE'"))
+        self.assertEqual(reload_settings(), {"FRAME_HASH_DISTANCE": 6})  # back to its default
+        self.assertTrue(frame_hashes.duplicate_mask(hashes)[1])
+
+    def test_frames_are_saved_with_the_current_quality(self):
+        image = Image.effect_noise((64, 36), 64).convert("RGB")
+        path = os.path.join(self.tmpdir.name, "cam_20240101000000.jpg")
+        frames.write_frame(image, path)
+        size = os.path.getsize(path)
+        self.store("FRAME_QUALITY", "20")
+        self.store("PNG_COMPRESS_LEVEL", "0")
+        self.assertEqual(reload_settings(), {"FRAME_QUALITY": 20, "PNG_COMPRESS_LEVEL": 0})
+        frames.write_frame(image, path)
+        self.assertLess(os.path.getsize(path), size)
+        self.assertEqual(frames.frame_save_options("png"), {"compress_level": 0})
+
+    def test_invalid_values_are_ignored(self):
+        self.store("FRAME_HASH_DISTANCE", "many")
+        self.store("LANG", "fr-FR")
+        self.assertEqual(reload_settings(), {"LANG": "fr-FR"})
+        self.assertEqual(config.FRAME_HASH_DISTANCE, 6)
+
+    def test_changes_from_other_processes(self):
+        reload_settings()
+        self.statements.clear()
+        self.assertEqual(refresh_settings(), {})
+        self.assertEqual(self.statements, [])  # nothing changed: no query
+        self.store("LANG", "fr-FR")
+        with open(config.SETTINGS_VERSION_PATH, "a") as f:
+            f.write(".")  # what settings_changed() does in the other process
+        self.assertEqual(refresh_settings(), {"LANG": "fr-FR"})
+        self.assertEqual(refresh_settings(), {})
+
+    def test_update_setting_restarts_only_when_needed(self):
+        self.assertTrue(routes.update_setting("FRAME_HASH_DISTANCE", "4"))
+        self.assertEqual(config.FRAME_HASH_DISTANCE, 4)
+        routes.restart_server.assert_not_called()
+        self.assertTrue(routes.update_setting("PORT", "9000"))
+        routes.restart_server.assert_called_once()
+        self.assertEqual(settings_changed(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
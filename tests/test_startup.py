@@ -0,0 +1,70 @@
+# tests/test_startup.py
+
+import unittest
+from unittest.mock import patch
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils.lazy_import import lazy_module
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# seconds for "import app" in a fresh interpreter; it is well under one here, while
+# an eager torch or browser stack import alone would use most of this
+IMPORT_BUDGET = float(os.getenv("GLIMPSER_IMPORT_BUDGET", 3.0))
+
+HEAVY_MODULES = ["torch", "transformers", "selenium", "undetected_chromedriver", "webdriver_manager",
+                 "yt_dlp", "pdf2image", "pyvirtualdisplay", "skimage", "cv2"]
+
+IMPORT_APP = """
+import json, sys, time
+start = time.perf_counter()
+import app
+print(json.dumps({"import": time.perf_counter() - start, "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+class TestStartup(unittest.TestCase):
+    def import_app(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PYTHONPATH=ROOT, GLIMPSER_DATABASE_PATH=os.path.join(directory, "glimpser.db"))
+            results = []
+            for _ in range(2):  # the first run may still be compiling bytecode
+                output = subprocess.run([sys.executable, "-c", IMPORT_APP], cwd=directory, env=env,
+                                        capture_output=True, text=True, check=True, timeout=120).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+        return min(results, key=lambda result: result["import"])
+
+    def test_import_is_light(self):
+        result = self.import_app()
+        self.assertEqual(result["heavy"], [])
+        self.assertLess(result["import"], IMPORT_BUDGET)
+
+
+class TestLazyModule(unittest.TestCase):
+    def test_imported_on_first_use(self):
+        module = lazy_module("json.decoder")
+        self.assertIn("not loaded", repr(module))
+        self.assertIs(module.JSONDecodeError, sys.modules["json.decoder"].JSONDecodeError)
+        self.assertNotIn("not loaded", repr(module))
+
+    def test_patching_through_it_patches_the_module(self):
+        module = lazy_module("json.decoder")
+        with patch.object(module, "scanstring", "patched"):
+            self.assertEqual(sys.modules["json.decoder"].scanstring, "patched")
+            self.assertEqual(module.scanstring, "patched")
+        self.assertNotEqual(sys.modules["json.decoder"].scanstring, "patched")
+
+    def test_missing_module(self):
+        module = lazy_module("no_such_module_here")
+        with self.assertRaises(ImportError):
+            module.anything
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+# tests/test_stream_reader.py
+
+import unittest
+from unittest.mock import patch
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils import db
+from app.utils.template_manager import Template  # noqa: F401 (registers the templates table)
+from app.utils.stream_reader import StreamReader, read_bmp_frames, stream_input_args
+
+
+def bmp_bytes(color, size=(8, 4)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "BMP")
+    return buffer.getvalue()
+
+
+class FakeStreamReader(StreamReader):
+    """Runs a tiny python 'camera' instead of ffmpeg: writes count frames, then exits."""
+
+    def __init__(self, count=3, delay=0.01, **kwargs):
+        super().__init__("rtsp://camera.local/stream", **kwargs)
+        self.count = count
+        self.delay = delay
+
+    def command(self):
+        script = (
+            "import io, sys, time\n"
+            "from PIL import Image\n"
+            f"for i in range({self.count}):\n"
+            "    b = io.BytesIO(); Image.new('RGB', (8, 4), (i, i, i)).save(b, 'BMP')\n"
+            "    sys.stdout.buffer.write(b.getvalue()); sys.stdout.buffer.flush()\n"
+            f"    time.sleep({self.delay})\n"
+        )
+        return [sys.executable, "-c", script]
+
+
+class TestStreamReader(unittest.TestCase):
+    def test_read_bmp_frames(self):
+        frames = [bmp_bytes((255, 0, 0)), bmp_bytes((0, 255, 0), (3, 3)), bmp_bytes((0, 0, 255))]
+        pipe = io.BytesIO(b"".join(frames) + b"BM\x00")
+        self.assertEqual(list(read_bmp_frames(pipe)), frames)
+
+    def test_read_bmp_frames_truncated(self):
+        frame = bmp_bytes((1, 2, 3))
+        self.assertEqual(list(read_bmp_frames(io.BytesIO(frame[:-1]))), [])
+
+    def test_stream_input_args(self):
+        args = stream_input_args("rtsp://camera.local/stream")
+        self.assertEqual(args[:2], ["-rtsp_transport", "tcp"])
+        self.assertEqual(args[-2:], ["-i", "rtsp://camera.local/stream"])
+        self.assertIn("nokey", args)
+
+    def test_latest_frame(self):
+        reader = FakeStreamReader(count=100, delay=0.02).start()
+        try:
+            frame = reader.latest_frame(timeout=10)
+            self.assertIsNotNone(frame)
+            self.assertEqual(Image.open(io.BytesIO(frame)).size, (8, 4))
+        finally:
+            reader.stop()
+
+    def test_reconnects_after_disconnect(self):
+        reader = FakeStreamReader(count=1, delay=0).start()
+        try:
+            deadline = time.time() + 10
+            while reader.connects < 3 and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertGreaterEqual(reader.connects, 3)
+            self.assertTrue(reader.is_alive())
+        finally:
+            reader.stop()
+
+    def test_backoff_when_no_frames(self):
+        reader = FakeStreamReader(count=0, max_backoff=60).start()
+        try:
+            time.sleep(1.5)
+            # 1s then 2s of backoff: no more than two connects in 1.5s
+            self.assertLessEqual(reader.connects, 2)
+            self.assertIsNone(reader.latest_frame(timeout=0.1))
+        finally:
+            reader.stop()
+
+    def test_idle_shutdown(self):
+        reader = FakeStreamReader(count=1000, delay=0.01, idle_timeout=0.2).start()
+        reader.latest_frame(timeout=10)
+        reader._thread.join(5)
+        self.assertFalse(reader.is_alive())
+        self.assertIsNotNone(reader.process.poll())
+
+    def test_stalled_ffmpeg_is_killed_without_readers(self):
+        # one frame, then the "camera" hangs with the pipe open
+        reader = FakeStreamReader(count=1, delay=60, stall_timeout=0.3, max_backoff=1).start()
+        try:
+            deadline = time.time() + 10
+            while reader.stalls < 1 and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertGreaterEqual(reader.stalls, 1)
+            while reader.connects < 2 and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertGreaterEqual(reader.connects, 2)
+        finally:
+            reader.stop()
+
+    def test_idle_shutdown_while_blocked(self):
+        # never asked for a frame, and ffmpeg never writes one
+        reader = FakeStreamReader(idle_timeout=0.3)
+        reader.command = lambda: [sys.executable, "-c", "import time; time.sleep(60)"]
+        reader.start()
+        reader.last_request -= 1
+        reader._thread.join(5)
+        self.assertFalse(reader.is_alive())
+        self.assertIsNotNone(reader.process.poll())
+
+
+class TestMigrateDb(unittest.TestCase):
+    def test_adds_missing_columns(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            engine = create_engine(f"sqlite:///{os.path.join(tmpdir, 'old.db')}")
+            with engine.begin() as connection:
+                connection.execute(text(
+                    "CREATE TABLE templates (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL)"
+                ))
+                connection.execute(text("INSERT INTO templates (name) VALUES ('camera')"))
+
+            with patch.object(db, "engine", engine):
+                db.migrate_db()
+                db.migrate_db()  # idempotent
+
+            with engine.connect() as connection:
+                row = connection.execute(text(
+                    "SELECT persistent_stream, headless, frequency FROM templates"
+                )).fetchone()
+            self.assertEqual(tuple(row), (0, 1, 60))
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
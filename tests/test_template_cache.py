@@ -0,0 +1,223 @@
+# tests/test_template_cache.py
+
+import unittest
+from unittest.mock import MagicMock, patch
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import app.utils.db as db
+import app.utils.template_manager as template_manager
+from app.utils.db import Base
+from app.utils.template_manager import (
+    StatusWriter,
+    TemplateCache,
+    TemplateManager,
+    get_template,
+    get_templates,
+    queue_template_status,
+    save_template,
+    update_template_fields,
+)
+
+
+class TemplateDatabaseTest(unittest.TestCase):
+    """A real SQLite templates table in a temporary directory, with the statements it runs recorded."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'test.db')}")
+        Base.metadata.create_all(bind=self.engine)
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement.split()[0]))
+        self.version_path = os.path.join(self.tmpdir.name, "test.db.templates")
+        self.cache = TemplateCache(self.version_path)
+        self.writer = StatusWriter(interval=60)
+        self.writer.pid = os.getpid()  # flushed by hand unless a test starts the thread
+        self.patches = [
+            patch.object(template_manager, "status_writer", self.writer),
+            patch.object(template_manager, "SessionLocal", sessionmaker(bind=self.engine)),
+            patch.object(template_manager, "init_db"),
+            patch.object(template_manager, "template_cache", self.cache),
+            patch.object(template_manager, "SCREENSHOT_DIRECTORY", os.path.join(self.tmpdir.name, "screenshots")),
+            patch.object(template_manager, "VIDEO_DIRECTORY", os.path.join(self.tmpdir.name, "videos")),
+        ]
+        for p in self.patches:
+            p.start()
+        TemplateManager().save_template("cam", {
+            "name": "cam", "url": "http://cam.local/snapshot.jpg", "frequency": 30, "timeout": 10, "capture_method": "image",
+        })
+        self.statements.clear()
+
+    def tearDown(self):
+        for p in reversed(self.patches):
+            p.stop()
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+
+class TestTemplateCache(TemplateDatabaseTest):
+    def test_reads_are_served_from_memory(self):
+        template = get_template("cam")
+        self.assertEqual(template["frequency"], 30)
+        self.statements.clear()
+        for _ in range(4):
+            get_template("cam")
+        self.assertEqual(get_templates()["cam"]["url"], "http://cam.local/snapshot.jpg")
+        self.assertEqual(self.statements, [])
+        # callers get copies they can change freely
+        template["frequency"] = 1
+        get_templates()["cam"]["frequency"] = 2
+        self.assertEqual(get_template("cam")["frequency"], 30)
+        self.assertEqual(get_template("cam")["last_video_time"], "")  # not the value get_templates worked out
+
+    def test_hot_fields_are_one_narrow_update(self):
+        template = get_template("cam")
+        self.statements.clear()
+        template.update(last_caption="a quiet street", last_caption_time="2024-01-01 12:00:00", last_ret="*")
+        self.assertTrue(save_template("cam", template))
+        self.assertEqual(self.statements, ["UPDATE"])
+        self.assertEqual(get_template("cam")["last_caption"], "a quiet street")
+        self.assertEqual(self.statements, ["UPDATE"])
+        # and it is in the database
+        self.assertEqual(TemplateManager().get_template("cam")["last_caption_time"], "2024-01-01 12:00:00")
+
+    def test_update_template_fields(self):
+        self.assertTrue(update_template_fields("cam", last_motion_time="2024-01-01 12:00:00"))
+        self.assertFalse(update_template_fields("missing", last_motion_time="2024-01-01 12:00:00"))
+        with self.assertRaises(ValueError):
+            update_template_fields("cam", nonsense=1)
+        self.assertEqual(get_template("cam")["last_motion_time"], "2024-01-01 12:00:00")
+
+    def test_unchanged_save_writes_nothing(self):
+        get_template("cam")
+        self.statements.clear()
+        self.assertTrue(save_template("cam", get_template("cam")))
+        self.assertEqual(self.statements, [])
+
+    def test_other_fields_are_validated_and_reloaded(self):
+        template = get_template("cam")
+        template["url"] = "http://cam.local/other.jpg"
+        template["frequency"] = "15"
+        save_template("cam", template)
+        saved = get_template("cam")
+        self.assertEqual((saved["url"], saved["frequency"]), ("http://cam.local/other.jpg", 15))
+        # a full dict carries the capture plan along, so it is kept as before
+        self.assertEqual(saved["capture_method"], "image")
+        save_template("cam", {"url": "http://cam.local/third.jpg"})
+        self.assertEqual(get_template("cam")["capture_method"], "")
+
+    def test_writes_from_other_processes_are_seen(self):
+        get_template("cam")
+        other = TemplateCache(self.version_path)
+        with patch.object(template_manager, "template_cache", other):
+            update_template_fields("cam", last_caption="a cat")
+        self.assertEqual(get_template("cam")["last_caption"], "a cat")
+        self.statements.clear()
+        get_template("cam")
+        self.assertEqual(self.statements, [])
+
+    def test_new_and_deleted_templates(self):
+        get_templates()
+        save_template("door", {"url": "http://door.local/", "frequency": 30, "timeout": 10})
+        self.assertEqual(sorted(get_templates()), ["cam", "door"])
+        template_manager.delete_template("door")
+        self.assertEqual(get_template("door"), {})
+
+
+class TestStatusWriter(TemplateDatabaseTest):
+    def setUp(self):
+        super().setUp()
+        save_template("door", {"url": "http://door.local/", "frequency": 30, "timeout": 10})
+        self.commits = []
+        event.listen(self.engine, "commit", lambda conn: self.commits.append(1))
+        self.statements.clear()
+
+    def database(self, name):
+        return TemplateManager().get_template(name)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_worker_exit_flushes(self):
+        self.engine.dispose()  # no pooled sqlite connections across the fork
+        # a capture pool worker queues a status and exits long before the writer's interval
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as executor:
+            executor.submit(queue_template_status, "cam", last_caption="from a worker").result()
+        self.assertEqual(self.database("cam")["last_caption"], "from a worker")
+
+    def test_writes_are_coalesced_into_one_transaction(self):
+        for i in range(5):
+            queue_template_status("cam", last_motion_time=f"2024-01-01 12:00:0{i}")
+        queue_template_status("cam", last_caption="a cat")
+        queue_template_status("door", last_ret="sorry*")
+        self.assertEqual(self.statements, [])
+        self.assertEqual(self.writer.flush(), 2)
+        self.assertEqual(self.statements, ["UPDATE", "UPDATE"])
+        self.assertEqual(len(self.commits), 1)
+        cam = self.database("cam")
+        self.assertEqual((cam["last_motion_time"], cam["last_caption"]), ("2024-01-01 12:00:04", "a cat"))
+        self.assertEqual(self.database("door")["last_ret"], "sorry*")
+        self.assertEqual(self.writer.metrics["coalesced"], 4)
+        self.assertEqual(self.writer.flush(), 0)
+        with self.assertRaises(ValueError):
+            queue_template_status("cam", url="http://elsewhere/")
+
+    def test_queued_values_are_read_back_at_once(self):
+        queue_template_status("cam", last_caption="a cat")
+        self.assertEqual(get_template("cam")["last_caption"], "a cat")
+        # another process changes something: the reload keeps what is still queued here
+        with patch.object(template_manager, "template_cache", TemplateCache(self.version_path)), \
+                patch.object(template_manager, "status_writer", StatusWriter()):
+            update_template_fields("door", last_caption="a dog")
+            self.assertEqual(get_template("cam")["last_caption"], "")  # not flushed yet
+        self.assertEqual(get_templates()["door"]["last_caption"], "a dog")
+        self.assertEqual(get_templates()["cam"]["last_caption"], "a cat")
+        self.writer.flush()
+        with patch.object(template_manager, "template_cache", TemplateCache(self.version_path)):
+            self.assertEqual(get_template("cam")["last_caption"], "a cat")
+
+    def test_failed_flush_is_retried(self):
+        queue_template_status("cam", last_caption="a cat", last_motion_time="2024-01-01 12:00:00")
+        broken = MagicMock()
+        broken.return_value.commit.side_effect = Exception("database is locked")
+        with patch.object(template_manager, "SessionLocal", broken):
+            self.assertEqual(self.writer.flush(), 0)
+        queue_template_status("cam", last_caption="a dog")
+        self.writer.flush()
+        cam = self.database("cam")
+        self.assertEqual((cam["last_caption"], cam["last_motion_time"]), ("a dog", "2024-01-01 12:00:00"))
+        self.assertEqual(self.writer.metrics["failed"], 1)
+
+    def test_background_flush(self):
+        writer = StatusWriter(interval=0.01)
+        with patch.object(template_manager, "status_writer", writer):
+            queue_template_status("cam", last_caption="a cat")
+            deadline = time.time() + 5
+            while self.database("cam")["last_caption"] != "a cat" and time.time() < deadline:
+                time.sleep(0.01)
+        writer.pid = None  # stop its thread
+        self.assertEqual(self.database("cam")["last_caption"], "a cat")
+
+
+class TestInitDb(unittest.TestCase):
+    def test_schema_is_created_once(self):
+        with patch.object(db, "db_ready", False), \
+                patch.object(db.Base.metadata, "create_all") as mock_create_all, \
+                patch.object(db, "migrate_db") as mock_migrate:
+            for _ in range(3):
+                db.init_db()
+                TemplateManager()
+        mock_create_all.assert_called_once()
+        mock_migrate.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -135,6 +135,33 @@ class TestVideoArchiver(unittest.TestCase):
         # result is None because the files dont exist.  This test needs an update 
         #self.assertTrue(result)
 
+    @patch("app.utils.video_archiver.encode_frames")
+    def test_compile_to_video_flushes_old_format_frames(self, mock_encode):
+        camera_path = os.path.join(self.temp_dir, "cam")
+        video_path = os.path.join(self.temp_dir, "videos")
+        os.makedirs(camera_path)
+        names = ["cam_20240101120000.png", "cam_20240101120100.png", "cam_20240101120200.webp"]
+        for name in names:
+            with open(os.path.join(camera_path, name), "wb") as f:
+                f.write(b"frame")
+
+        def encode(frames, frame_ext, in_process_video, *args):
+            with open(in_process_video, "ab") as f:
+                f.write(frame_ext.encode())
+
+        mock_encode.side_effect = encode
+        compile_to_video(camera_path, video_path)
+
+        # after FRAME_FORMAT changed to webp, the png frames still make it into a segment
+        calls = [(call.args[1], [os.path.basename(f) for f in call.args[0]]) for call in mock_encode.call_args_list]
+        self.assertEqual(calls, [(".png", names[:2]), (".webp", names[2:])])
+        finals = [f for f in os.listdir(video_path) if f.startswith("final_")]
+        self.assertEqual(len(finals), 1)
+        with open(os.path.join(video_path, finals[0]), "rb") as f:
+            self.assertEqual(f.read(), b".png")
+        with open(os.path.join(video_path, "in_process.mp4"), "rb") as f:
+            self.assertEqual(f.read(), b".webp")
+
     @patch("app.utils.video_archiver.compile_to_video")
     def test_archive_screenshots(self, mock_compile_to_video):
         with patch("os.listdir", return_value=["camera1", "camera2"]), patch(
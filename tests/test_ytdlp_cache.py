@@ -0,0 +1,111 @@
+# tests/test_ytdlp_cache.py
+
+import unittest
+from unittest.mock import patch, MagicMock
+import os
+import io
+import subprocess
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.utils import screenshots
+from app.utils.screenshots import media_url_expiry, resolve_media_url, capture_frame_with_ytdlp
+
+
+def fake_ydl(*urls):
+    """A YoutubeDL stand-in whose extract_info returns each url in turn."""
+    ydl = MagicMock()
+    ydl.__enter__.return_value = ydl
+    ydl.extract_info.side_effect = [{"url": u} for u in urls]
+    return MagicMock(return_value=ydl), ydl
+
+
+class TestMediaUrlExpiry(unittest.TestCase):
+    def test_default_ttl(self):
+        now = time.time()
+        self.assertAlmostEqual(media_url_expiry("https://cdn.example.com/a.m3u8", ttl=600), now + 540, delta=2)
+
+    def test_youtube_expire_param(self):
+        expire = int(time.time()) + 300
+        url = f"https://rr1.googlevideo.com/videoplayback?expire={expire}&sig=abc"
+        self.assertEqual(media_url_expiry(url), expire - 60)
+
+    def test_youtube_manifest_path(self):
+        expire = int(time.time()) + 300
+        url = f"https://manifest.googlevideo.com/api/manifest/hls_playlist/expire/{expire}/ei/x/index.m3u8"
+        self.assertEqual(media_url_expiry(url), expire - 60)
+
+    def test_cloudfront_expires(self):
+        expire = int(time.time()) + 120
+        self.assertEqual(media_url_expiry(f"https://d1.cloudfront.net/v.m3u8?Expires={expire}&Signature=x"), expire - 60)
+
+    def test_s3_v4(self):
+        url = "https://bucket.s3.amazonaws.com/v.mp4?X-Amz-Date=20300101T000000Z&X-Amz-Expires=600"
+        self.assertEqual(media_url_expiry(url, ttl=10 ** 10), 1893456000 + 600 - 60)
+
+    def test_ttl_caps_long_expiry(self):
+        url = "https://rr1.googlevideo.com/videoplayback?expire=99999999999"
+        self.assertLess(media_url_expiry(url, ttl=60), time.time() + 61)
+
+
+class TestResolveMediaUrl(unittest.TestCase):
+    def setUp(self):
+        screenshots.resolved_urls.clear()
+
+    def test_resolved_once(self):
+        factory, ydl = fake_ydl("https://cdn.example.com/1.m3u8")
+        with patch("app.utils.screenshots.youtube_dl.YoutubeDL", factory):
+            self.assertEqual(resolve_media_url("https://youtu.be/x"), "https://cdn.example.com/1.m3u8")
+            self.assertEqual(resolve_media_url("https://youtu.be/x"), "https://cdn.example.com/1.m3u8")
+        self.assertEqual(ydl.extract_info.call_count, 1)
+
+    def test_expired_entry_resolves_again(self):
+        screenshots.resolved_urls["https://youtu.be/x"] = ("https://cdn.example.com/old.m3u8", time.time() - 1)
+        factory, ydl = fake_ydl("https://cdn.example.com/new.m3u8")
+        with patch("app.utils.screenshots.youtube_dl.YoutubeDL", factory):
+            self.assertEqual(resolve_media_url("https://youtu.be/x"), "https://cdn.example.com/new.m3u8")
+
+    def test_ffmpeg_failure_invalidates_cache(self):
+        screenshots.resolved_urls["https://youtu.be/x"] = ("https://cdn.example.com/old.m3u8", time.time() + 600)
+        factory, ydl = fake_ydl("https://cdn.example.com/new.m3u8")
+        frame = io.BytesIO()
+        Image.new("RGB", (320, 180), "navy").save(frame, "BMP")
+        results = [subprocess.CalledProcessError(1, "ffmpeg"), MagicMock(stdout=frame.getvalue())]
+        with tempfile.TemporaryDirectory() as tmpdirname, \
+                patch("app.utils.screenshots.youtube_dl.YoutubeDL", factory), \
+                patch("app.utils.screenshots.subprocess.run", side_effect=results) as mock_run:
+            output_path = os.path.join(tmpdirname, "out.png")
+            self.assertTrue(capture_frame_with_ytdlp("https://youtu.be/x", output_path))
+            self.assertEqual(Image.open(output_path).size, (320, 180))
+        self.assertIn("https://cdn.example.com/old.m3u8", mock_run.call_args_list[0][0][0])
+        self.assertIn("https://cdn.example.com/new.m3u8", mock_run.call_args_list[1][0][0])
+        self.assertEqual(screenshots.resolved_urls["https://youtu.be/x"][0], "https://cdn.example.com/new.m3u8")
+
+    def test_fresh_url_failure_is_not_retried(self):
+        factory, ydl = fake_ydl("https://cdn.example.com/1.m3u8", "https://cdn.example.com/2.m3u8")
+        with patch("app.utils.screenshots.youtube_dl.YoutubeDL", factory), \
+                patch("app.utils.screenshots.subprocess.run",
+                      side_effect=subprocess.CalledProcessError(1, "ffmpeg")) as mock_run:
+            self.assertFalse(capture_frame_with_ytdlp("https://youtu.be/x", "/tmp/out.png"))
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertNotIn("https://youtu.be/x", screenshots.resolved_urls)
+
+    def test_expired_entry_failure_is_not_retried(self):
+        # an expired entry is resolved afresh, so a failure on that url is final too
+        screenshots.resolved_urls["https://youtu.be/x"] = ("https://cdn.example.com/old.m3u8", time.time() - 1)
+        factory, ydl = fake_ydl("https://cdn.example.com/1.m3u8", "https://cdn.example.com/2.m3u8")
+        with patch("app.utils.screenshots.youtube_dl.YoutubeDL", factory), \
+                patch("app.utils.screenshots.subprocess.run",
+                      side_effect=subprocess.CalledProcessError(1, "ffmpeg")) as mock_run:
+            self.assertFalse(capture_frame_with_ytdlp("https://youtu.be/x", "/tmp/out.png"))
+        self.assertEqual(mock_run.call_count, 1)
+        self.assertEqual(ydl.extract_info.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()